@@ -1,18 +1,89 @@
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
+import sys
+import time
+import threading
+import importlib
+
+_STARTUP_T0 = time.perf_counter()  # --profile-startup 的计时起点
+
+class LazyModule:
+    """
+    延迟导入的模块：首次访问其属性时才真正加载（线程安全）
+    requests、psutil、webbrowser只在下载、采样、打开网页时才需要，不拖慢启动
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+                module = self._module
+        return getattr(module, attr)
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def __repr__(self):
+        return f"<LazyModule '{self._name}' ({'已加载' if self.loaded else '未加载'})>"
+
+_LAZY_MODULES = {}
+
+def lazy_import(name):
+    """已导入的模块直接返回，否则返回延迟导入的占位对象（同名模块共用一个）"""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return _LAZY_MODULES.setdefault(name, LazyModule(name))
+
+class StartupProfiler:
+    """--profile-startup：记录启动各阶段耗时（从模块开始导入起计时），启动完成后打印"""
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.last = _STARTUP_T0
+        self.marks = []
+
+    def mark(self, label):
+        """记录从上一个阶段结束到现在的耗时"""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.marks.append((label, now - self.last))
+        self.last = now
+
+    def report(self):
+        if not self.enabled or not self.marks:
+            return
+        print("⏱️ 启动耗时:")
+        for label, elapsed in self.marks:
+            print(f"   {elapsed * 1000:9.1f} ms  {label}")
+        print(f"   {(self.last - _STARTUP_T0) * 1000:9.1f} ms  合计")
+        loaded = [name for name, module in _LAZY_MODULES.items() if module.loaded]
+        deferred = [name for name, module in _LAZY_MODULES.items() if not module.loaded]
+        print(f"   延迟导入 - 启动期间已加载: {', '.join(loaded) or '无'}；尚未加载: {', '.join(deferred) or '无'}")
+        self.marks.clear()
+
+try:
+    import tkinter as tk
+    from tkinter import ttk, filedialog, messagebox
+except ImportError:  # 无图形界面环境（--daemon 模式不需要Tk）
+    tk = None
 import os
 import configparser
 import shutil
 import threading
 import subprocess
 from pathlib import Path
-import requests
+requests = lazy_import('requests')
 import re
-from requests.exceptions import RequestException, Timeout, ConnectionError
 import time
-import psutil
+psutil = lazy_import('psutil')
 from collections import deque
-import webbrowser
+webbrowser = lazy_import('webbrowser')
 import datetime
 
 class ResourceMonitorWindow:
@@ -339,7 +410,7 @@ class DownloadManager:
         for attempt in range(max_retries):
             try:
                 return request_func()
-            except (RequestException, Timeout, ConnectionError) as e:
+            except (requests.RequestException, requests.Timeout, requests.ConnectionError) as e:
                 last_exception = e
                 if attempt < max_retries - 1:
                     time.sleep(delay * (attempt + 1))  # 指数退避
@@ -380,10 +451,13 @@ class DownloadManager:
             for download_id in list(self.active_downloads.keys()):
                 self.active_downloads[download_id]['active'] = False
 
-import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
+try:
+    import tkinter as tk
+    from tkinter import ttk, messagebox, filedialog
+except ImportError:  # 无图形界面环境（--daemon 模式不需要Tk）
+    tk = None
 from pathlib import Path
-import requests
+requests = lazy_import('requests')
 import threading
 import json
 
@@ -1113,41 +1187,93 @@ pause >nul"""
             print(f"清理失败: {e}")
 
 
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
+try:
+    import tkinter as tk
+    from tkinter import ttk, filedialog, messagebox
+    import tkinter.font as tkfont
+except ImportError:  # 无图形界面环境（--daemon 模式不需要Tk）
+    tk = None
 import os
 import configparser
 import shutil
 import threading
 import subprocess
 from pathlib import Path
-import requests
+requests = lazy_import('requests')
 import re
-from requests.exceptions import RequestException, Timeout, ConnectionError
 import time
-import psutil
+psutil = lazy_import('psutil')
 from collections import deque
-import webbrowser
+webbrowser = lazy_import('webbrowser')
 import datetime #send_command
 import json
+import codecs
+import locale
+import asyncio
+import queue
+import sys
+import signal
+import struct
+import mmap
+import hashlib
+import zipfile
+import socket
+import io
+import atexit
+import hmac
+import ipaddress
+from concurrent.futures import ThreadPoolExecutor
+from array import array
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, unquote
 
 class ResourceMonitorWindow:
-    def __init__(self, parent, server_tab_id, process_pid):
+    HISTORY_POINTS = 60
+    CHART_PADDING = 40
+    MAX_MISSED_SAMPLES = 5  # 连续这么多轮采样都没有该服务器时才认为进程已终止
+
+    def __init__(self, parent, server_tab_id, sampler, post, history=None):
         """
         初始化资源监控窗口
         :param parent: 父窗口
         :param server_tab_id: 服务器标签ID
-        :param process_pid: 服务器进程PID
+        :param sampler: 共享资源采样器（ResourceSampler）
+        :param post: 将回调转交到UI线程执行的函数
+        :param history: 资源历史中最近的记录（用于预填图表）
         """
         self.parent = parent
         self.server_tab_id = server_tab_id
-        self.pid = process_pid
-        self.process = None
+        self.sampler = sampler
+        self.post = post
         self.running = True
         
         # 数据缓存（保留最近60个数据点）
-        self.cpu_data = deque(maxlen=60)
-        self.memory_data = deque(maxlen=60)
+        self.cpu_data = deque(maxlen=self.HISTORY_POINTS)
+        self.memory_data = deque(maxlen=self.HISTORY_POINTS)
+        # JVM指标换算为百分比：堆占已提交堆、MSPT占50ms tick预算、GC时间占采样间隔；
+        # 缺失的指标记为None占位，各曲线的数据点与CPU一一对应
+        self.heap_data = deque(maxlen=self.HISTORY_POINTS)
+        self.mspt_data = deque(maxlen=self.HISTORY_POINTS)
+        self.gc_data = deque(maxlen=self.HISTORY_POINTS)
+        # 曲线：(数据, 颜色, 图例)，折线对象在画布创建后生成
+        self.series = [
+            (self.cpu_data, "blue", "CPU"),
+            (self.memory_data, "red", "内存"),
+            (self.heap_data, "green", "堆"),
+            (self.mspt_data, "orange", "MSPT"),
+            (self.gc_data, "purple", "GC")
+        ]
+        self.sample_interval = sampler.interval
+        self.missed_samples = 0
+        self.error_label = None
+        for record in history or ():
+            self.append_values(record)
+        
+        # 图表几何参数在<Configure>时计算，曲线坐标缓冲区预先分配
+        self.chart_size = (0, 0)
+        self._x_positions = {}
+        self._coords = array('d', bytes(8 * 2 * self.HISTORY_POINTS))
+        self._redraw_pending = False
         
         # 创建窗口
         self.window = tk.Toplevel(parent)
@@ -1158,9 +1284,8 @@ class ResourceMonitorWindow:
         # 创建UI组件
         self.create_widgets()
         
-        # 启动监控线程
-        self.monitor_thread = threading.Thread(target=self.monitor_resources, daemon=True)
-        self.monitor_thread.start()
+        # 订阅共享采样器（不再单独创建监控线程）
+        self.subscription = self.sampler.subscribe(self.on_samples, server_tab_id)
 
     def create_widgets(self):
         """创建窗口组件"""
@@ -1176,12 +1301,29 @@ class ResourceMonitorWindow:
         self.memory_label = ttk.Label(self.status_frame, text="0%")
         self.memory_label.pack(side=tk.LEFT, padx=5)
         
+        # 进程树汇总（启动脚本、java及其子进程）
+        self.detail_label = ttk.Label(self.status_frame, text="")
+        self.detail_label.pack(side=tk.LEFT, padx=10)
+        
+        # JVM指标（堆、GC、tick时间）
+        self.jvm_frame = ttk.Frame(self.window)
+        self.jvm_frame.pack(fill=tk.X, padx=10)
+        self.jvm_label = ttk.Label(self.jvm_frame, text="JVM: 等待GC日志、jstat或mspt输出")
+        self.jvm_label.pack(side=tk.LEFT, padx=5)
+        
         # 图表画布
         self.canvas_frame = ttk.LabelFrame(self.window, text="资源使用趋势")
         self.canvas_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
         
         self.canvas = tk.Canvas(self.canvas_frame, bg="white")
         self.canvas.pack(fill=tk.BOTH, expand=True)
+        # 折线只创建一次，之后通过coords原地更新；有缺失数据的曲线在缺口处断开，按需增加分段
+        self.lines = [
+            [self.canvas.create_line(0, 0, 0, 0, fill=color, width=2, state=tk.HIDDEN)]
+            for data, color, label in self.series
+        ]
+        # 坐标轴只在窗口尺寸变化时重画
+        self.canvas.bind("<Configure>", self.on_canvas_configure)
         
         # 控制按钮
         self.btn_frame = ttk.Frame(self.window)
@@ -1193,44 +1335,72 @@ class ResourceMonitorWindow:
             command=self.force_refresh
         ).pack(side=tk.RIGHT, padx=5)
 
-    def monitor_resources(self):
-        try:
-            self.process = psutil.Process(self.pid)
-        except psutil.NoSuchProcess:
-            self.window.after(0, lambda: self.show_error("无法找到进程，可能已终止"))
+    def on_samples(self, samples):
+        """采样线程回调：转交到UI线程更新"""
+        sample = samples.get(self.server_tab_id)
+        if sample is None:
+            # 偶尔一轮采样失败或服务器尚在启动时不放弃，连续多轮没有采样才停止订阅
+            self.missed_samples += 1
+            if self.missed_samples == self.MAX_MISSED_SAMPLES:
+                self.sampler.unsubscribe(self.subscription)
+                self.subscription = None
+                self.post(lambda: self.show_error("无法找到进程，可能已终止（点击刷新重试）"))
             return
-        
-        # 首次调用获取基准值
-        self.process.cpu_percent(interval=None)
-        
-        while self.running and self.process.is_running():
-            try:
-                # 增加间隔避免频繁调用
-                time.sleep(1)
-                
-                # 获取CPU使用率（需要间隔）
-                cpu_percent = self.process.cpu_percent(interval=0)
-                # 获取内存使用率
-                memory_percent = self.process.memory_percent()
-                
-                # 缓存数据
-                self.cpu_data.append(cpu_percent)
-                self.memory_data.append(memory_percent)
-                
-                # 更新UI
-                self.window.after(0, lambda: self.update_ui(cpu_percent, memory_percent))
-                
-            except (psutil.NoSuchProcess, psutil.AccessDenied) as e:
-                break
-            except Exception as e:
-                if self.running:
-                    print(f"监控异常: {e}")
-                break
+        self.missed_samples = 0
+        self.post(lambda: self.add_sample(sample))
+
+    def add_sample(self, sample):
+        """缓存一个采样点并更新UI"""
+        if not self.running:
+            return
+        self.clear_error()
+        self.append_values(sample)
+        self.update_ui(sample['cpu_percent'], sample['memory_percent'])
+        self.update_details(sample)
+
+    def append_values(self, sample):
+        """把一个采样（或历史记录）换算成各曲线的数据点，缺失的JVM指标记为None"""
+        self.cpu_data.append(sample['cpu_percent'])
+        self.memory_data.append(sample['memory_percent'])
+        heap_used, heap_committed = sample.get('heap_used'), sample.get('heap_committed')
+        self.heap_data.append(heap_used / heap_committed * 100 if heap_used and heap_committed else None)
+        mspt = sample.get('mspt')
+        self.mspt_data.append(mspt / JvmMetrics.TICK_BUDGET_MS * 100 if mspt is not None else None)
+        gc_time = sample.get('gc_time_ms')
+        self.gc_data.append(gc_time / (self.sample_interval * 1000) * 100 if gc_time is not None else None)
+
+    def update_details(self, sample):
+        """显示进程树汇总数据"""
+        format_bytes = ResourceSampler.format_bytes
+        details = (
+            f"进程: {sample['process_count']}  线程: {sample['num_threads']}  句柄: {sample['num_handles']}  "
+            f"RSS: {format_bytes(sample['memory_rss'])}"
+        )
+        if sample['memory_uss'] is not None:
+            details += f"  USS: {format_bytes(sample['memory_uss'])}"
+        details += f"  读/写: {format_bytes(sample['io_read_bytes'])} / {format_bytes(sample['io_write_bytes'])}"
+        
+        jvm = []
+        if sample.get('heap_used') is not None:
+            jvm.append(f"堆: {format_bytes(sample['heap_used'])} / {format_bytes(sample['heap_committed'] or 0)}")
+        if sample.get('gc_pause_ms') is not None:
+            jvm.append(f"GC暂停: {sample['gc_pause_ms']:.1f} ms")
+        if sample.get('gc_time_ms') is not None:
+            jvm.append(f"GC耗时: {sample['gc_time_ms']:.1f} ms")
+        if sample.get('mspt') is not None:
+            jvm.append(f"MSPT: {sample['mspt']:.1f} ms")
+        if sample.get('tps') is not None:
+            jvm.append(f"TPS: {sample['tps']:.1f}")
+        try:
+            self.detail_label.config(text=details)
+            if jvm:
+                self.jvm_label.config(text="JVM  " + "  ".join(jvm))
+        except tk.TclError:
+            pass
 
     def update_ui(self, cpu, memory):
         """更新UI显示，增加存在性检查"""
-        # 检查窗口是否仍然存在
-        if not hasattr(self, 'window') or not self.window.winfo_exists():
+        if not self.running:
             return
             
         # 检查组件是否仍然存在
@@ -1238,198 +1408,2851 @@ class ResourceMonitorWindow:
             # 更新数值标签
             self.cpu_label.config(text=f"{cpu:.1f}%")
             self.memory_label.config(text=f"{memory:.1f}%")
-            
-            # 绘制图表
-            self.draw_chart()
         except tk.TclError:
             # 组件已被销毁，停止更新
             self.running = False
-
-    def draw_chart(self):
-        """绘制资源使用趋势图表"""
-        self.canvas.delete("all")
-        width = self.canvas.winfo_width() or 800
-        height = self.canvas.winfo_height() or 400
+            self.sampler.unsubscribe(self.subscription)
+            return
         
+        # 曲线在空闲时统一重画，同一轮中的多次更新只重画一次
+        self.schedule_redraw()
+
+    def schedule_redraw(self):
+        if not self._redraw_pending:
+            self._redraw_pending = True
+            self.window.after_idle(self._redraw)
+
+    def _redraw(self):
+        self._redraw_pending = False
+        try:
+            self.draw_chart()
+        except tk.TclError:
+            self.running = False
+
+    def on_canvas_configure(self, event):
+        """画布尺寸变化：重画坐标轴，重新计算曲线横坐标"""
+        self.chart_size = (event.width, event.height)
+        self._x_positions.clear()
+        self.draw_axes()
+        self.schedule_redraw()
+
+    def draw_axes(self):
+        """绘制坐标轴、刻度和图例（静态部分）"""
+        self.canvas.delete("axis")
+        width, height = self.chart_size
         if width < 100 or height < 100:
             return
-            
-        # 绘制坐标轴
-        padding = 40
-        chart_width = width - 2 * padding
+        
+        padding = self.CHART_PADDING
         chart_height = height - 2 * padding
         
         # X轴和Y轴
-        self.canvas.create_line(padding, padding, padding, height - padding, width=2)
-        self.canvas.create_line(padding, height - padding, width - padding, height - padding, width=2)
+        self.canvas.create_line(padding, padding, padding, height - padding, width=2, tags="axis")
+        self.canvas.create_line(padding, height - padding, width - padding, height - padding, width=2, tags="axis")
         
         # Y轴刻度 (0-100%)
         for i in range(0, 101, 20):
             y = height - padding - (i / 100 * chart_height)
-            self.canvas.create_line(padding - 5, y, padding, y)
-            self.canvas.create_text(padding - 10, y, text=f"{i}%", anchor=tk.E)
+            self.canvas.create_line(padding - 5, y, padding, y, tags="axis")
+            self.canvas.create_text(padding - 10, y, text=f"{i}%", anchor=tk.E, tags="axis")
         
-        # 绘制CPU使用率曲线
-        if len(self.cpu_data) >= 2:
-            cpu_points = []
-            for idx, value in enumerate(self.cpu_data):
-                x = padding + (idx / (len(self.cpu_data) - 1)) * chart_width
-                y = height - padding - (value / 100 * chart_height)
-                cpu_points.extend([x, y])
-            
-            self.canvas.create_line(cpu_points, fill="blue", width=2)
-            self.canvas.create_text(padding + 10, padding + 10, text="CPU", fill="blue", anchor=tk.W)
+        # 图例
+        for index, (data, color, label) in enumerate(self.series):
+            self.canvas.create_text(padding + 10 + index * 60, padding + 10, text=label, fill=color,
+                                    anchor=tk.W, tags="axis")
+
+    def _x_for(self, count):
+        """count个数据点的横坐标（按点数缓存，尺寸变化时清空）"""
+        xs = self._x_positions.get(count)
+        if xs is None:
+            width = self.chart_size[0]
+            chart_width = width - 2 * self.CHART_PADDING
+            xs = self._x_positions[count] = array(
+                'd', (self.CHART_PADDING + idx / (count - 1) * chart_width for idx in range(count))
+            )
+        return xs
+
+    def draw_chart(self):
+        """更新资源使用趋势曲线（只修改已有折线的坐标）"""
+        width, height = self.chart_size
+        if width < 100 or height < 100:
+            return
         
-        # 绘制内存使用率曲线
-        if len(self.memory_data) >= 2:
-            mem_points = []
-            for idx, value in enumerate(self.memory_data):
-                x = padding + (idx / (len(self.memory_data) - 1)) * chart_width
-                y = height - padding - (value / 100 * chart_height)
-                mem_points.extend([x, y])
-            
-            self.canvas.create_line(mem_points, fill="red", width=2)
-            self.canvas.create_text(padding + 60, padding + 10, text="内存", fill="red", anchor=tk.W)
+        base = height - self.CHART_PADDING
+        scale = (height - 2 * self.CHART_PADDING) / 100
+        coords = self._coords
+        # 所有曲线的数据点一一对应，横坐标按CPU曲线的点数计算
+        count = len(self.cpu_data)
+        xs = self._x_for(count) if count >= 2 else ()
+        for lines, (data, color, label) in zip(self.lines, self.series):
+            if count < 2:
+                segments = []
+            elif None not in data:
+                # 完整的曲线：直接填充预分配的坐标缓冲区
+                end = 2 * count
+                coords[0:end:2] = xs
+                coords[1:end:2] = array('d', (base - min(max(value, 0.0), 100.0) * scale for value in data))
+                segments = [coords[:end].tolist()]
+            else:
+                segments = self._segments(xs, data, base, scale)
+            while len(lines) < len(segments):
+                lines.append(self.canvas.create_line(0, 0, 0, 0, fill=color, width=2, state=tk.HIDDEN))
+            for index, line in enumerate(lines):
+                if index < len(segments):
+                    self.canvas.coords(line, segments[index])
+                    self.canvas.itemconfigure(line, state=tk.NORMAL)
+                else:
+                    self.canvas.itemconfigure(line, state=tk.HIDDEN)
+
+    @staticmethod
+    def _segments(xs, data, base, scale):
+        """按None把曲线拆成连续的分段（少于两个点的分段不画）"""
+        segments = []
+        run = []
+        for x, value in zip(xs, data):
+            if value is None:
+                if len(run) >= 4:
+                    segments.append(run)
+                run = []
+            else:
+                run += (x, base - min(max(value, 0.0), 100.0) * scale)
+        if len(run) >= 4:
+            segments.append(run)
+        return segments
 
     def force_refresh(self):
-        """强制刷新数据"""
-        if self.process and self.process.is_running():
-            try:
-                cpu = self.process.cpu_percent(interval=0.1)
-                memory = self.process.memory_percent()
-                self.update_ui(cpu, memory)
-            except Exception as e:
-                self.show_error(f"刷新失败: {str(e)}")
+        """强制刷新数据（使用采样器最近一次的结果），已停止订阅时重新订阅"""
+        if self.subscription is None and self.running:
+            self.missed_samples = 0
+            self.clear_error()
+            self.subscription = self.sampler.subscribe(self.on_samples, self.server_tab_id)
+        sample = self.sampler.latest(self.server_tab_id)
+        if sample is None:
+            self.show_error("暂无采样数据")
+            return
+        try:
+            self.update_ui(sample['cpu_percent'], sample['memory_percent'])
+            self.update_details(sample)
+        except Exception as e:
+            self.show_error(f"刷新失败: {str(e)}")
 
     def show_error(self, message):
-        """显示错误信息"""
-        ttk.Label(
-            self.status_frame,
-            text=message,
-            foreground="red"
-        ).pack(side=tk.LEFT, padx=10)
+        """显示错误信息（只保留最近一条）"""
+        if not self.running:
+            return
+        if self.error_label is None:
+            self.error_label = ttk.Label(self.status_frame, foreground="red")
+            self.error_label.pack(side=tk.LEFT, padx=10)
+        self.error_label.config(text=message)
+
+    def clear_error(self):
+        if self.error_label is not None:
+            self.error_label.destroy()
+            self.error_label = None
 
     def stop_monitoring(self):
         """停止监控并关闭窗口"""
         self.running = False
+        self.sampler.unsubscribe(self.subscription)
         self.window.destroy()
 
+# ANSI转义序列（模块级预编译，避免每行重新编译）
+ANSI_ESCAPE_RE = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+# 同样的序列，但捕获CSI参数和结束符，用于单次扫描解析SGR颜色
+ANSI_TOKEN_RE = re.compile(r'\x1B(?:\[([0-?]*[ -/]*[@-~])|[@-Z\\-_])')
+
+# xterm 16色调色板（30-37/90-97，40-47/100-107）
+ANSI_BASIC_COLORS = (
+    '000000', 'cd3131', '0dbc79', 'e5e510', '2472c8', 'bc3fbc', '11a8cd', 'e5e5e5',
+    '666666', 'f14c4c', '23d18b', 'f5f543', '3b8eea', 'd670d6', '29b8db', 'ffffff'
+)
+ANSI_CUBE_LEVELS = (0, 95, 135, 175, 215, 255)
+
+# SGR参数解析缓存：(参数, 当前样式) -> (新样式, 标签元组)
+_SGR_CACHE = {}
+# 转义序列骨架缓存：一行中所有转义序列 -> 各文本片段的标签
+_ANSI_LAYOUT_CACHE = {}
+_NO_TAGS = ((),)
+
 def clean_ansi_codes(text):
     """移除所有ANSI转义序列"""
-    ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
-    return ansi_escape.sub('', text)
+    if '\x1b' not in text:
+        return text
+    return ANSI_ESCAPE_RE.sub('', text)
 
-class DownloadManager:
-    """增强版下载管理器（解决超时和界面卡死问题）"""
-    def __init__(self, root):
-        self.root = root
-        self.active_downloads = {}  # 存储活跃下载任务
-        self.lock = threading.Lock()  # 线程安全锁
+def _ansi_256_color(index):
+    """将256色索引转换为十六进制颜色"""
+    if index < 16:
+        return ANSI_BASIC_COLORS[index]
+    if index < 232:
+        index -= 16
+        r, g, b = index // 36, (index // 6) % 6, index % 6
+        return '%02x%02x%02x' % (ANSI_CUBE_LEVELS[r], ANSI_CUBE_LEVELS[g], ANSI_CUBE_LEVELS[b])
+    gray = 8 + (index - 232) * 10
+    return '%02x%02x%02x' % (gray, gray, gray)
 
-    def start_download(self, url, save_path, progress_callback=None, completion_callback=None):
-        """启动带进度监控的下载（线程安全版）"""
-        with self.lock:
-            if url in [data['url'] for data in self.active_downloads.values()]:
-                return False  # 避免重复下载
+def _apply_sgr(params, style):
+    """根据SGR参数更新样式 (前景色, 背景色, 粗体)，返回 (新样式, 标签元组)"""
+    key = (params, style)
+    cached = _SGR_CACHE.get(key)
+    if cached is not None:
+        return cached
 
-            download_id = str(hash(url + save_path))
-            self.active_downloads[download_id] = {
-                'url': url,
-                'path': save_path,
-                'active': True,
-                'progress': 0
-            }
+    fg, bg, bold = style
+    codes = [int(c) if c.isdigit() else 0 for c in params.split(';')] if params else [0]
+    i = 0
+    while i < len(codes):
+        code = codes[i]
+        if code == 0:
+            fg, bg, bold = None, None, False
+        elif code == 1:
+            bold = True
+        elif code == 22:
+            bold = False
+        elif 30 <= code <= 37:
+            fg = ANSI_BASIC_COLORS[code - 30]
+        elif 90 <= code <= 97:
+            fg = ANSI_BASIC_COLORS[code - 90 + 8]
+        elif code == 39:
+            fg = None
+        elif 40 <= code <= 47:
+            bg = ANSI_BASIC_COLORS[code - 40]
+        elif 100 <= code <= 107:
+            bg = ANSI_BASIC_COLORS[code - 100 + 8]
+        elif code == 49:
+            bg = None
+        elif code in (38, 48) and i + 1 < len(codes):
+            # 扩展颜色：38;5;n（256色）或 38;2;r;g;b（真彩色）
+            color = None
+            if codes[i + 1] == 5 and i + 2 < len(codes):
+                color = _ansi_256_color(codes[i + 2] & 0xFF)
+                i += 2
+            elif codes[i + 1] == 2 and i + 4 < len(codes):
+                color = '%02x%02x%02x' % tuple(min(c, 255) for c in codes[i + 2:i + 5])
+                i += 4
+            if color is not None:
+                if code == 38:
+                    fg = color
+                else:
+                    bg = color
+        i += 1
 
-            threading.Thread(
-                target=self._download_file,
-                args=(download_id, url, save_path, progress_callback, completion_callback),
-                daemon=True
-            ).start()
-            return True
+    new_style = (fg, bg, bold)
+    result = (new_style, _style_tags(new_style))
+    if len(_SGR_CACHE) < 4096:
+        _SGR_CACHE[key] = result
+    return result
 
-    def _download_file(self, download_id, url, save_path, progress_callback, completion_callback):
-        """实际下载线程（含超时处理和断点续传）"""
-        temp_path = f"{save_path}.tmp"
+def _style_tags(style):
+    """将样式转换为Text组件标签名"""
+    fg, bg, bold = style
+    tags = []
+    if fg:
+        tags.append('ansi_fg_' + fg)
+    if bg:
+        tags.append('ansi_bg_' + bg)
+    if bold:
+        tags.append('ansi_bold')
+    return tuple(tags)
+
+def parse_ansi(text):
+    """
+    单次扫描解析ANSI转义序列，保留SGR颜色信息
+    :param text: 原始输出文本
+    :return: (文本片段列表, 标签元组列表)，两者一一对应；片段可能为空字符串
+    """
+    if '\x1b' not in text:
+        return (text,), _NO_TAGS
+
+    # split结果依次为：文本, 转义序列, 文本, 转义序列, 文本...
+    parts = ANSI_TOKEN_RE.split(text)
+    layout = tuple(parts[1::2])
+    tags_list = _ANSI_LAYOUT_CACHE.get(layout)
+    if tags_list is None:
+        # 同一种颜色排列只解析一次（服务器日志的颜色格式高度重复）
+        style = (None, None, False)
+        tags = ()
+        tags_list = [tags]
+        for seq in layout:
+            if seq and seq[-1] == 'm':
+                style, tags = _apply_sgr(seq[:-1], style)
+            tags_list.append(tags)
+        if len(_ANSI_LAYOUT_CACHE) < 4096:
+            _ANSI_LAYOUT_CACHE[layout] = tags_list
+    return parts[::2], tags_list
+
+def benchmark_ansi(lines=100000, repeat=5):
+    """ANSI处理微基准：对比旧的逐行编译剥离与预编译单次扫描解析"""
+    import timeit
+
+    samples = [
+        "\x1b[0;36;1m[12:00:00 INFO]: \x1b[0;32;22mDone (3.214s)! For help, type \"help\"\x1b[m",
+        "[12:00:01 WARN]: Can't keep up! Is the server overloaded? Running 2054ms or 41 ticks behind",
+        "\x1b[38;2;255;170;0m[Essentials]\x1b[0m Loaded 36 kits from config.",
+        "\tat net.minecraft.server.MinecraftServer.runServer(MinecraftServer.java:1234)",
+    ]
+    data = [samples[i % len(samples)] for i in range(lines)]
+
+    def legacy_strip(text):
+        ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+        return ansi_escape.sub('', text)
+
+    results = {}
+    for name, func in (("旧版剥离(逐行编译)", legacy_strip),
+                       ("预编译剥离", clean_ansi_codes),
+                       ("单次扫描颜色解析", parse_ansi)):
+        # 取多次运行的最小值，减少系统抖动的影响
+        elapsed = min(timeit.repeat(lambda: [func(line) for line in data], number=1, repeat=repeat))
+        results[name] = elapsed
+        print(f"{name}: {elapsed:.3f}s, {lines / elapsed:,.0f} 行/秒")
+    return results
+
+class OutputLineDecoder:
+    """将服务器进程的二进制输出按行切分并解码（自行处理换行，不依赖text模式）"""
+    MAX_PARTIAL_LINE = 1024 * 1024  # 无换行的输出超过1MB时强制作为一行输出
+
+    def __init__(self, encoding=None, errors='replace'):
+        """
+        初始化输出解码器
+        :param encoding: 输出编码，为空时使用系统默认编码
+        :param errors: 解码错误处理方式（strict/replace/ignore等）
+        """
+        encoding = encoding or locale.getpreferredencoding(False) or 'utf-8'
         try:
-            # 创建会话并配置参数
-            session = requests.Session()
-            session.max_redirects = 5
-            session.stream = True
-            
-            # 第一次尝试获取文件信息（带重试）
-            response = self._retry_request(
-                lambda: session.head(url, timeout=10),
-                max_retries=2,
-                delay=1
-            )
-            response.raise_for_status()
-            
-            total_size = int(response.headers.get('content-length', 0))
-            downloaded = 0
-            
-            # 断点续传检查
-            if os.path.exists(temp_path):
-                downloaded = os.path.getsize(temp_path)
-                headers = {'Range': f'bytes={downloaded}-'}
-            else:
-                headers = {}
-                os.makedirs(os.path.dirname(save_path), exist_ok=True)
+            codecs.lookup(encoding)
+        except LookupError:
+            print(f"⚠️ 未知的控制台编码 {encoding}，改用 utf-8")
+            encoding = 'utf-8'
+        self.encoding = encoding
+        self.errors = errors
+        self._buffer = b''
 
-            # 分块下载（主下载循环）
-            with session.get(
-                url,
-                headers=headers,
-                stream=True,
-                timeout=(10, 30)  # 连接10秒，读取30秒超时
-            ) as response:
-                response.raise_for_status()
-                
-                # 更新进度最大值
-                if progress_callback and total_size > 0:
-                    self.root.after(0, lambda: progress_callback(0, total_size))
-                
-                chunk_size = 8192  # 8KB分块
-                update_interval = max(total_size // 100, 1024 * 1024)  # 至少1MB更新间隔
-                
-                with open(temp_path, 'ab' if downloaded else 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=chunk_size):
-                        if not self._is_download_active(download_id):
-                            raise Exception("下载被用户取消")
-                            
-                        if chunk:  # 过滤keep-alive空块
-                            f.write(chunk)
-                            downloaded += len(chunk)
-                            
-                            # 控制进度更新频率
-                            if downloaded % update_interval == 0:
-                                progress = downloaded / total_size * 100 if total_size > 0 else 0
-                                self._update_download_progress(
-                                    download_id,
-                                    progress,
-                                    downloaded,
-                                    total_size,
-                                    progress_callback
-                                )
-                
-                # 下载完成重命名文件
-                os.replace(temp_path, save_path)
-                
-            # 成功回调
-            self._safe_callback(
-                completion_callback,
-                True,
-                None,
-                download_id
-            )
+        # 吞吐量统计
+        self.total_bytes = 0
+        self.total_lines = 0
+        self.start_time = time.monotonic()
 
+    def feed(self, data):
+        """
+        输入一块二进制数据
+        :return: 本块中完整的行（已解码，不含换行符）
+        """
+        self.total_bytes += len(data)
+        buffer = self._buffer + data if self._buffer else data
+        end = buffer.rfind(b'\n')
+        if end < 0:
+            if len(buffer) > self.MAX_PARTIAL_LINE:
+                self._buffer = b''
+                return self._decode_lines(buffer + b'\n')
+            self._buffer = buffer
+            return []
+
+        self._buffer = buffer[end + 1:]
+        return self._decode_lines(buffer[:end + 1])
+
+    def finish(self):
+        """进程输出结束时取出最后一行不完整的输出"""
+        if not self._buffer:
+            return []
+        buffer, self._buffer = self._buffer, b''
+        return self._decode_lines(buffer + b'\n')
+
+    def _decode_lines(self, block):
+        """整块解码后再切分，每块只调用一次解码器"""
+        text = block.replace(b'\r\n', b'\n').decode(self.encoding, self.errors)
+        lines = text.split('\n')
+        lines.pop()  # 末尾换行符之后的空串
+        self.total_lines += len(lines)
+        return lines
+
+    def encode(self, text):
+        """按相同编码编码发送给进程的文本"""
+        return text.encode(self.encoding, 'replace')
+
+    def lines_per_second(self):
+        """平均输出速度（行/秒）"""
+        elapsed = time.monotonic() - self.start_time
+        return self.total_lines / elapsed if elapsed > 0 else 0.0
+
+class ConsoleArchiver:
+    """
+    控制台归档的后台写入线程（所有控制台共用一个）
+    UI线程只把裁剪掉的文本入队，打开、轮换和追加文件都在后台线程中进行；退出时写完队列中剩余的内容。
+    """
+    MAX_BYTES = 50 * 1024 * 1024  # 归档文件超过50MB时轮换
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, path, text):
+        """追加text到归档文件path（任意线程均可调用）"""
+        self.queue.put((Path(path), text))
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="MSM-ConsoleArchive", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            stopping = item is None
+            # 合并队列中已有的内容，每个文件只打开一次
+            batches = {}
+            while item is not None:
+                path, text = item
+                batches.setdefault(path, []).append(text)
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                stopping = item is None
+            for path, texts in batches.items():
+                self._write(path, "".join(texts))
+            if stopping:
+                return
+
+    def _write(self, archive_file, text):
+        try:
+            archive_file.parent.mkdir(parents=True, exist_ok=True)
+
+            # 超过大小上限时轮换为 .old.log（避免被启动清理的 *.log.* 规则删除）
+            if archive_file.exists() and archive_file.stat().st_size > self.MAX_BYTES:
+                os.replace(archive_file, archive_file.with_name(f"{archive_file.stem}.old{archive_file.suffix}"))
+
+            with open(archive_file, 'a', encoding='utf-8') as f:
+                f.write(text)
+        except Exception as e:
+            print(f"⚠️ 写入控制台归档失败: {e}")
+
+    def close(self, timeout=5):
+        """写完队列中的内容并停止后台线程"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self.queue.put(None)
+            thread.join(timeout)
+
+class ConsoleBuffer:
+    """控制台缓冲输出（读取线程只入队，由UI定时任务批量写入Text组件）"""
+    archiver = ConsoleArchiver()  # 被裁剪的旧行由后台线程追加到归档文件
+
+    def __init__(self, root, text_widget, flush_interval=50, max_lines_per_flush=500,
+                 scrollback_lines=10000, archive_path=None):
+        """
+        初始化控制台缓冲
+        :param root: Tk根窗口
+        :param text_widget: 控制台输出的Text组件（可以为None，之后通过attach设置）
+        :param flush_interval: 刷新间隔（毫秒）
+        :param max_lines_per_flush: 每次刷新最多写入的行数
+        :param scrollback_lines: 控制台最多保留的行数（0表示不限制）
+        :param archive_path: 返回归档文件路径的函数，被裁剪的旧行追加到该文件
+        """
+        self.root = root
+        self.text_widget = text_widget
+        self.flush_interval = max(int(flush_interval), 10)
+        self.max_lines_per_flush = max(int(max_lines_per_flush), 1)
+        self.scrollback_lines = max(int(scrollback_lines), 0)
+        # 超出上限一定数量后才批量裁剪，避免每次刷新都删除
+        self.trim_batch = max(self.scrollback_lines // 10, 100)
+        self.archive_path = archive_path
+        self.line_count = 0  # Text组件中的行数
+        self.configured_tags = set()  # 已配置样式的ANSI标签
+        self.pending = deque()  # deque的append/popleft本身是线程安全的
+        self.running = True
+        self._after_id = None
+
+        if text_widget is not None:
+            self._schedule_flush()
+
+    def attach(self, text_widget):
+        """设置输出组件并开始刷新（标签页内容首次显示时创建）"""
+        self.text_widget = text_widget
+        if self.running and self._after_id is None:
+            self._schedule_flush()
+
+    def write(self, message):
+        """追加一行输出（任意线程均可调用，ANSI颜色在调用线程中解析）"""
+        if self.running:
+            self.pending.append(parse_ansi(message))
+            # 尚未显示的控制台只保留最近的输出
+            if self.text_widget is None and self.scrollback_lines and len(self.pending) > self.scrollback_lines:
+                self.pending.popleft()
+
+    def _schedule_flush(self):
+        """安排下一次刷新"""
+        if self.running:
+            self._after_id = self.root.after(self.flush_interval, self._flush_tick)
+
+    def _flush_tick(self):
+        """定时刷新回调（运行在主线程）"""
+        self._after_id = None
+        try:
+            self.flush()
+        except tk.TclError:
+            # 组件已被销毁，停止刷新
+            self.running = False
+            return
+        self._schedule_flush()
+
+    def flush(self):
+        """将积压的输出一次性写入Text组件"""
+        if not self.pending:
+            return
+
+        # 合并相同标签的相邻片段，生成 insert(文本, 标签, 文本, 标签...) 参数
+        args = []
+        chunk = []
+        last_tags = ()
+        count = 0
+        while self.pending and count < self.max_lines_per_flush:
+            texts, tags_list = self.pending.popleft()
+            count += 1
+            for text, tags in zip(texts, tags_list):
+                if not text:
+                    continue
+                if tags != last_tags:
+                    if chunk:
+                        args.append("".join(chunk))
+                        args.append(last_tags)
+                    chunk = []
+                    last_tags = tags
+                chunk.append(text)
+            if last_tags:
+                # 换行符不带颜色标签
+                if chunk:
+                    args.append("".join(chunk))
+                    args.append(last_tags)
+                chunk = []
+                last_tags = ()
+            chunk.append("\n")
+        if chunk:
+            args.append("".join(chunk))
+            args.append(last_tags)
+
+        self._configure_tags(args[1::2])
+
+        # 一次插入、一次滚动，而不是每行一次
+        log_text = self.text_widget
+        log_text.config(state=tk.NORMAL)
+        log_text.insert(tk.END, *args)
+        self.line_count += sum(text.count("\n") for text in args[0::2])
+        if self.scrollback_lines and self.line_count > self.scrollback_lines + self.trim_batch:
+            self._trim()
+        log_text.see(tk.END)
+        log_text.config(state=tk.DISABLED)
+
+    def _configure_tags(self, tag_groups):
+        """为首次出现的ANSI颜色标签配置样式"""
+        for tags in tag_groups:
+            for tag in tags:
+                if tag in self.configured_tags:
+                    continue
+                if tag == 'ansi_bold':
+                    bold_font = tkfont.Font(font=self.text_widget.cget('font'))
+                    bold_font.configure(weight='bold')
+                    self._bold_font = bold_font  # 保持引用，防止字体被回收
+                    self.text_widget.tag_configure(tag, font=bold_font)
+                elif tag.startswith('ansi_fg_'):
+                    self.text_widget.tag_configure(tag, foreground='#' + tag[8:])
+                elif tag.startswith('ansi_bg_'):
+                    self.text_widget.tag_configure(tag, background='#' + tag[8:])
+                self.configured_tags.add(tag)
+
+    def _trim(self):
+        """批量删除最旧的行，并追加到归档文件"""
+        excess = self.line_count - self.scrollback_lines
+        end_index = f"{excess + 1}.0"
+        self._archive(self.text_widget.get("1.0", end_index))
+        self.text_widget.delete("1.0", end_index)
+        self.line_count -= excess
+
+    def _archive(self, text):
+        """将裁剪掉的输出交给后台线程追加到归档文件（路径在UI线程中获取）"""
+        if not self.archive_path:
+            return
+        try:
+            archive_file = self.archive_path()
+            if archive_file:
+                self.archiver.submit(archive_file, text)
+        except Exception as e:
+            print(f"⚠️ 写入控制台归档失败: {e}")
+
+    def stop(self):
+        """停止刷新并丢弃未写入的输出"""
+        self.running = False
+        self.pending.clear()
+        if self._after_id is not None:
+            try:
+                self.root.after_cancel(self._after_id)
+            except tk.TclError:
+                pass
+            self._after_id = None
+
+# 当前系统使用的启动脚本
+START_SCRIPT_NAME = "start.bat" if os.name == 'nt' else "start.sh"
+
+class ProcessControl:
+    """
+    进程控制后端（基于psutil，Windows和Linux通用）
+    一次process_iter快照即可按工作目录/命令行定位进程，
+    终止时覆盖整个进程树（如 cmd.exe /c start.bat 启动的java），并用wait_procs等待退出。
+    """
+    SNAPSHOT_ATTRS = ['pid', 'name', 'cwd', 'cmdline', 'create_time']
+
+    def snapshot(self, name_filter='java'):
+        """获取一次进程快照（只保留名称包含name_filter的进程，为空时保留全部）"""
+        procs = []
+        for proc in psutil.process_iter(self.SNAPSHOT_ATTRS):
+            name = (proc.info['name'] or '').lower()
+            if not name_filter or name_filter in name:
+                procs.append(proc)
+        return procs
+
+    @staticmethod
+    def _normalize(path):
+        return os.path.normcase(os.path.abspath(str(path)))
+
+    def find_by_directory(self, directory, snapshot=None):
+        """在快照中查找工作目录为directory或命令行引用该目录下文件的进程"""
+        directory = self._normalize(directory)
+        found = []
+        for proc in snapshot if snapshot is not None else self.snapshot():
+            cwd = proc.info['cwd']
+            if cwd and self._normalize(cwd) == directory:
+                found.append(proc)
+                continue
+            for arg in proc.info['cmdline'] or []:
+                arg = os.path.normcase(arg)
+                if arg == directory or arg.startswith(directory + os.sep):
+                    found.append(proc)
+                    break
+        return found
+
+    def find_file_holders(self, file_path, snapshot=None):
+        """在快照中查找打开了指定文件的进程"""
+        target = self._normalize(file_path)
+        holders = []
+        for proc in snapshot if snapshot is not None else self.snapshot():
+            try:
+                if any(os.path.normcase(f.path) == target for f in proc.open_files()):
+                    holders.append(proc)
+            except psutil.Error:
+                pass
+        return holders
+
+    def process(self, pid, create_time=None):
+        """按PID获取进程（create_time不一致说明PID已被复用，返回None）"""
+        try:
+            proc = psutil.Process(pid)
+            if create_time is not None and abs(proc.create_time() - create_time) > 1:
+                return None
+            return proc
+        except psutil.Error:
+            return None
+
+    def tree(self, proc):
+        """进程及其所有子进程（子进程在前）"""
+        if isinstance(proc, int):
+            proc = self.process(proc)
+            if proc is None:
+                return []
+        try:
+            children = proc.children(recursive=True)
+        except psutil.Error:
+            children = []
+        return children + [proc]
+
+    def tree_pids(self, pid):
+        return {proc.pid for proc in self.tree(pid)}
+
+    def terminate(self, procs, timeout=5, kill_timeout=2):
+        """
+        终止一组进程：先terminate，超时后kill
+        :return: 仍未退出的进程列表
+        """
+        procs = list({proc.pid: proc for proc in procs}.values())
+        if not procs:
+            return []
+        for proc in procs:
+            try:
+                proc.terminate()
+            except psutil.Error:
+                pass
+        gone, alive = psutil.wait_procs(procs, timeout=timeout)
+        if not alive:
+            return []
+
+        for proc in alive:
+            try:
+                print(f"🔫 强制终止进程 PID: {proc.pid}")
+                proc.kill()
+            except psutil.Error:
+                pass
+        gone, alive = psutil.wait_procs(alive, timeout=kill_timeout)
+        return alive
+
+class ManagedProcess:
+    """由ProcessSupervisor管理的服务器进程句柄（提供与Popen一致的常用接口）"""
+    def __init__(self, supervisor, server_id, process, decoder, cwd=None):
+        self.supervisor = supervisor
+        self.server_id = server_id
+        self.process = process  # asyncio.subprocess.Process，只能在事件循环线程中操作
+        self.pid = process.pid
+        self.decoder = decoder
+        self.cwd = cwd
+        self.returncode = None
+        self.exited = threading.Event()
+        self.known_procs = {}
+
+    def poll(self):
+        """进程仍在运行时返回None，否则返回退出代码"""
+        if self.returncode is None:
+            # 事件循环已回收进程但输出尚未读完时也视为已退出
+            return self.process.returncode
+        return self.returncode
+
+    def wait(self, timeout=None):
+        """阻塞等待进程退出（不要在UI线程中使用）"""
+        if not self.exited.wait(timeout):
+            raise subprocess.TimeoutExpired(str(self.pid), timeout)
+        return self.returncode
+
+    def write(self, data):
+        """向标准输入写入字节（在事件循环线程中执行）"""
+        self.supervisor.loop.call_soon_threadsafe(self._write, data)
+
+    def terminate(self):
+        self.supervisor.loop.call_soon_threadsafe(self._signal, 'terminate')
+
+    def kill(self):
+        self.supervisor.loop.call_soon_threadsafe(self._signal, 'kill')
+
+    def _write(self, data):
+        try:
+            self.process.stdin.write(data)
+        except Exception as e:
+            self.supervisor.emit('log', self.server_id, f"❌ 发送命令失败: {str(e)}")
+
+    def _signal(self, action):
+        """
+        向整个进程树发送信号（启动脚本会派生java子进程，子进程也持有输出管道）
+        记住已发现的子进程：启动脚本先退出时，孤立的java仍能在下一阶段被终止。
+        不调用asyncio的kill，它会经Popen.poll回收进程，导致事件循环拿不到退出代码。
+        """
+        control = self.supervisor.process_control
+        if self.process.returncode is None:
+            for proc in control.tree(self.pid):
+                self.known_procs.setdefault(proc.pid, proc)
+        for proc in list(self.known_procs.values()):
+            try:
+                getattr(proc, action)()
+            except psutil.Error:
+                pass
+
+class ProcessSupervisor:
+    """
+    服务器进程监管器
+    所有服务器进程由一个后台线程中的asyncio事件循环统一管理：
+    输出读取、退出等待、停止超时都是协程，不再为每个服务器创建轮询线程。
+    事件通过线程安全队列交给UI线程处理，格式为 (类型, 服务器ID, 数据)：
+    - ('output', id, (时间戳, 行列表))
+    - ('log', id, 消息)
+    - ('exit', id, ManagedProcess)
+    - ('state', id, 状态)  由ServerEngine发出
+    - ('call', None, 可调用对象)
+    """
+    DRAIN_TIMEOUT = 5
+
+    def __init__(self, event_queue, read_size=65536, process_control=None):
+        self.event_queue = event_queue
+        self.read_size = read_size
+        self.process_control = process_control or ProcessControl()
+        self.processes = {}
+        self.loop = asyncio.new_event_loop()
+        self._attach_child_watcher()
+        self.thread = threading.Thread(target=self._run_loop, name="MSM-Supervisor", daemon=True)
+        self.thread.start()
+
+    def _attach_child_watcher(self):
+        """
+        旧版Python在非主线程中运行子进程时默认为每个子进程创建一个等待线程，
+        Linux内核支持pidfd时改用PidfdChildWatcher（Python 3.12起已是默认行为）
+        """
+        if os.name == 'nt' or sys.version_info >= (3, 12):
+            return
+        if not hasattr(asyncio, 'PidfdChildWatcher') or not hasattr(os, 'pidfd_open'):
+            return
+        try:
+            os.close(os.pidfd_open(os.getpid()))
+            watcher = asyncio.PidfdChildWatcher()
+            watcher.attach_loop(self.loop)
+            asyncio.set_child_watcher(watcher)
+        except Exception as e:
+            print(f"⚠️ 无法使用pidfd监视子进程: {e}")
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def emit(self, kind, server_id, payload):
+        """向UI线程投递事件"""
+        self.event_queue.put((kind, server_id, payload))
+
+    def post(self, callback):
+        """在UI线程中执行回调"""
+        self.emit('call', None, callback)
+
+    def spawn(self, server_id, args, cwd, decoder, timeout=30):
+        """启动服务器进程并开始读取输出，返回ManagedProcess"""
+        future = asyncio.run_coroutine_threadsafe(self._spawn(server_id, args, cwd, decoder), self.loop)
+        return future.result(timeout)
+
+    async def _spawn(self, server_id, args, cwd, decoder):
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            cwd=cwd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT
+        )
+        handle = ManagedProcess(self, server_id, process, decoder, cwd)
+        self.processes[server_id] = handle
+        self.loop.create_task(self._watch(handle))
+        return handle
+
+    async def _watch(self, handle):
+        """读取进程输出，进程退出后再等待输出读完"""
+        server_id = handle.server_id
+        reader = self.loop.create_task(self._read_output(handle))
+        returncode = await handle.process.wait()
+
+        # 子进程（如启动脚本派生的java）可能仍持有输出管道，不能无限等待
+        try:
+            await asyncio.wait_for(reader, self.DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.emit('log', server_id, "⚠️ 服务器进程已退出，但仍有子进程占用输出管道")
+        lines = handle.decoder.finish()
+        if lines:
+            self.emit('output', server_id, (time.strftime("[%H:%M:%S]"), lines))
+
+        handle.returncode = returncode
+        handle.exited.set()
+        if self.processes.get(server_id) is handle:
+            del self.processes[server_id]
+        self.emit('exit', server_id, handle)
+
+    async def _read_output(self, handle):
+        """读取进程输出直到管道关闭"""
+        decoder = handle.decoder
+        stream = handle.process.stdout
+        try:
+            while True:
+                data = await stream.read(self.read_size)
+                if not data:
+                    break
+                lines = decoder.feed(data)
+                if lines:
+                    self.emit('output', handle.server_id, (time.strftime("[%H:%M:%S]"), lines))
+        except Exception as e:
+            self.emit('log', handle.server_id, f"❌ 读取服务器输出失败: {str(e)}")
+
+    def wait_for_stop(self, handle, graceful_timeout=15, terminate_timeout=5, kill_timeout=2):
+        """
+        等待已收到stop命令的进程退出，超时后依次terminate、kill
+        :return: concurrent.futures.Future，结果为进程是否已停止
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self._wait_for_stop(handle, graceful_timeout, terminate_timeout, kill_timeout),
+            self.loop
+        )
+
+    async def _wait_for_stop(self, handle, graceful_timeout, terminate_timeout, kill_timeout):
+        server_id = handle.server_id
+
+        # 第一阶段：等待正常停止
+        if await self._wait_exit(handle, graceful_timeout):
+            self.emit('log', server_id, "✅ 服务器已正常停止")
+            return True
+
+        # 第二阶段：温和终止
+        if terminate_timeout > 0:
+            self.emit('log', server_id, "⚠️ 服务器停止较慢，请稍加等待...")
+            handle._signal('terminate')
+            if await self._wait_exit(handle, terminate_timeout):
+                self.emit('log', server_id, "✅ 服务器已停止")
+                return True
+
+        # 第三阶段：强制终止
+        self.emit('log', server_id, "⚠️ 尝试强制终止服务器...")
+        handle._signal('kill')
+        if await self._wait_exit(handle, kill_timeout):
+            self.emit('log', server_id, "✅ 服务器已被强制终止")
+            return True
+
+        self.emit('log', server_id, "❌ 无法停止服务器进程")
+        return False
+
+    async def _wait_exit(self, handle, timeout):
+        try:
+            await asyncio.wait_for(handle.process.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def run_blocking(self, func, *args):
+        """在事件循环的线程池中执行阻塞操作（如文件清理），返回concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(self._run_blocking(func, *args), self.loop)
+
+    async def _run_blocking(self, func, *args):
+        return await self.loop.run_in_executor(None, func, *args)
+
+class ResourceSampler:
+    """
+    共享资源采样器
+    一个后台线程按固定间隔对所有运行中服务器的整个进程树做一次采样（psutil oneshot批量读取），
+    CPU、内存(RSS/USS)、线程数、句柄数和IO计数按进程树汇总，而不是只统计启动脚本的shell进程；
+    结果发布给任意数量的订阅者（监控窗口、状态栏、控制API），不再为每个监控窗口各开一个线程。
+    订阅回调在采样线程中执行，界面订阅者需要自行转交到UI线程。
+    """
+    DEFAULT_INTERVAL = 1.0
+    USS_EVERY = 5
+
+    def __init__(self, targets, interval=DEFAULT_INTERVAL):
+        """
+        :param targets: 返回 {服务器ID: 进程树根PID} 的可调用对象（只包含运行中的服务器）
+        :param interval: 采样间隔（秒）
+        """
+        self.targets = targets
+        self.interval = max(0.2, float(interval))
+        self.cpu_count = None  # 首次采样时获取（在采样线程中加载psutil）
+        self.sources = []  # 附加数据源，collect(服务器ID, 采样数据) 在采样线程中补充字段
+        self._procs = {}  # 服务器ID -> {PID: psutil.Process}
+        self._uss = {}
+        self._passes = 0
+        self._latest = {}
+        self._subscribers = {}
+        self._next_token = 0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """启动采样线程（重复调用无影响）"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="MSM-ResourceSampler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def subscribe(self, callback, server_id=None):
+        """
+        订阅采样结果
+        :param callback: callback(samples)，samples为 {服务器ID: 采样数据}
+        :param server_id: 只接收指定服务器的采样（为None时接收全部）
+        :return: 取消订阅用的令牌
+        """
+        with self._lock:
+            token = self._next_token
+            self._next_token += 1
+            self._subscribers[token] = (callback, server_id)
+        self.start()
+        return token
+
+    def unsubscribe(self, token):
+        with self._lock:
+            self._subscribers.pop(token, None)
+
+    def latest(self, server_id=None):
+        """最近一次采样结果（指定服务器时返回其采样数据或None）"""
+        with self._lock:
+            if server_id is None:
+                return dict(self._latest)
+            return self._latest.get(server_id)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            started = time.monotonic()
+            try:
+                self._publish(self.sample_once())
+            except Exception as e:
+                print(f"资源采样失败: {e}")
+            # 按固定节拍采样，扣除本轮采样耗时
+            self._stop_event.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def sample_once(self):
+        """对所有运行中的服务器采样一次，返回 {服务器ID: 采样数据}"""
+        targets = self.targets()
+        # 已停止的服务器不再保留进程对象
+        for server_id in list(self._procs):
+            if server_id not in targets:
+                del self._procs[server_id]
+                self._uss.pop(server_id, None)
+
+        self._passes += 1
+        if self.cpu_count is None:
+            self.cpu_count = psutil.cpu_count() or 1
+        total_memory = psutil.virtual_memory().total
+        now = time.time()
+        samples = {}
+        for server_id, pid in targets.items():
+            sample = self._sample_tree(server_id, pid)
+            if sample is None:
+                continue
+            sample['time'] = now
+            sample['memory_percent'] = sample['memory_rss'] / total_memory * 100 if total_memory else 0.0
+            for source in self.sources:
+                try:
+                    source.collect(server_id, sample)
+                except Exception as e:
+                    print(f"资源采样数据源失败: {e}")
+            samples[server_id] = sample
+        return samples
+
+    def _resolve_tree(self, server_id, pid):
+        """
+        解析服务器的整个进程树（启动脚本的shell及其启动的java等子进程）
+        同一进程沿用上一轮的Process对象，cpu_percent才能基于上次采样计算
+        """
+        known = self._procs.get(server_id)
+        if known is None or pid not in known:
+            try:
+                known = {pid: psutil.Process(pid)}
+            except psutil.Error:
+                self._procs.pop(server_id, None)
+                return None
+        root = known[pid]
+        try:
+            children = root.children(recursive=True)
+        except psutil.Error:
+            self._procs.pop(server_id, None)
+            return None
+        tree = {pid: root}
+        for child in children:
+            cached = known.get(child.pid)
+            # psutil按PID和创建时间比较，PID被复用时换成新对象
+            tree[child.pid] = cached if cached is not None and cached == child else child
+        self._procs[server_id] = tree
+        return tree
+
+    def _sample_tree(self, server_id, pid):
+        """对一个服务器的进程树采样并汇总"""
+        tree = self._resolve_tree(server_id, pid)
+        if tree is None:
+            return None
+        # USS需要读取完整内存映射，开销较大，每USS_EVERY轮采样一次
+        with_uss = self.USS_EVERY <= 1 or self._passes % self.USS_EVERY == 1
+        totals = {
+            'cpu_percent': 0.0, 'memory_rss': 0, 'memory_uss': None, 'num_threads': 0,
+            'num_handles': 0, 'io_read_bytes': 0, 'io_write_bytes': 0
+        }
+        uss = 0 if with_uss else None
+        alive = []
+        java_pid = None
+        for proc in tree.values():
+            try:
+                with proc.oneshot():
+                    if java_pid is None and 'java' in proc.name().lower():
+                        java_pid = proc.pid
+                    totals['cpu_percent'] += proc.cpu_percent(None)
+                    if uss is not None:
+                        try:
+                            info = proc.memory_full_info()
+                            uss += info.uss
+                        except psutil.AccessDenied:
+                            info = proc.memory_info()
+                            uss = None
+                    else:
+                        info = proc.memory_info()
+                    totals['memory_rss'] += info.rss
+                    totals['num_threads'] += proc.num_threads()
+                    totals['num_handles'] += self._num_handles(proc)
+                    io = self._io_counters(proc)
+                    if io is not None:
+                        totals['io_read_bytes'] += io.read_bytes
+                        totals['io_write_bytes'] += io.write_bytes
+            except psutil.NoSuchProcess:
+                continue
+            except psutil.Error:
+                pass
+            alive.append(proc.pid)
+        if pid not in alive:
+            self._procs.pop(server_id, None)
+            return None
+
+        if uss is not None:
+            self._uss[server_id] = uss
+        totals['memory_uss'] = uss if uss is not None else self._uss.get(server_id)
+        # 换算为整机CPU占比（0-100%），多核满载时不会超出图表范围
+        totals['cpu_percent'] /= self.cpu_count
+        totals['pid'] = pid
+        totals['java_pid'] = java_pid
+        totals['pids'] = alive
+        totals['process_count'] = len(alive)
+        return totals
+
+    @staticmethod
+    def _num_handles(proc):
+        """句柄数（Windows）或文件描述符数（其他系统）"""
+        try:
+            return proc.num_handles() if os.name == 'nt' else proc.num_fds()
+        except (psutil.AccessDenied, AttributeError):
+            return 0
+
+    @staticmethod
+    def _io_counters(proc):
+        try:
+            return proc.io_counters()
+        except (psutil.AccessDenied, AttributeError):
+            return None
+
+    def _publish(self, samples):
+        with self._lock:
+            self._latest = samples
+            subscribers = list(self._subscribers.values())
+        for callback, server_id in subscribers:
+            try:
+                if server_id is None:
+                    callback(samples)
+                else:
+                    callback({server_id: samples[server_id]} if server_id in samples else {})
+            except Exception as e:
+                print(f"资源采样订阅者处理失败: {e}")
+
+    @staticmethod
+    def format_bytes(size):
+        """格式化字节数"""
+        for unit in ('B', 'KB', 'MB'):
+            if size < 1024:
+                return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+            size /= 1024
+        return f"{size:.2f} GB"
+
+class JvmMetrics:
+    """
+    JVM指标来源（作为ResourceSampler的附加数据源，为采样数据补充堆、GC和tick时间）
+    - 从控制台输出解析 -Xlog:gc（JDK 9+）或 -verbose:gc（JDK 8）的GC暂停和堆占用
+    - 解析Paper的 /mspt、/tps 命令输出（可配置定期自动发送命令）
+    - 系统中有JDK的jstat时定期读取堆使用和累计GC时间（子进程异步运行，不阻塞采样线程）
+    """
+    # [info][gc] GC(12) Pause Young (Normal) (G1 Evacuation Pause) 120M->30M(512M) 5.123ms
+    GC_PAUSE_RE = re.compile(r'GC\(\d+\) Pause.*?(?:(\d+)([KMG])->(\d+)([KMG])\((\d+)([KMG])\) )?([\d.]+)ms\s*$')
+    # [GC (Allocation Failure) [PSYoungGen: ...] 123456K->45678K(987654K), 0.0123456 secs]
+    LEGACY_GC_RE = re.compile(r'\[(?:Full )?GC \(.*?(\d+)K->(\d+)K\((\d+)K\), ([\d.]+) secs\]')
+    # Paper /mspt: ◴ 3.2/1.0/5.6, 3.1/0.9/6.0, 3.3/0.8/12.4（最近5秒平均/最小/最大）
+    MSPT_RE = re.compile(r'◴\s*([\d.]+)/([\d.]+)/([\d.]+)')
+    # TPS from last 1m, 5m, 15m: 20.0, 20.0, 20.0（过载时带*号）
+    TPS_RE = re.compile(r'TPS from last 1m, 5m, 15m:\s*\*?([\d.]+)')
+    UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    # Minecraft每tick的时间预算（毫秒）
+    TICK_BUDGET_MS = 50.0
+
+    def __init__(self, write=None, jstat_interval=10, tick_command='', tick_interval=0):
+        """
+        :param write: write(服务器ID, 文本)，向服务器控制台写入（用于定期发送tick_command）
+        :param jstat_interval: jstat读取间隔（秒），为0或找不到jstat时不使用
+        :param tick_command: 定期发送的tick时间命令（如 mspt），为空时只解析手动执行的输出
+        :param tick_interval: 发送tick_command的间隔（秒），为0时不发送
+        """
+        self.write = write
+        self.jstat = shutil.which('jstat') if jstat_interval > 0 else None
+        self.jstat_interval = jstat_interval
+        self.tick_command = tick_command.strip()
+        self.tick_interval = tick_interval
+        self._servers = {}
+        self._lock = threading.Lock()
+
+    def _server(self, server_id):
+        state = self._servers.get(server_id)
+        if state is None:
+            state = self._servers[server_id] = {
+                'heap_used': None, 'heap_committed': None, 'gc_pause_ms': None, 'gc_time_ms': None,
+                'gc_log_seen': False, 'mspt': None, 'tps': None,
+                'jstat_process': None, 'jstat_at': 0.0, 'jstat_gct': None, 'tick_at': time.monotonic()
+            }
+        return state
+
+    def feed(self, server_id, lines):
+        """解析一批控制台输出"""
+        for line in lines:
+            if 'GC' not in line and '◴' not in line and 'TPS' not in line:
+                continue
+            line = clean_ansi_codes(line)
+            try:
+                self._parse_line(server_id, line)
+            except ValueError:
+                pass
+
+    def _parse_line(self, server_id, line):
+        match = self.GC_PAUSE_RE.search(line)
+        if match:
+            before, before_unit, after, after_unit, committed, committed_unit, pause = match.groups()
+            heap = None
+            if after:
+                heap = (int(after) * self.UNITS[after_unit], int(committed) * self.UNITS[committed_unit])
+            self._record_gc(server_id, float(pause), heap)
+            return
+        match = self.LEGACY_GC_RE.search(line)
+        if match:
+            before, after, committed, seconds = match.groups()
+            self._record_gc(server_id, float(seconds) * 1000, (int(after) * 1024, int(committed) * 1024))
+            return
+        match = self.MSPT_RE.search(line)
+        if match:
+            with self._lock:
+                self._server(server_id)['mspt'] = float(match.group(1))
+            return
+        match = self.TPS_RE.search(line)
+        if match:
+            with self._lock:
+                self._server(server_id)['tps'] = float(match.group(1))
+
+    def _record_gc(self, server_id, pause_ms, heap):
+        with self._lock:
+            state = self._server(server_id)
+            state['gc_log_seen'] = True
+            state['gc_pause_ms'] = max(state['gc_pause_ms'] or 0.0, pause_ms)
+            state['gc_time_ms'] = (state['gc_time_ms'] or 0.0) + pause_ms
+            if heap is not None and state['jstat_gct'] is None:
+                state['heap_used'], state['heap_committed'] = heap
+
+    def collect(self, server_id, sample):
+        """采样线程回调：把JVM指标合并到采样数据中（GC暂停和GC时间为自上次采样以来的值）"""
+        now = time.monotonic()
+        with self._lock:
+            state = self._server(server_id)
+            self._poll_jstat(state, sample.get('java_pid'), now)
+            send_tick = self.write and self.tick_command and self.tick_interval > 0 \
+                and now - state['tick_at'] >= self.tick_interval
+            if send_tick:
+                state['tick_at'] = now
+            for field in ('heap_used', 'heap_committed', 'gc_pause_ms', 'gc_time_ms', 'mspt', 'tps'):
+                sample[field] = state[field]
+            # 已有GC数据来源时，本次采样期间没有GC记为0
+            if state['gc_log_seen'] or state['jstat_gct'] is not None:
+                state['gc_pause_ms'] = 0.0 if state['gc_log_seen'] else None
+                state['gc_time_ms'] = 0.0
+        if send_tick:
+            try:
+                self.write(server_id, self.tick_command + "\n")
+            except Exception:
+                pass
+
+    def _poll_jstat(self, state, java_pid, now):
+        """检查上一次jstat是否完成，到期时启动下一次"""
+        process = state['jstat_process']
+        if process is not None:
+            if process.poll() is None:
+                return
+            state['jstat_process'] = None
+            output = process.communicate()[0]
+            if process.returncode == 0:
+                self._parse_jstat(state, output)
+        if not self.jstat or not java_pid or now - state['jstat_at'] < self.jstat_interval:
+            return
+        state['jstat_at'] = now
+        try:
+            state['jstat_process'] = subprocess.Popen(
+                [self.jstat, '-gc', str(java_pid)],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                stdin=subprocess.DEVNULL,
+                text=True,
+                creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+            )
+        except OSError as e:
+            print(f"⚠️ 无法运行jstat: {e}")
+            self.jstat = None
+
+    def _parse_jstat(self, state, output):
+        """解析 jstat -gc 输出（容量单位为KB，GCT为累计GC秒数）"""
+        lines = output.split()
+        half = len(lines) // 2
+        if half == 0:
+            return
+        columns = {}
+        for name, value in zip(lines[:half], lines[half:]):
+            try:
+                columns[name] = float(value)
+            except ValueError:
+                columns[name] = 0.0
+        used = sum(columns.get(name, 0.0) for name in ('S0U', 'S1U', 'EU', 'OU'))
+        committed = sum(columns.get(name, 0.0) for name in ('S0C', 'S1C', 'EC', 'OC'))
+        state['heap_used'] = int(used * 1024)
+        state['heap_committed'] = int(committed * 1024)
+        gct = columns.get('GCT')
+        if gct is not None:
+            if state['jstat_gct'] is not None and not state['gc_log_seen']:
+                state['gc_time_ms'] = (state['gc_time_ms'] or 0.0) + max(0.0, gct - state['jstat_gct']) * 1000
+            state['jstat_gct'] = gct
+
+    def forget(self, server_id):
+        """服务器退出后清除状态"""
+        with self._lock:
+            state = self._servers.pop(server_id, None)
+        if state and state['jstat_process'] is not None and state['jstat_process'].poll() is None:
+            state['jstat_process'].kill()
+
+class MetricsStore:
+    """
+    单个服务器的资源时间序列存储（位于服务器logs/msm-metrics目录）
+    每种分辨率（1s/1m/1h）一个只追加的定长记录文件（文件名带记录格式版本，如1s.v2.bin），
+    1m和1h由写入时累计的1s采样降采样得到；
+    查询时用mmap映射文件并按时间二分查找，不需要把整个文件读入内存。
+    超出保留时长的记录在文件增长到保留量的1.25倍时整体截掉。
+    关闭时写入的未满降采样桶在下次写入同一时间段时被替换为合并后的记录，不会重复。
+    """
+    RECORD = struct.Struct('<dffQQIIIQQQQffff')
+    # 记录格式版本，修改RECORD或FIELDS时递增；旧版本的文件无法按新格式解析，打开时删除
+    FORMAT_VERSION = 2
+    FIELDS = ('time', 'cpu_percent', 'memory_percent', 'memory_rss', 'memory_uss', 'num_threads',
+              'num_handles', 'process_count', 'io_read_bytes', 'io_write_bytes',
+              'heap_used', 'heap_committed', 'gc_pause_ms', 'gc_time_ms', 'mspt', 'tps')
+    FLOAT_FIELDS = frozenset(('time', 'cpu_percent', 'memory_percent', 'gc_pause_ms', 'gc_time_ms', 'mspt', 'tps'))
+    # 整数字段以0表示缺失，浮点字段以NaN表示缺失
+    OPTIONAL_FIELDS = frozenset(('memory_uss', 'heap_used', 'heap_committed'))
+    # 降采样方式：默认取平均值，累计计数取最后一次，GC暂停取最大值
+    ROLLUP_MODES = {'io_read_bytes': 'last', 'io_write_bytes': 'last', 'gc_pause_ms': 'max'}
+    # (名称, 间隔秒数, 保留秒数)
+    RESOLUTIONS = (
+        ('1s', 1, 2 * 86400),
+        ('1m', 60, 30 * 86400),
+        ('1h', 3600, 400 * 86400)
+    )
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self._files = {}
+        self._counts = {}
+        self._buckets = {}  # 分辨率 -> [桶起始时间, 采样数, 各字段累计值]
+        self._lock = threading.Lock()
+
+    def _path(self, resolution):
+        return self.directory / f"{resolution}.v{self.FORMAT_VERSION}.bin"
+
+    def _remove_legacy(self, resolution):
+        """删除旧格式版本的文件"""
+        for path in self.directory.glob(f"{resolution}.*bin"):
+            if path != self._path(resolution):
+                try:
+                    path.unlink()
+                    print(f"⚠️ 已删除旧格式的资源历史: {path}")
+                except OSError as e:
+                    print(f"删除旧格式的资源历史失败: {e}")
+
+    def _open(self, resolution):
+        """打开追加文件（截掉异常退出时写了一半的记录）"""
+        handle = self._files.get(resolution)
+        if handle is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._remove_legacy(resolution)
+            path = self._path(resolution)
+            size = path.stat().st_size if path.exists() else 0
+            if size % self.RECORD.size:
+                size -= size % self.RECORD.size
+                os.truncate(path, size)
+            handle = self._files[resolution] = open(path, 'ab')
+            self._counts[resolution] = size // self.RECORD.size
+        return handle
+
+    def _pack(self, values):
+        packed = []
+        for field, value in zip(self.FIELDS, values):
+            if field in self.FLOAT_FIELDS:
+                packed.append(float('nan') if value is None else float(value))
+            else:
+                packed.append(0 if value is None else int(value))
+        return self.RECORD.pack(*packed)
+
+    def _write(self, resolution, values):
+        handle = self._open(resolution)
+        handle.write(self._pack(values))
+        self._counts[resolution] += 1
+        for name, width, retention in self.RESOLUTIONS:
+            if name == resolution and self._counts[name] > retention // width * 5 // 4:
+                self._compact(name, retention // width)
+
+    def _compact(self, resolution, keep):
+        """只保留最新的keep条记录（写入临时文件后替换）"""
+        self._files.pop(resolution).close()
+        path = self._path(resolution)
+        temp_path = path.with_suffix('.tmp')
+        with open(path, 'rb') as source, open(temp_path, 'wb') as target:
+            source.seek(-keep * self.RECORD.size, os.SEEK_END)
+            shutil.copyfileobj(source, target)
+        os.replace(temp_path, path)
+        self._open(resolution)
+
+    def append(self, sample):
+        """写入一个1s采样，并更新1m/1h降采样"""
+        values = [sample.get(field) for field in self.FIELDS]
+        with self._lock:
+            self._write('1s', values)
+            for name, width, retention in self.RESOLUTIONS[1:]:
+                bucket_start = values[0] // width * width
+                bucket = self._buckets.get(name)
+                if bucket is not None and bucket[0] != bucket_start:
+                    self._write_bucket(name, bucket)
+                    bucket = None
+                if bucket is None:
+                    bucket = self._buckets[name] = self._resume_bucket(name, bucket_start, values[0])
+                self._accumulate(bucket, values)
+
+    def _accumulate(self, bucket, values):
+        totals, counts = bucket[1], bucket[2]
+        for index, (field, value) in enumerate(zip(self.FIELDS, values)):
+            if value is None:
+                continue
+            mode = self.ROLLUP_MODES.get(field)
+            if totals[index] is None or mode == 'last':
+                totals[index] = value
+            elif mode == 'max':
+                totals[index] = max(totals[index], value)
+            else:
+                totals[index] += value
+            counts[index] += 1
+
+    def _resume_bucket(self, resolution, bucket_start, before):
+        """
+        新建降采样桶；上次关闭时已写入同一时间段的未满桶时，删除该记录，
+        并用1s记录重新累计（1s记录已不存在时把该记录当作一个采样）
+        """
+        bucket = [bucket_start, [None] * len(self.FIELDS), [0] * len(self.FIELDS)]
+        handle = self._open(resolution)
+        count = self._counts[resolution]
+        if not count:
+            return bucket
+        handle.flush()
+        with open(self._path(resolution), 'rb') as f:
+            f.seek((count - 1) * self.RECORD.size)
+            trailing = self._decode(self.RECORD.unpack(f.read(self.RECORD.size)))
+        if trailing['time'] != bucket_start:
+            return bucket
+        handle.truncate((count - 1) * self.RECORD.size)
+        self._counts[resolution] = count - 1
+        samples = self._read('1s', bucket_start, before - 1e-6)
+        for sample in samples or [trailing]:
+            self._accumulate(bucket, [sample[field] for field in self.FIELDS])
+        return bucket
+
+    def _write_bucket(self, resolution, bucket):
+        """写入一个降采样桶"""
+        bucket_start, totals, counts = bucket
+        values = [
+            total if total is None or self.ROLLUP_MODES.get(field) else total / count
+            for field, total, count in zip(self.FIELDS, totals, counts)
+        ]
+        values[0] = bucket_start
+        self._write(resolution, values)
+
+    def flush(self):
+        with self._lock:
+            for handle in self._files.values():
+                handle.flush()
+
+    def close(self):
+        """写入未满的降采样桶并关闭文件"""
+        with self._lock:
+            for name, bucket in list(self._buckets.items()):
+                self._write_bucket(name, bucket)
+            self._buckets.clear()
+            for handle in self._files.values():
+                handle.close()
+            self._files.clear()
+
+    @classmethod
+    def pick_resolution(cls, start, end):
+        """按时间范围选择分辨率（范围内1s记录不超过1小时，1m记录不超过2天）"""
+        span = end - start
+        if span <= 3600:
+            return '1s'
+        if span <= 2 * 86400:
+            return '1m'
+        return '1h'
+
+    def query(self, start=None, end=None, resolution=None, limit=None):
+        """
+        按时间范围查询
+        :param start: 起始时间戳（默认最近1小时）
+        :param end: 结束时间戳（默认当前时间）
+        :param resolution: '1s' / '1m' / '1h'，为None时按范围自动选择
+        :param limit: 最多返回的记录数（超出时等间隔抽取）
+        :return: 记录字典列表（按时间升序）
+        """
+        end = time.time() if end is None else end
+        start = end - 3600 if start is None else start
+        resolution = resolution or self.pick_resolution(start, end)
+        if resolution not in {name for name, width, retention in self.RESOLUTIONS}:
+            raise ValueError(f"不支持的分辨率: {resolution}")
+
+        with self._lock:
+            return self._read(resolution, start, end, limit)
+
+    def _read(self, resolution, start, end, limit=None):
+        """读取时间范围内的记录（调用者持有self._lock）"""
+        path = self._path(resolution)
+        size = self.RECORD.size
+        handle = self._files.get(resolution)
+        if handle is not None:
+            handle.flush()
+        if not path.exists() or path.stat().st_size < size:
+            return []
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            count = len(data) // size
+
+            def time_at(index):
+                return struct.unpack_from('<d', data, index * size)[0]
+
+            def lower_bound(value):
+                low, high = 0, count
+                while low < high:
+                    middle = (low + high) // 2
+                    if time_at(middle) < value:
+                        low = middle + 1
+                    else:
+                        high = middle
+                return low
+
+            first = lower_bound(start)
+            last = lower_bound(end + 1e-6)
+            step = max(1, -(-(last - first) // limit)) if limit else 1
+            records = [self.RECORD.unpack_from(data, index * size) for index in range(first, last, step)]
+
+        return [self._decode(record) for record in records]
+
+    def _decode(self, record):
+        """把一条记录转换为字典（缺失值为None）"""
+        item = dict(zip(self.FIELDS, record))
+        for field in self.OPTIONAL_FIELDS:
+            item[field] = item[field] or None
+        for field in self.FLOAT_FIELDS:
+            if item[field] != item[field]:
+                item[field] = None
+        return item
+
+class ConfigStore:
+    """
+    MSM.ini的内存配置和延迟写入
+    修改只标记为脏并推迟写入时间，最后一次修改后delay秒内没有新修改才由后台线程写一次，
+    连续的修改（如逐字输入路径）合并为一次写入；flush()立即写入，退出时也会自动调用。
+    写入使用临时文件 + fsync + os.replace，任何时刻磁盘上都是完整的旧文件或新文件。
+    config 只读：写入时在副本上生成新配置再整体替换，其他线程读到的总是完整的配置。
+    关闭了%插值，路径中的%按原样保存。
+    """
+    DEFAULT_DELAY = 1.0
+
+    def __init__(self, path, delay=DEFAULT_DELAY):
+        self.path = Path(path)
+        self.delay = delay
+        self.config = configparser.ConfigParser(interpolation=None)
+        if self.path.exists():
+            try:
+                self.config.read(self.path, encoding='utf-8')
+            except Exception as e:
+                print(f"读取配置文件失败: {e}")
+                self.config = configparser.ConfigParser(interpolation=None)
+        self._providers = {}  # 配置节 -> 写入时生成该节内容的函数（返回None时保留原内容）
+        self._dirty = False
+        self._deadline = 0.0
+        self._closed = False
+        self._thread = None
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        atexit.register(self.close)
+
+    def set_provider(self, section, provider):
+        """注册写入时才生成的配置节（耗时的检查只在真正写入时做一次）"""
+        with self._cond:
+            self._providers[section] = provider
+
+    def mark_dirty(self):
+        """标记配置已修改，推迟到delay秒后写入"""
+        with self._cond:
+            if self._closed:
+                return
+            self._dirty = True
+            self._deadline = time.monotonic() + self.delay
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="MSM-ConfigStore", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        """后台写入线程：等待修改停止delay秒后写入"""
+        with self._cond:
+            while not self._closed:
+                if not self._dirty:
+                    self._cond.wait()
+                    continue
+                remaining = self._deadline - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                self._cond.release()
+                try:
+                    self.flush()
+                except Exception as e:
+                    # 写入线程不能退出，否则之后的修改再也不会保存
+                    print(f"❌ 保存配置失败: {e}")
+                finally:
+                    self._cond.acquire()
+
+    def flush(self):
+        """
+        立即写入未保存的修改
+        :return: 是否写入了文件
+        """
+        with self._write_lock:
+            with self._cond:
+                if not self._dirty:
+                    return False
+                self._dirty = False
+                providers = list(self._providers.items())
+                current = self.config
+            try:
+                # 在副本上生成新配置，失败时当前配置保持不变
+                buffer = io.StringIO()
+                current.write(buffer)
+                config = configparser.ConfigParser(interpolation=None)
+                config.read_string(buffer.getvalue())
+                for section, provider in providers:
+                    values = provider()
+                    if values is not None:
+                        config[section] = values
+                buffer = io.StringIO()
+                config.write(buffer)
+                with self._cond:
+                    self.config = config
+                self._write(buffer.getvalue())
+            except Exception as e:
+                print(f"❌ 保存配置失败: {e}")
+                with self._cond:
+                    # 稍后重试（退出时也会再次尝试）
+                    self._dirty = True
+                    self._deadline = time.monotonic() + max(self.delay, 5)
+                return False
+        return True
+
+    def _write(self, text):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = self.path.with_name(self.path.name + ".tmp")
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, self.path)
+
+    def close(self):
+        """写入未保存的修改并停止后台线程（可重复调用）"""
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+class ServerEngine:
+    """
+    服务器管理核心（不依赖Tk）
+    负责MSM.ini中的服务器列表、服务器进程的启动/停止/重启和命令发送。
+    图形界面和 --daemon 模式的控制API都是它的客户端，
+    客户端需要在自己的线程中循环处理 self.events 中的事件（见 dispatch / process_events）。
+    """
+    CONSOLE_HISTORY_LINES = 1000
+    PID_FILE_NAME = "msm.pid"
+    RESTART_DELAY = 2
+
+    # 服务器状态：已停止 → 启动中 → 运行中 → 停止中 → 已停止
+    STOPPED = 'stopped'
+    STARTING = 'starting'
+    RUNNING = 'running'
+    STOPPING = 'stopping'
+    STATE_LABELS = {
+        STOPPED: "已停止",
+        STARTING: "启动中",
+        RUNNING: "运行中",
+        STOPPING: "停止中"
+    }
+    # 启动前预检的锁文件（相对服务器目录）
+    LOCK_FILES = (
+        "session.lock",
+        "world/session.lock",
+        "world_nether/session.lock",
+        "world_the_end/session.lock",
+        "level.dat.lock",
+        "level.dat_old.lock"
+    )
+
+    def __init__(self, msm_dir=None, process_control=None):
+        # 配置目录和文件
+        self.msm_dir = Path(msm_dir) if msm_dir else Path.home() / ".msm"
+        self.msm_dir.mkdir(parents=True, exist_ok=True)
+        self.config_file = self.msm_dir / "MSM.ini"
+
+        # 配置在内存中修改，合并后延迟写入（延迟可在MSM.ini的[General]节中配置）
+        self.store = ConfigStore(self.config_file)
+        self.store.delay = self.config.getint('General', 'save_delay_ms', fallback=1000) / 1000
+        self._server_paths = None  # 待写入的服务器列表，None表示保留配置中原有的
+        self.store.set_provider('Servers', self._servers_section)
+
+        # 服务器输出读取参数（可在MSM.ini的[Console]节中配置）
+        self.console_encoding = self.config.get('Console', 'encoding', fallback='')
+        self.console_encoding_errors = self.config.get('Console', 'encoding_errors', fallback='replace')
+        self.output_read_size = self.config.getint('Console', 'read_chunk_size', fallback=65536)
+        self.console_history_lines = self.config.getint('Console', 'history_lines', fallback=self.CONSOLE_HISTORY_LINES)
+
+        # 进程监管器：所有服务器进程共用一个asyncio事件循环，事件经队列交给客户端线程
+        self.events = queue.Queue()
+        self.process_control = process_control or ProcessControl()
+        self.supervisor = ProcessSupervisor(self.events, read_size=self.output_read_size,
+                                            process_control=self.process_control)
+        self.processes = {}
+        self.history = {}
+        self.states = {}
+        self._restarting = set()
+        # 资源采样器：所有运行中服务器共用一个采样线程（间隔可在MSM.ini的[Monitor]节中配置）
+        self.sampler = ResourceSampler(
+            self._sample_targets,
+            interval=self.config.getfloat('Monitor', 'sample_interval', fallback=ResourceSampler.DEFAULT_INTERVAL)
+        )
+        # JVM指标：GC日志、/mspt输出和jstat，合并到资源采样中
+        self.jvm_metrics = JvmMetrics(
+            write=self.write,
+            jstat_interval=self.config.getint('Monitor', 'jstat_interval', fallback=10),
+            tick_command=self.config.get('Monitor', 'tick_command', fallback='mspt'),
+            tick_interval=self.config.getint('Monitor', 'tick_interval', fallback=0)
+        )
+        self.sampler.sources.append(self.jvm_metrics)
+        # 资源历史：采样线程写入各服务器目录下的时间序列文件
+        self.metrics = {}
+        self._metrics_lock = threading.Lock()
+        if self.config.getboolean('Monitor', 'metrics', fallback=True):
+            self.sampler.subscribe(self._record_metrics)
+        self._start_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._history_lock = threading.Lock()
+
+    # ---------- 配置 ----------
+
+    @property
+    def config(self):
+        """当前配置（只读，写入时会整体替换，需要多次读取时先取到局部变量）"""
+        return self.store.config
+
+    def load_server_paths(self):
+        """读取MSM.ini中的服务器列表，返回 [(键, 路径)]（跳过不存在的路径）"""
+        # 先写入尚未保存的修改，内存中的配置与文件一致
+        self.store.flush()
+        config = self.config
+        if not config.sections() and not self.config_file.exists():
+            print("⚠️ 配置文件不存在，跳过加载")
+            return []
+
+        if 'Servers' not in config:
+            print("⚠️ 配置文件中没有Servers节")
+            return []
+
+        # 收集所有server_开头的键，按数字排序
+        server_keys = [key for key in config['Servers'] if key.startswith('server_')]
+        server_keys.sort(key=lambda x: int(x.split('_')[1]) if '_' in x and x.split('_')[1].isdigit() else 0)
+
+        servers = []
+        for key in server_keys:
+            path = config['Servers'][key]
+            if not path or not Path(path).exists():
+                print(f"⚠️ 路径不存在，跳过 {key}: {path}")
+                continue
+            servers.append((key, path))
+        return servers
+
+    def save_server_paths(self, paths):
+        """
+        更新服务器列表（保留其他配置节），由配置存储合并后延迟写入MSM.ini
+        列表未变化时不会写入；路径是否存在在真正写入时才检查。
+        :return: 列表中的服务器数量
+        """
+        paths = [str(path) if path else '' for path in paths]
+        if paths != self._server_paths:
+            self._server_paths = paths
+            self.store.mark_dirty()
+        return sum(1 for path in paths if path)
+
+    def _servers_section(self):
+        """写入时生成[Servers]节（跳过不存在的路径）"""
+        paths = self._server_paths
+        if paths is None:
+            return None
+        section = {}
+        for i, path in enumerate(paths):
+            if path and Path(path).exists():
+                section[f'server_{i}'] = path
+        print(f"✅ 已保存 {len(section)} 个服务器配置")
+        return section
+
+    def flush_config(self):
+        """立即写入未保存的配置（退出前调用）"""
+        self.store.flush()
+
+    def load_server_settings(self, server_path):
+        """读取服务器目录中的msm_config.json（不存在时返回空字典）"""
+        if not server_path:
+            return {}
+        config_path = Path(server_path) / "msm_config.json"
+        try:
+            with open(config_path, 'r', encoding='utf-8') as f:
+                settings = json.load(f)
+            return settings if isinstance(settings, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            print(f"⚠️ 读取服务器配置失败 {config_path}: {e}")
+            return {}
+
+    # ---------- 进程生命周期 ----------
+
+    def build_launch_command(self, server_path):
+        """
+        查找启动脚本或核心文件
+        Windows使用start.bat，Linux等系统使用start.sh，没有可用脚本时直接运行JAR
+        :return: (参数列表, 显示用命令) ，找不到时返回None
+        """
+        server_path = Path(server_path)
+        start_script = server_path / START_SCRIPT_NAME
+        core_files = list(server_path.glob("*.jar"))
+
+        if start_script.exists():
+            # 使用启动脚本
+            if os.name == 'nt':
+                return [os.environ.get('COMSPEC', 'cmd.exe'), '/c', str(start_script)], str(start_script)
+            return ['sh', str(start_script)], str(start_script)
+        if core_files:
+            # 使用找到的第一个JAR文件
+            return ['java', '-jar', core_files[0].name], f'java -jar "{core_files[0].name}"'
+        return None
+
+    def create_decoder(self, server_path):
+        """创建输出解码器（编码可在msm_config.json或MSM.ini中配置）"""
+        server_settings = self.load_server_settings(server_path)
+        return OutputLineDecoder(
+            encoding=server_settings.get('console_encoding') or self.console_encoding,
+            errors=server_settings.get('console_encoding_errors') or self.console_encoding_errors
+        )
+
+    def is_running(self, server_id):
+        process = self.processes.get(server_id)
+        return process is not None and process.poll() is None
+
+    # ---------- 状态机 ----------
+
+    def state(self, server_id):
+        return self.states.get(server_id, self.STOPPED)
+
+    def _set_state(self, server_id, state):
+        """设置服务器状态，并通知客户端（('state', id, 状态)事件）"""
+        with self._state_lock:
+            if self.states.get(server_id, self.STOPPED) == state:
+                return
+            self.states[server_id] = state
+        self.supervisor.emit('state', server_id, state)
+
+    def _transition(self, server_id, allowed, state):
+        """仅当当前状态在allowed中时切换到state，否则抛出RuntimeError"""
+        with self._state_lock:
+            current = self.states.get(server_id, self.STOPPED)
+            if current not in allowed:
+                raise RuntimeError(f"服务器当前状态为「{self.STATE_LABELS[current]}」")
+            self.states[server_id] = state
+        self.supervisor.emit('state', server_id, state)
+
+    # ---------- 进程生命周期 ----------
+
+    def start(self, server_id, server_path):
+        """
+        启动服务器进程（会阻塞到进程创建完成，界面请使用start_async）
+        :return: (ManagedProcess, 显示用命令)
+        """
+        with self._start_lock:
+            if self.is_running(server_id):
+                raise RuntimeError("服务器已经在运行中")
+            launch = self.build_launch_command(server_path)
+            if not launch:
+                raise FileNotFoundError("未找到启动脚本或核心文件")
+            args, cmd = launch
+            process = self.supervisor.spawn(server_id, args, str(server_path), self.create_decoder(server_path))
+            self.processes[server_id] = process
+        self._write_pid_file(server_path, process.pid)
+        self._set_state(server_id, self.RUNNING)
+        return process, cmd
+
+    def start_async(self, server_id, server_path, prepare=None):
+        """
+        已停止 → 启动中 → 运行中，清理和进程创建都在后台线程中执行
+        :param prepare: 启动前在后台线程中调用的 prepare(server_id, server_path)，默认只清理预检发现的残留进程
+        :return: concurrent.futures.Future（结果为ManagedProcess，失败时为异常）
+        """
+        self._transition(server_id, (self.STOPPED,), self.STARTING)
+        return self.supervisor.run_blocking(self._start_worker, server_id, server_path, prepare)
+
+    def _start_worker(self, server_id, server_path, prepare):
+        try:
+            (prepare or self.prepare_start)(server_id, server_path)
+            process, cmd = self.start(server_id, server_path)
+            self.supervisor.emit('log', server_id, f"✅ 服务器已启动: {cmd}")
+            return process
+        except Exception as e:
+            self._set_state(server_id, self.STOPPED)
+            self.supervisor.emit('log', server_id, f"❌ 启动失败: {str(e)}")
+            raise
+
+    def prepare_start(self, server_id, server_path):
+        """默认的启动前准备：预检发现残留时终止该服务器的残留进程"""
+        issues = self.preflight(server_path)
+        for issue in issues:
+            self.supervisor.emit('log', server_id, f"⚠️ {issue}")
+        if issues:
+            self.kill_leftover_processes(server_path)
+
+    def write(self, server_id, text):
+        """按服务器输出编码向进程标准输入写入文本"""
+        process = self.processes.get(server_id)
+        if process is None or process.poll() is not None:
+            raise RuntimeError("服务器未在运行")
+        process.write(process.decoder.encode(text))
+
+    def send_command(self, server_id, command):
+        """向服务器发送一条控制台命令"""
+        self.write(server_id, command + "\n")
+        self._append_history(server_id, [f"{time.strftime('[%H:%M:%S]')} [Command] {command}"])
+
+    def stop(self, server_id, graceful_timeout=15, terminate_timeout=5, kill_timeout=2):
+        """
+        运行中 → 停止中 → 已停止：发送stop命令并等待退出（超时后依次terminate、kill）
+        :return: concurrent.futures.Future（结果为是否已停止），服务器未运行时返回None
+        """
+        if not self.is_running(server_id):
+            return None
+        process = self.processes[server_id]
+        self._transition(server_id, (self.RUNNING,), self.STOPPING)
+        try:
+            self.write(server_id, "stop\n")
+        except Exception:
+            self._set_state(server_id, self.RUNNING)
+            raise
+
+        def on_done(f):
+            try:
+                stopped = f.result()
+            except Exception as e:
+                self.supervisor.emit('log', server_id, f"❌ 停止过程中发生错误: {str(e)}")
+                stopped = False
+            self._set_state(server_id, self.STOPPED if stopped else self.RUNNING)
+
+        future = self.supervisor.wait_for_stop(process, graceful_timeout, terminate_timeout, kill_timeout)
+        future.add_done_callback(on_done)
+        return future
+
+    def restart(self, server_id, server_path, prepare=None):
+        """
+        运行中 → 停止中 → 启动中 → 运行中，等待都在事件循环中完成，不阻塞调用线程
+        :return: concurrent.futures.Future（结果为新的ManagedProcess，失败时为None）
+        """
+        if not self.is_running(server_id):
+            return self.start_async(server_id, server_path, prepare)
+        process = self.processes[server_id]
+        self._transition(server_id, (self.RUNNING,), self.STOPPING)
+        try:
+            self.write(server_id, "stop\n")
+        except Exception:
+            self._set_state(server_id, self.RUNNING)
+            raise
+        self._restarting.add(server_id)
+        return asyncio.run_coroutine_threadsafe(
+            self._restart(server_id, server_path, process, prepare),
+            self.supervisor.loop
+        )
+
+    async def _restart(self, server_id, server_path, process, prepare):
+        try:
+            # 等待停止（超时后直接强制终止）
+            stopped = await self.supervisor._wait_for_stop(process, 20, 0, 2)
+            if not stopped:
+                self._set_state(server_id, self.RUNNING)
+                self.supervisor.emit('log', server_id, "❌ 重启失败: 停止服务器失败")
+                return None
+
+            # 等待资源释放（在事件循环中等待，不占用线程）
+            self.supervisor.emit('log', server_id, "⏳ 准备重新启动服务器...")
+            await asyncio.sleep(self.RESTART_DELAY)
+            self._set_state(server_id, self.STARTING)
+        finally:
+            self._restarting.discard(server_id)
+
+        try:
+            return await self.supervisor.loop.run_in_executor(
+                None, self._start_worker, server_id, server_path, prepare
+            )
+        except Exception:
+            return None
+
+    def stop_all(self, timeout=30):
+        """停止所有正在运行的服务器（阻塞，用于无界面模式退出）"""
+        futures = []
+        for server_id in list(self.processes):
+            try:
+                future = self.stop(server_id)
+            except Exception as e:
+                print(f"停止服务器 {server_id} 失败: {e}")
+                continue
+            if future:
+                futures.append(future)
+        for future in futures:
+            try:
+                future.result(timeout)
+            except Exception as e:
+                print(f"等待服务器停止失败: {e}")
+
+    # ---------- 残留进程 ----------
+
+    def _write_pid_file(self, server_path, pid):
+        """在服务器目录记录进程PID，异常退出后下次启动可据此找到残留进程"""
+        proc = self.process_control.process(pid)
+        try:
+            create_time = proc.create_time() if proc else None
+        except psutil.Error:
+            create_time = None
+        try:
+            with open(Path(server_path) / self.PID_FILE_NAME, 'w', encoding='utf-8') as f:
+                json.dump({'pid': pid, 'create_time': create_time}, f)
+        except Exception as e:
+            print(f"⚠️ 写入PID文件失败: {e}")
+
+    def _remove_pid_file(self, server_path):
+        if not server_path:
+            return
+        try:
+            (Path(server_path) / self.PID_FILE_NAME).unlink()
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️ 删除PID文件失败: {e}")
+
+    def _recorded_process(self, server_path):
+        """PID文件记录的进程（PID已被其他进程复用时返回None）"""
+        try:
+            with open(Path(server_path) / self.PID_FILE_NAME, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+            return self.process_control.process(int(record['pid']), record.get('create_time'))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"⚠️ 读取PID文件失败: {e}")
+            return None
+
+    def _managed_pids(self):
+        """当前由本程序管理且正在运行的所有进程（含子进程）的PID"""
+        pids = set()
+        for process in list(self.processes.values()):
+            if process.poll() is None:
+                pids.update(self.process_control.tree_pids(process.pid))
+        return pids
+
+    def find_leftover_processes(self, server_path):
+        """
+        查找属于某个服务器目录的残留进程：
+        PID文件记录的进程树，以及工作目录或命令行位于该目录的Java进程。
+        本程序正在管理的进程不会被包含。
+        """
+        found = {}
+        recorded = self._recorded_process(server_path)
+        if recorded is not None:
+            for proc in self.process_control.tree(recorded):
+                found[proc.pid] = proc
+        for proc in self.process_control.find_by_directory(server_path):
+            found.setdefault(proc.pid, proc)
+
+        managed = self._managed_pids()
+        return [proc for pid, proc in found.items() if pid not in managed and pid != os.getpid()]
+
+    @staticmethod
+    def _is_file_locked(path):
+        """锁文件是否仍被某个进程持有（Minecraft正常退出后锁文件会保留，但锁已释放）"""
+        try:
+            fd = os.open(str(path), os.O_RDWR)
+        except PermissionError:
+            return True
+        except OSError:
+            return False
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                fcntl.lockf(fd, fcntl.LOCK_UN)
+            return False
+        except OSError:
+            return True
+        finally:
+            os.close(fd)
+
+    def preflight(self, server_path):
+        """
+        启动前快速检查：只查看已知锁文件和PID文件，不扫描进程列表
+        :return: 发现的问题列表，为空表示目录干净，可以直接启动
+        """
+        issues = []
+        recorded = self._recorded_process(server_path)
+        if recorded is not None and recorded.pid not in self._managed_pids():
+            issues.append(f"上次启动的进程仍在运行 (PID {recorded.pid})")
+
+        for name in self.LOCK_FILES:
+            lock_file = Path(server_path) / name
+            if lock_file.exists() and self._is_file_locked(lock_file):
+                issues.append(f"锁文件被占用: {name}")
+        return issues
+
+    def kill_leftover_processes(self, server_path, timeout=5):
+        """
+        终止某个服务器目录的残留进程（先terminate，超时后kill），不影响其他服务器
+        :return: 被终止的进程数量
+        """
+        procs = self.find_leftover_processes(server_path)
+        if not procs:
+            return 0
+        for proc in procs:
+            print(f"⚠️ 发现残留进程 PID {proc.pid}，尝试终止...")
+        alive = self.process_control.terminate(procs, timeout=timeout)
+        for proc in alive:
+            print(f"❌ 无法终止进程 PID {proc.pid}")
+
+        self._remove_pid_file(server_path)
+        return len(procs) - len(alive)
+
+    def kill_processes_holding(self, file_path, timeout=5):
+        """终止打开了指定文件的Java进程（本程序正在管理的进程除外）"""
+        managed = self._managed_pids()
+        holders = [proc for proc in self.process_control.find_file_holders(file_path) if proc.pid not in managed]
+        for proc in holders:
+            print(f"🔫 终止占用文件的进程 PID: {proc.pid}")
+        alive = self.process_control.terminate(holders, timeout=timeout)
+        return len(holders) - len(alive)
+
+    def status(self, server_id):
+        """服务器运行状态"""
+        process = self.processes.get(server_id)
+        running = process is not None and process.poll() is None
+        return {
+            'running': running,
+            'pid': process.pid if running else None,
+            'exit_code': process.returncode if process is not None and not running else None
+        }
+
+    def _sample_targets(self):
+        """资源采样目标：运行中服务器的进程PID"""
+        return {
+            server_id: process.pid
+            for server_id, process in list(self.processes.items())
+            if process.poll() is None
+        }
+
+    def metrics_store(self, server_path):
+        """获取服务器目录对应的资源历史存储"""
+        key = os.path.normcase(os.path.abspath(str(server_path)))
+        with self._metrics_lock:
+            store = self.metrics.get(key)
+            if store is None:
+                store = self.metrics[key] = MetricsStore(Path(server_path) / "logs" / "msm-metrics")
+            return store
+
+    def _record_metrics(self, samples):
+        """采样器订阅回调：写入资源历史"""
+        for server_id, sample in samples.items():
+            process = self.processes.get(server_id)
+            if process is None or not process.cwd:
+                continue
+            try:
+                self.metrics_store(process.cwd).append(sample)
+            except Exception as e:
+                print(f"写入资源历史失败: {e}")
+
+    def query_metrics(self, server_path, start=None, end=None, resolution=None, limit=None):
+        """按时间范围查询服务器的资源历史（参数见MetricsStore.query）"""
+        return self.metrics_store(server_path).query(start, end, resolution, limit)
+
+    def close_metrics(self):
+        with self._metrics_lock:
+            stores = list(self.metrics.values())
+        for store in stores:
+            try:
+                store.close()
+            except Exception as e:
+                print(f"关闭资源历史失败: {e}")
+
+    # ---------- 事件与输出历史 ----------
+
+    def dispatch(self, kind, server_id, payload):
+        """处理一个监管器事件：记录输出历史、执行回调"""
+        if kind == 'output':
+            timestamp, lines = payload
+            self._append_history(server_id, [f"{timestamp} {line.strip()}" for line in lines])
+            self.jvm_metrics.feed(server_id, lines)
+        elif kind == 'log':
+            self._append_history(server_id, [payload])
+        elif kind == 'exit':
+            self._remove_pid_file(payload.cwd)
+            if payload.cwd:
+                self.metrics_store(payload.cwd).close()
+            self.jvm_metrics.forget(server_id)
+            self._append_history(server_id, [f"💡 服务器已退出，退出代码: {payload.returncode}"])
+            # 进程意外退出（崩溃或在控制台输入stop）时回到已停止；重启过程中由重启流程负责状态
+            if server_id not in self._restarting and not self.is_running(server_id):
+                if self.state(server_id) in (self.RUNNING, self.STOPPING):
+                    self._set_state(server_id, self.STOPPED)
+        elif kind == 'call':
+            payload()
+
+    def process_events(self, timeout=0.5, callback=None):
+        """等待并处理队列中的事件（无界面模式在主线程中循环调用）"""
+        try:
+            event = self.events.get(timeout=timeout)
+        except queue.Empty:
+            return
+        while True:
+            try:
+                self.dispatch(*event)
+                if callback:
+                    callback(*event)
+            except Exception as e:
+                print(f"处理进程事件失败: {e}")
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                return
+
+    def _append_history(self, server_id, lines):
+        with self._history_lock:
+            history = self.history.get(server_id)
+            if history is None:
+                history = self.history[server_id] = deque(maxlen=self.console_history_lines)
+            history.extend(lines)
+
+    def recent_output(self, server_id, lines=100):
+        """最近的控制台输出"""
+        with self._history_lock:
+            history = list(self.history.get(server_id, ()))
+        return history[-lines:] if lines > 0 else history
+
+class ControlAPI:
+    """
+    --daemon 模式的本地JSON控制接口（只监听本机地址）
+    GET  /servers                      服务器列表和状态
+    GET  /servers/<id>                 单个服务器状态（含最近一次资源采样）
+    GET  /servers/<id>/console?lines=N 最近的控制台输出
+    GET  /servers/<id>/metrics?start=&end=&resolution=&limit=  资源历史（时间戳为秒）
+    POST /servers                      {"path": ...} 添加已有服务器
+    POST /servers/batch                按模板批量创建服务器（字段见ServerProvisioner；必须设置token）
+    POST /servers/<id>/start|stop|restart
+    POST /servers/<id>/command         {"command": ...}
+    <id> 可以是服务器ID（如server_0）或服务器目录名。
+    MSM.ini的[Daemon]节中设置token后，请求需携带 Authorization: Bearer <token>；
+    未设置token时只能监听本机地址。
+    防止网页跨站调用：POST必须使用 Content-Type: application/json，带Origin头的请求一律拒绝，
+    未设置token时Host必须是本机地址（防DNS重绑定）。
+    """
+    def __init__(self, engine, host='127.0.0.1', port=25580, token='', provisioner=None):
+        self.engine = engine
+        self.token = token
+        self.provisioner = provisioner
+        self.servers = dict(engine.load_server_paths())
+        self._servers_lock = threading.Lock()
+        self._provision_lock = threading.Lock()  # 批量创建逐个进行，避免分配到相同的端口和目录
+        self.httpd = ThreadingHTTPServer((host, port), _ControlRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.api = self
+
+    def serve_in_background(self):
+        threading.Thread(target=self.httpd.serve_forever, name="MSM-ControlAPI", daemon=True).start()
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def resolve(self, ref):
+        """按服务器ID或目录名查找服务器，返回 (ID, 路径)"""
+        with self._servers_lock:
+            if ref in self.servers:
+                return ref, self.servers[ref]
+            for server_id, path in self.servers.items():
+                if Path(path).name == ref:
+                    return server_id, path
+        return None, None
+
+    def describe(self, server_id, path):
+        info = {'id': server_id, 'name': Path(path).name, 'path': path, 'state': self.engine.state(server_id)}
+        info.update(self.engine.status(server_id))
+        info['resources'] = self.engine.sampler.latest(server_id) if info['running'] else None
+        return info
+
+    def add_server(self, path):
+        """添加已有服务器目录并保存到MSM.ini"""
+        server_path = Path(path)
+        if not server_path.is_dir():
+            raise FileNotFoundError("服务器路径不存在")
+        with self._servers_lock:
+            for server_id, existing in self.servers.items():
+                if Path(existing) == server_path:
+                    return server_id
+            index = 0
+            while f"server_{index}" in self.servers:
+                index += 1
+            server_id = f"server_{index}"
+            self.servers[server_id] = str(server_path)
+            paths = [self.servers.get(f"server_{i}", '') for i in range(max(self._index(k) for k in self.servers) + 1)]
+        self.engine.save_server_paths(paths)
+        return server_id
+
+    def provision(self, template):
+        """按模板批量创建服务器（阻塞到全部完成），成功的服务器加入列表"""
+        if self.provisioner is None:
+            raise RuntimeError("批量创建不可用")
+        with self._provision_lock:
+            with self._servers_lock:
+                paths = list(self.servers.values())
+            template = dict(template)
+            template['reserved_ports'] = set(template.get('reserved_ports') or ()) | ServerProvisioner.used_ports(paths)
+            results = self.provisioner.provision(template)
+            for result in results:
+                if result['ok']:
+                    result['id'] = self.add_server(result['path'])
+        return 201, {'servers': results}
+
+    @staticmethod
+    def _index(server_id):
+        suffix = server_id.split('_')[-1]
+        return int(suffix) if suffix.isdigit() else 0
+
+    def handle(self, method, path, query, body):
+        """
+        处理一个API请求
+        :return: (HTTP状态码, 响应数据)
+        """
+        parts = [unquote(p) for p in path.strip('/').split('/') if p]
+        if not parts or parts[0] != 'servers':
+            return 404, {'error': '未知的接口'}
+
+        if len(parts) == 1:
+            if method == 'GET':
+                with self._servers_lock:
+                    servers = list(self.servers.items())
+                return 200, {'servers': [self.describe(sid, p) for sid, p in servers]}
+            if method == 'POST':
+                server_id = self.add_server(body.get('path', ''))
+                return 201, self.describe(server_id, self.servers[server_id])
+            return 405, {'error': '不支持的请求方法'}
+
+        if parts[1:] == ['batch']:
+            if method != 'POST':
+                return 405, {'error': '不支持的请求方法'}
+            # 可在任意路径写入并执行启动脚本，无论监听地址如何都必须设置token
+            if not self.token:
+                return 403, {'error': '批量创建需要在MSM.ini的[Daemon]节中设置token'}
+            return self.provision(body)
+
+        server_id, server_path = self.resolve(parts[1])
+        if server_id is None:
+            return 404, {'error': f"服务器不存在: {parts[1]}"}
+        action = parts[2] if len(parts) > 2 else ''
+
+        if method == 'GET':
+            if action == '':
+                return 200, self.describe(server_id, server_path)
+            if action == 'console':
+                lines = int(query.get('lines', ['100'])[0])
+                return 200, {'id': server_id, 'lines': self.engine.recent_output(server_id, lines)}
+            if action == 'metrics':
+                def param(name, cast):
+                    value = query.get(name, [''])[0]
+                    return cast(value) if value else None
+                records = self.engine.query_metrics(
+                    server_path, param('start', float), param('end', float),
+                    param('resolution', str), param('limit', int)
+                )
+                return 200, {'id': server_id, 'fields': list(MetricsStore.FIELDS), 'records': records}
+            return 404, {'error': '未知的接口'}
+
+        if method != 'POST':
+            return 405, {'error': '不支持的请求方法'}
+        if action == 'start':
+            # 只有预检发现残留时才执行清理（见ServerEngine.prepare_start）
+            self.engine.start_async(server_id, server_path).result(60)
+            return 200, self.describe(server_id, server_path)
+        if action == 'stop':
+            future = self.engine.stop(server_id)
+            if future is None:
+                return 409, {'error': '服务器未在运行'}
+            if body.get('wait'):
+                stopped = future.result(60)
+                return 200, dict(self.describe(server_id, server_path), stopped=stopped)
+            return 202, self.describe(server_id, server_path)
+        if action == 'restart':
+            self.engine.restart(server_id, server_path)
+            return 202, self.describe(server_id, server_path)
+        if action == 'command':
+            command = str(body.get('command', '')).strip()
+            if not command:
+                return 400, {'error': '请输入命令'}
+            self.engine.send_command(server_id, command)
+            return 200, {'id': server_id, 'command': command}
+        return 404, {'error': '未知的接口'}
+
+class _ControlRequestHandler(BaseHTTPRequestHandler):
+    """控制接口的HTTP请求处理"""
+    server_version = "MSM-Daemon"
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _dispatch(self, method):
+        api = self.server.api
+        # 浏览器发起的跨站请求都会带Origin头，本接口只供本地程序调用
+        if self.headers.get('Origin') is not None:
+            self._reply(403, {'error': '不接受跨站请求'})
+            return
+        if api.token:
+            if not hmac.compare_digest(self.headers.get('Authorization', '').encode('utf-8'),
+                                       f"Bearer {api.token}".encode('utf-8')):
+                self._reply(401, {'error': '未授权'})
+                return
+        elif not is_loopback_host(urlparse(f"//{self.headers.get('Host', '')}").hostname):
+            self._reply(403, {'error': 'Host必须是本机地址'})
+            return
+        if method == 'POST':
+            # 非简单请求的Content-Type会触发CORS预检，网页无法直接提交
+            content_type = self.headers.get('Content-Type', '').split(';', 1)[0].strip().lower()
+            if content_type != 'application/json':
+                self._reply(415, {'error': '请求体必须是application/json'})
+                return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+            if not isinstance(body, dict):
+                raise ValueError("请求体必须是JSON对象")
+            url = urlparse(self.path)
+            status, data = api.handle(method, url.path, parse_qs(url.query), body)
+        except (ValueError, json.JSONDecodeError) as e:
+            status, data = 400, {'error': str(e)}
+        except RuntimeError as e:
+            status, data = 409, {'error': str(e)}
+        except FileNotFoundError as e:
+            status, data = 404, {'error': str(e)}
         except Exception as e:
-            # 失败处理
-            if os.path.exists(temp_path):
+            status, data = 500, {'error': str(e)}
+        self._reply(status, data)
+
+    def _reply(self, status, data):
+        payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+def is_loopback_host(host):
+    """是否为本机回环地址（localhost、127.0.0.0/8、::1）"""
+    if not host:
+        return False
+    if host.lower() == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host.strip('[]')).is_loopback
+    except ValueError:
+        return False
+
+def run_daemon(host=None, port=None, autostart=False, echo=False, profiler=None):
+    """无界面模式：只运行服务器管理核心和本地控制接口"""
+    profiler = profiler or StartupProfiler()
+    engine = ServerEngine()
+    profiler.mark("服务器引擎")
+    host = host or engine.config.get('Daemon', 'host', fallback='127.0.0.1')
+    port = port or engine.config.getint('Daemon', 'port', fallback=25580)
+    token = engine.config.get('Daemon', 'token', fallback='')
+    if not token and not is_loopback_host(host):
+        print(f"❌ 监听非本机地址 {host} 时必须在MSM.ini的[Daemon]节中设置token")
+        return
+    config = engine.config
+    provisioner = ServerProvisioner(
+        VersionCatalog(
+            engine.msm_dir / "cache" / "catalog",
+            ttl=config.getint('Cache', 'catalog_ttl_hours', fallback=6) * 3600
+        ),
+        DownloadManager(
+            None,
+            max_connections=config.getint('Download', 'connections_per_file', fallback=4),
+            max_concurrent=config.getint('Download', 'max_concurrent', fallback=2),
+            jar_cache=JarCache(
+                engine.msm_dir / "cache",
+                max_bytes=config.getint('Cache', 'max_size_mb', fallback=2048) * 1024 * 1024
+            )
+        ),
+        max_workers=config.getint('Provision', 'max_workers', fallback=ServerProvisioner.MAX_WORKERS)
+    )
+    try:
+        api = ControlAPI(engine, host, port, token, provisioner)
+    except OSError as e:
+        print(f"❌ 无法监听 {host}:{port}: {e}")
+        return
+    api.serve_in_background()
+    engine.sampler.start()
+    profiler.mark("控制接口")
+    print(f"✅ MSM守护进程已启动: http://{host}:{port} （{len(api.servers)} 个服务器）")
+    profiler.report()
+
+    if autostart:
+        for server_id, path in list(api.servers.items()):
+            try:
+                engine.start_async(server_id, path).result(60)
+                print(f"✅ 已启动 {Path(path).name}")
+            except Exception as e:
+                print(f"❌ 启动 {Path(path).name} 失败: {e}")
+
+    def echo_event(kind, server_id, payload):
+        if kind == 'call':
+            return
+        name = Path(api.servers.get(server_id, server_id)).name
+        if kind == 'output':
+            for line in payload[1]:
+                print(f"[{name}] {line.strip()}")
+        elif kind == 'log':
+            print(f"[{name}] {payload}")
+        elif kind == 'exit':
+            print(f"[{name}] 💡 服务器已退出，退出代码: {payload.returncode}")
+
+    def request_exit(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, request_exit)
+
+    try:
+        while True:
+            engine.process_events(timeout=0.5, callback=echo_event if echo else None)
+    except KeyboardInterrupt:
+        print("⚠️ 正在停止所有服务器...")
+        engine.stop_all()
+    finally:
+        engine.sampler.stop()
+        engine.close_metrics()
+        engine.flush_config()
+        api.shutdown()
+
+class IncrementalHasher:
+    """
+    边下载边计算哈希，不再为校验额外读一遍文件
+    按文件偏移顺序喂入数据（分段下载时只有与已哈希部分相连的数据能直接计算），
+    不相连的部分在校验时从刚写入的文件中补读，每个字节只参与一次计算。
+    """
+    def __init__(self, algorithm, expected):
+        self.algorithm = algorithm
+        self.expected = expected.lower()
+        self.hasher = hashlib.new(algorithm)
+        self.position = 0
+        self.lock = threading.Lock()
+
+    def update(self, offset, data):
+        """喂入写到文件offset处的数据"""
+        with self.lock:
+            end = offset + len(data)
+            if offset <= self.position < end:
+                self.hasher.update(memoryview(data)[self.position - offset:])
+                self.position = end
+
+    def catch_up(self, path, end=None):
+        """从文件补读尚未计算的部分（到end或文件末尾）"""
+        with self.lock, open(path, 'rb') as f:
+            f.seek(self.position)
+            while end is None or self.position < end:
+                block = f.read(1024 * 1024 if end is None else min(1024 * 1024, end - self.position))
+                if not block:
+                    break
+                self.hasher.update(block)
+                self.position += len(block)
+
+    def verify(self, path):
+        """补齐剩余部分后与上游校验和比较"""
+        self.catch_up(path)
+        return self.hasher.hexdigest() == self.expected
+
+    def check(self, path):
+        """校验失败时抛出异常"""
+        if not self.verify(path):
+            raise Exception(
+                f"文件校验失败: {self.algorithm} 应为 {self.expected}，实际为 {self.hasher.hexdigest()}"
+            )
+
+class JarCache:
+    """
+    按内容哈希寻址的服务器核心缓存（默认位于~/.msm/cache）
+    以上游提供的SHA-1（Mojang）或SHA-256（Paper）为键，多个服务器使用同一构建时
+    直接硬链接（不支持时复制）到服务器目录，不再重复下载；总大小超过上限时按最近使用时间淘汰。
+    """
+    ALGORITHMS = ('sha1', 'sha256')
+
+    def __init__(self, cache_dir=None, max_bytes=2 * 1024 ** 3):
+        self.cache_dir = Path(cache_dir) if cache_dir else Path.home() / ".msm" / "cache"
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+    def path_for(self, algorithm, digest):
+        digest = digest.lower()
+        return self.cache_dir / algorithm / digest[:2] / f"{digest}.jar"
+
+    def _valid_key(self, algorithm, digest):
+        return algorithm in self.ALGORITHMS and bool(digest) and re.fullmatch(r'[0-9a-fA-F]+', digest) is not None
+
+    def fetch(self, algorithm, digest, target):
+        """
+        缓存命中时把文件放到target（硬链接或复制）
+        :return: 是否命中
+        """
+        if not self._valid_key(algorithm, digest):
+            return False
+        cached = self.path_for(algorithm, digest)
+        with self.lock:
+            if not cached.is_file():
+                return False
+            try:
+                self.place(cached, Path(target))
+                # 更新修改时间作为最近使用时间（LRU淘汰依据）
+                os.utime(cached)
+                return True
+            except OSError as e:
+                print(f"⚠️ 从缓存复制核心失败: {e}")
+                return False
+
+    def store(self, algorithm, digest, source, verified=False):
+        """
+        把已下载的文件加入缓存（内容与哈希不一致时不缓存）
+        :param verified: 下载时已边下载边校验过，不再重新计算哈希
+        :return: 是否已缓存
+        """
+        if not self._valid_key(algorithm, digest):
+            return False
+        if not verified and not self._matches(source, algorithm, digest):
+            print(f"⚠️ 文件哈希与上游不一致，未加入缓存: {source}")
+            return False
+        cached = self.path_for(algorithm, digest)
+        with self.lock:
+            try:
+                if not cached.is_file():
+                    cached.parent.mkdir(parents=True, exist_ok=True)
+                    self.place(Path(source), cached)
+                os.utime(cached)
+            except OSError as e:
+                print(f"⚠️ 加入缓存失败: {e}")
+                return False
+            self._evict(keep=cached)
+        return True
+
+    @staticmethod
+    def _matches(path, algorithm, digest):
+        hasher = hashlib.new(algorithm)
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                hasher.update(block)
+        return hasher.hexdigest() == digest.lower()
+
+    @staticmethod
+    def place(source, target):
+        """硬链接source到target（跨磁盘或不支持时复制），通过临时文件原子替换"""
+        temp = target.with_name(target.name + ".cache-tmp")
+        try:
+            temp.unlink()
+        except FileNotFoundError:
+            pass
+        try:
+            os.link(source, temp)
+        except OSError:
+            shutil.copyfile(source, temp)
+        os.replace(temp, target)
+
+    def _evict(self, keep=None):
+        """总大小超过上限时删除最久未使用的文件"""
+        entries = []
+        total = 0
+        for path in self.cache_dir.glob("*/*/*.jar"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                path.unlink()
+                total -= size
+                print(f"🧹 已淘汰缓存的核心文件: {path.name}")
+            except OSError:
+                pass
+
+def validate_jar_file(file_path):
+    """验证JAR文件是否有效（没有上游校验和时使用：检查文件头和文件末尾的ZIP目录记录）"""
+    try:
+        if not os.path.exists(file_path):
+            return False
+        
+        file_size = os.path.getsize(file_path)
+        if file_size < 1024:  # 小于1KB的文件肯定无效
+            return False
+        
+        # 检查文件头（JAR文件以PK开头）
+        with open(file_path, 'rb') as f:
+            header = f.read(4)
+            if header[:2] != b'PK':
+                return False
+        
+        # 只读取文件尾部，截断的文件无法通过
+        return zipfile.is_zipfile(file_path)
+    except Exception:
+        return False
+
+class DownloadManager:
+    """
+    增强版下载管理器（解决超时和界面卡死问题）
+    所有服务器核心下载都经过这里：同时进行的下载数量有上限（其余排队），
+    进度回调按时间节流，取消后保留.tmp以便下次续传，有校验和时先查本地核心缓存。
+    回调通过root.after在主线程执行（root为None时直接在下载线程执行，供守护进程和批量创建使用）：
+    - progress_callback(百分比, 已下载字节, 总字节)
+    - completion_callback(是否成功, 错误信息)
+    """
+    CHUNK_SIZE = 64 * 1024
+    SEGMENT_MIN_SIZE = 4 * 1024 * 1024  # 小于4MB的文件不分段
+    SEGMENT_RETRIES = 3
+    PROGRESS_INTERVAL = 0.2  # 进度回调最短间隔（秒）
+
+    def __init__(self, root, max_connections=4, max_concurrent=2, jar_cache=None):
+        self.root = root
+        self.max_connections = max_connections  # 单个文件的最大并行连接数
+        self.jar_cache = jar_cache
+        self.active_downloads = {}  # 存储活跃下载任务
+        self.lock = threading.Lock()  # 线程安全锁
+        # 同时进行的下载数量上限，超出的任务排队等待
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="MSM-Download")
+
+    def start_download(self, url, save_path, progress_callback=None, completion_callback=None, checksum=None):
+        """
+        启动带进度监控的下载（线程安全版）
+        :param checksum: (算法, 十六进制摘要)，如 ('sha1', ...)；提供时下载过程中计算哈希，不一致则不保存
+        :return: 下载ID（用于取消），同一文件已在下载时返回None
+        """
+        save_path = str(save_path)
+        with self.lock:
+            for data in self.active_downloads.values():
+                if data['url'] == url or data['path'] == save_path:
+                    return None  # 避免重复下载
+
+            download_id = str(hash(url + save_path))
+            self.active_downloads[download_id] = {
+                'url': url,
+                'path': save_path,
+                'active': True,
+                'state': 'queued',
+                'progress': 0
+            }
+
+        self.executor.submit(
+            self._download_file, download_id, url, save_path, progress_callback, completion_callback, checksum
+        )
+        return download_id
+
+    def _download_file(self, download_id, url, save_path, progress_callback, completion_callback, checksum=None):
+        """
+        实际下载线程（含超时处理和断点续传）
+        服务器支持Range时按Content-Length分段并行下载到预分配的.tmp文件，
+        各分段进度记录在.tmp.parts中，失败或取消后再次下载只补齐未完成的部分；
+        不支持Range时退回单连接下载。
+        """
+        temp_path = f"{save_path}.tmp"
+        try:
+            if not self._is_download_active(download_id):
+                raise Exception("下载被用户取消")
+            with self.lock:
+                self.active_downloads[download_id]['state'] = 'downloading'
+            os.makedirs(os.path.dirname(save_path) or '.', exist_ok=True)
+            
+            # 本地核心缓存中已有同一构建时不再下载
+            if checksum and checksum[1] and self.jar_cache and self.jar_cache.fetch(checksum[0], checksum[1], save_path):
+                self._update_download_progress(download_id, 100, 0, 0, progress_callback)
+                self._safe_callback(completion_callback, True, None, download_id)
+                return
+            
+            # 第一次尝试获取文件信息（带重试）
+            with requests.Session() as session:
+                session.max_redirects = 5
+                response = self._retry_request(
+                    lambda: session.head(url, timeout=10, allow_redirects=True),
+                    max_retries=2,
+                    delay=1
+                )
+            response.raise_for_status()
+            
+            total_size = int(response.headers.get('content-length', 0))
+            accept_ranges = response.headers.get('accept-ranges', '').lower() == 'bytes'
+            validator = response.headers.get('etag') or response.headers.get('last-modified') or ''
+            # 使用重定向后的最终地址，分段请求不必每次都重定向
+            final_url = response.url or url
+            
+            progress = self._progress_reporter(download_id, total_size, progress_callback)
+            hasher = IncrementalHasher(*checksum) if checksum and checksum[1] else None
+            if accept_ranges and total_size >= self.SEGMENT_MIN_SIZE and self.max_connections > 1:
+                self._download_segmented(download_id, final_url, temp_path, total_size, validator, progress, hasher)
+            else:
+                self._download_single(download_id, final_url, temp_path, total_size, accept_ranges, progress, hasher)
+            
+            # 替换前校验，损坏的文件不会出现在目标位置
+            if hasher is not None:
                 try:
+                    hasher.check(temp_path)
+                except Exception:
+                    # 内容已损坏，续传没有意义
+                    self._remove_parts_file(temp_path)
                     os.remove(temp_path)
-                except:
-                    pass
-                    
+                    raise
+            elif save_path.lower().endswith('.jar') and not validate_jar_file(temp_path):
+                os.remove(temp_path)
+                raise Exception("下载的文件损坏或不是有效的JAR文件")
+            
+            # 下载完成重命名文件
+            os.replace(temp_path, save_path)
+            self._remove_parts_file(temp_path)
+            if hasher is not None and self.jar_cache:
+                self.jar_cache.store(checksum[0], checksum[1], save_path, verified=True)
+            
+            # 成功回调
+            self._safe_callback(
+                completion_callback,
+                True,
+                None,
+                download_id
+            )
+
+        except Exception as e:
+            # 失败时保留.tmp和分段记录，下次下载同一文件时续传
             self._safe_callback(
                 completion_callback,
                 False,
@@ -1442,13 +4265,192 @@ class DownloadManager:
                 if download_id in self.active_downloads:
                     del self.active_downloads[download_id]
 
+    def _progress_reporter(self, download_id, total_size, progress_callback):
+        """
+        返回线程安全的进度累加函数 report(新增字节数)
+        进度回调按时间节流（最多每PROGRESS_INTERVAL秒一次），分段线程共用
+        """
+        state = {'downloaded': 0, 'reported_at': 0.0}
+        state_lock = threading.Lock()
+
+        def report(count, force=False):
+            with state_lock:
+                state['downloaded'] += count
+                now = time.monotonic()
+                if not force and now - state['reported_at'] < self.PROGRESS_INTERVAL:
+                    return
+                state['reported_at'] = now
+                downloaded = state['downloaded']
+            progress = downloaded / total_size * 100 if total_size > 0 else 0
+            self._update_download_progress(download_id, progress, downloaded, total_size, progress_callback)
+
+        return report
+
+    def _download_single(self, download_id, url, temp_path, total_size, accept_ranges, report, hasher=None):
+        """单连接下载（服务器支持Range时从.tmp已有长度续传）"""
+        downloaded = os.path.getsize(temp_path) if accept_ranges and os.path.exists(temp_path) else 0
+        if total_size and downloaded >= total_size:
+            downloaded = 0
+        headers = {'Range': f'bytes={downloaded}-'} if downloaded else {}
+
+        # 分块下载（主下载循环）
+        with requests.Session() as session, session.get(
+            url,
+            headers=headers,
+            stream=True,
+            timeout=(10, 30)  # 连接10秒，读取30秒超时
+        ) as response:
+            response.raise_for_status()
+            if downloaded and response.status_code != 206:
+                # 服务器忽略了Range，只能从头下载
+                downloaded = 0
+            report(downloaded, force=True)
+            if hasher is not None and downloaded:
+                # 续传时先补算已下载部分
+                hasher.catch_up(temp_path, downloaded)
+            
+            with open(temp_path, 'ab' if downloaded else 'wb') as f:
+                for chunk in response.iter_content(chunk_size=self.CHUNK_SIZE):
+                    if not self._is_download_active(download_id):
+                        raise Exception("下载被用户取消")
+                        
+                    if chunk:  # 过滤keep-alive空块
+                        f.write(chunk)
+                        if hasher is not None:
+                            hasher.update(downloaded, chunk)
+                        downloaded += len(chunk)
+                        report(len(chunk))
+        report(0, force=True)
+
+    def _download_segmented(self, download_id, url, temp_path, total_size, validator, report, hasher=None):
+        """多连接分段下载（每段一个线程，写入预分配文件的对应位置）"""
+        segments = self._load_parts(temp_path, url, total_size, validator)
+        if segments is None:
+            count = min(self.max_connections, max(1, total_size // self.SEGMENT_MIN_SIZE))
+            size = -(-total_size // count)
+            segments = [[start, min(start + size, total_size) - 1, 0] for start in range(0, total_size, size)]
+            # 预分配文件，各分段直接写入自己的位置
+            with open(temp_path, 'wb') as f:
+                f.truncate(total_size)
+        parts = {'url': url, 'size': total_size, 'validator': validator, 'segments': segments}
+        parts_lock = threading.Lock()
+        report(sum(done for start, end, done in segments), force=True)
+
+        errors = []
+        threads = []
+        for segment in segments:
+            if segment[0] + segment[2] > segment[1]:
+                continue
+            thread = threading.Thread(
+                target=self._segment_worker,
+                args=(download_id, url, temp_path, segment, parts, parts_lock, report, errors, hasher),
+                daemon=True
+            )
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+        with parts_lock:
+            self._save_parts(temp_path, parts)
+        if errors:
+            raise errors[0]
+        report(0, force=True)
+
+    def _segment_worker(self, download_id, url, temp_path, segment, parts, parts_lock, report, errors, hasher=None):
+        """下载一个分段（失败时从本段已完成的位置重试）"""
+        start, end = segment[0], segment[1]
+        attempt = 0
+        saved_at = time.monotonic()
+        with requests.Session() as session, open(temp_path, 'r+b') as f:
+            while start + segment[2] <= end:
+                if errors:
+                    return
+                offset = start + segment[2]
+                received = segment[2]
+                try:
+                    with session.get(
+                        url,
+                        headers={'Range': f'bytes={offset}-{end}'},
+                        stream=True,
+                        timeout=(10, 30)
+                    ) as response:
+                        response.raise_for_status()
+                        if response.status_code != 206:
+                            raise Exception("服务器不支持分段下载")
+                        f.seek(offset)
+                        for chunk in response.iter_content(chunk_size=self.CHUNK_SIZE):
+                            if not self._is_download_active(download_id):
+                                raise Exception("下载被用户取消")
+                            if not chunk:
+                                continue
+                            chunk = chunk[:end + 1 - (start + segment[2])]
+                            f.write(chunk)
+                            if hasher is not None:
+                                # 与已哈希部分相连的数据直接计算（通常是第一段）
+                                hasher.update(start + segment[2], chunk)
+                            segment[2] += len(chunk)
+                            report(len(chunk))
+                            # 定期保存分段进度，异常退出后也能续传
+                            if time.monotonic() - saved_at >= 1:
+                                f.flush()
+                                with parts_lock:
+                                    self._save_parts(temp_path, parts)
+                                saved_at = time.monotonic()
+                            if start + segment[2] > end:
+                                break
+                    if segment[2] == received:
+                        raise requests.ConnectionError("分段响应为空")
+                    attempt = 0
+                except (requests.RequestException, requests.Timeout, requests.ConnectionError) as e:
+                    attempt += 1
+                    if attempt >= self.SEGMENT_RETRIES:
+                        errors.append(e)
+                        return
+                    time.sleep(attempt)  # 递增退避
+                except Exception as e:
+                    errors.append(e)
+                    return
+            f.flush()
+
+    @staticmethod
+    def _parts_path(temp_path):
+        return f"{temp_path}.parts"
+
+    def _load_parts(self, temp_path, url, total_size, validator):
+        """读取分段进度（文件或远端版本变化时返回None，重新下载）"""
+        try:
+            with open(self._parts_path(temp_path), 'r', encoding='utf-8') as f:
+                parts = json.load(f)
+            if (parts['url'] != url or parts['size'] != total_size or parts['validator'] != validator
+                    or os.path.getsize(temp_path) != total_size):
+                return None
+            return [[int(start), int(end), int(done)] for start, end, done in parts['segments']]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _save_parts(self, temp_path, parts):
+        path = self._parts_path(temp_path)
+        try:
+            with open(path + '.new', 'w', encoding='utf-8') as f:
+                json.dump(parts, f)
+            os.replace(path + '.new', path)
+        except OSError as e:
+            print(f"保存分段进度失败: {e}")
+
+    def _remove_parts_file(self, temp_path):
+        try:
+            os.remove(self._parts_path(temp_path))
+        except OSError:
+            pass
+
     def _retry_request(self, request_func, max_retries=3, delay=1):
         """带重试机制的请求封装"""
         last_exception = None
         for attempt in range(max_retries):
             try:
                 return request_func()
-            except (RequestException, Timeout, ConnectionError) as e:
+            except (requests.RequestException, requests.Timeout, requests.ConnectionError) as e:
                 last_exception = e
                 if attempt < max_retries - 1:
                     time.sleep(delay * (attempt + 1))  # 指数退避
@@ -1457,42 +4459,728 @@ class DownloadManager:
     def _is_download_active(self, download_id):
         """检查下载是否仍活跃"""
         with self.lock:
-            return (download_id in self.active_downloads and 
-                    self.active_downloads[download_id]['active'])
+            return (download_id in self.active_downloads and 
+                    self.active_downloads[download_id]['active'])
+
+    def _update_download_progress(self, download_id, progress, downloaded, total_size, callback):
+        """安全更新下载进度"""
+        with self.lock:
+            if download_id in self.active_downloads:
+                self.active_downloads[download_id]['progress'] = progress
+                
+        if callback:
+            self._post(lambda: callback(progress, downloaded, total_size))
+
+    def _safe_callback(self, callback, success, error_msg, download_id):
+        """安全执行回调（确保在主线程）"""
+        if callback:
+            self._post(lambda: callback(success, error_msg))
+
+    def _post(self, func):
+        if self.root is None:
+            func()
+        else:
+            self.root.after(0, func)
+
+    def cancel_download(self, key):
+        """取消指定下载任务（按下载ID或URL；已下载部分保留，下次下载同一文件时续传）"""
+        with self.lock:
+            for download_id, data in list(self.active_downloads.items()):
+                if download_id == key or data['url'] == key:
+                    data['active'] = False
+                    return True
+        return False
+
+    def cancel_all(self):
+        """取消所有下载任务"""
+        with self.lock:
+            for download_id in list(self.active_downloads.keys()):
+                self.active_downloads[download_id]['active'] = False
+
+class VersionIndex:
+    """
+    版本索引（最新的在前）：按类型（release/snapshot）过滤、按输入逐步搜索、分页取出
+    连续输入（新关键字以上一次的关键字开头）时只在上一次的匹配结果中继续过滤，不重新遍历整个列表。
+    """
+    def __init__(self, entries):
+        self.entries = entries  # [(版本号, 类型)]
+        self._keys = [version.lower() for version, kind in entries]
+        self._kinds = dict(entries)
+        self._last_query = None
+        self._last_matches = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, version):
+        return version in self._kinds
+
+    def kind(self, version):
+        return self._kinds.get(version)
+
+    def versions(self, kinds=None):
+        return [version for version, kind in self.entries if kinds is None or kind in kinds]
+
+    def search(self, text='', kinds=None):
+        """
+        查找包含text的版本
+        :return: 匹配条目的下标列表（保持最新在前的顺序）
+        """
+        text = text.strip().lower()
+        kinds = frozenset(kinds) if kinds is not None else None
+        last = self._last_query
+        if last is not None and last[1] == kinds and text.startswith(last[0]):
+            candidates = self._last_matches
+        else:
+            candidates = [i for i, (version, kind) in enumerate(self.entries) if kinds is None or kind in kinds]
+        matches = [i for i in candidates if text in self._keys[i]] if text else list(candidates)
+        self._last_query = (text, kinds)
+        self._last_matches = matches
+        return matches
+
+    def page(self, matches, offset=0, limit=50):
+        return [self.entries[i][0] for i in matches[offset:offset + limit]]
+
+class VersionCatalog:
+    """
+    服务器版本目录（Vanilla/Paper/Spigot）
+    上游JSON缓存在磁盘上（默认~/.msm/cache/catalog），TTL内直接使用缓存；
+    过期后用ETag/If-Modified-Since重新验证，网络不可用时使用过期缓存，向导离线也能工作。
+    """
+    VANILLA_MANIFEST_URL = "https://launchermeta.mojang.com/mc/game/version_manifest.json"
+    PAPER_PROJECT_URL = "https://api.papermc.io/v2/projects/paper"
+    PAPER_BUILDS_URL = "https://api.papermc.io/v2/projects/paper/versions/{version}/builds"
+    PAPER_DOWNLOAD_URL = "https://api.papermc.io/v2/projects/paper/versions/{version}/builds/{build}/downloads/{name}"
+    SPIGOT_URL = "https://download.cdn.getbukkit.org/spigot/spigot-{version}.jar"
+    SPIGOT_MIN_VERSION = (1, 8)  # 更早的版本没有可下载的Spigot构建
+    DEFAULT_TTL = 6 * 3600
+
+    def __init__(self, cache_dir=None, ttl=DEFAULT_TTL):
+        self.cache_dir = Path(cache_dir) if cache_dir else Path.home() / ".msm" / "cache" / "catalog"
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self._memory = {}
+        self._indexes = {}  # 类型 -> (生成索引时的上游数据, VersionIndex)
+        self._spigot_available = {}  # Spigot版本 -> 下载地址是否存在（HEAD请求的结果）
+
+    def _entry_path(self, url):
+        return self.cache_dir / (hashlib.sha1(url.encode('utf-8')).hexdigest() + ".json")
+
+    def _load_entry(self, url):
+        entry = self._memory.get(url)
+        if entry is None:
+            try:
+                with open(self._entry_path(url), 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                return None
+            self._memory[url] = entry
+        return entry
+
+    def _save_entry(self, url, entry):
+        self._memory[url] = entry
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            path = self._entry_path(url)
+            temp = path.with_suffix('.tmp')
+            with open(temp, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(temp, path)
+        except OSError as e:
+            print(f"⚠️ 保存版本缓存失败: {e}")
+
+    def cached_json(self, url):
+        """只读缓存（不访问网络），没有缓存时返回None"""
+        with self.lock:
+            entry = self._load_entry(url)
+        return entry['data'] if entry else None
+
+    def is_fresh(self, url, ttl=None):
+        with self.lock:
+            entry = self._load_entry(url)
+        ttl = self.ttl if ttl is None else ttl
+        return entry is not None and (ttl < 0 or time.time() - entry['fetched_at'] < ttl)
+
+    def get_json(self, url, ttl=None):
+        """
+        获取JSON：TTL内直接返回缓存，过期时条件请求重新验证，网络失败时返回过期缓存
+        :param ttl: 缓存有效期（秒），为负数时缓存永不过期（内容不可变的地址）
+        """
+        ttl = self.ttl if ttl is None else ttl
+        with self.lock:
+            entry = self._load_entry(url)
+        if entry is not None and (ttl < 0 or time.time() - entry['fetched_at'] < ttl):
+            return entry['data']
+
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        try:
+            response = requests.get(url, headers=headers, timeout=10)
+            if response.status_code == 304 and entry is not None:
+                entry = dict(entry, fetched_at=time.time())
+            else:
+                response.raise_for_status()
+                entry = {
+                    'url': url,
+                    'etag': response.headers.get('etag', ''),
+                    'last_modified': response.headers.get('last-modified', ''),
+                    'fetched_at': time.time(),
+                    'data': response.json()
+                }
+        except (requests.RequestException, ValueError) as e:
+            if entry is not None:
+                print(f"⚠️ 无法更新版本信息，使用缓存: {e}")
+                return entry['data']
+            raise
+        with self.lock:
+            self._save_entry(url, entry)
+        return entry['data']
 
-    def _update_download_progress(self, download_id, progress, downloaded, total_size, callback):
-        """安全更新下载进度"""
+    # ---------- 版本列表 ----------
+
+    def _entries_from(self, core_type, data):
+        """从上游数据生成完整的版本列表 [(版本号, 类型)]，最新的在前"""
+        if core_type == 'vanilla':
+            # 远古的alpha/beta版本没有服务器核心
+            return [(v['id'], v['type']) for v in data['versions'] if v['type'] in ('release', 'snapshot')]
+        if core_type == 'paper':
+            return [
+                (v, 'snapshot' if re.search(r'-(pre|rc)|snapshot', v, re.IGNORECASE) else 'release')
+                for v in reversed(data['versions'])
+            ]
+        # Spigot没有版本列表接口，使用1.8以后的原版正式版（部分小版本没有构建，resolve时检查）
+        entries = []
+        for v in data['versions']:
+            if v['type'] != 'release':
+                continue
+            numbers = tuple(int(n) for n in re.findall(r'\d+', v['id'])[:3])
+            if numbers >= self.SPIGOT_MIN_VERSION:
+                entries.append((v['id'], 'release'))
+        return entries
+
+    def _index_for(self, core_type, data):
+        """上游数据没有变化时复用已生成的索引"""
         with self.lock:
-            if download_id in self.active_downloads:
-                self.active_downloads[download_id]['progress'] = progress
-                
-        if callback:
-            self.root.after(0, lambda: callback(progress))
+            cached = self._indexes.get(core_type)
+            if cached is not None and cached[0] is data:
+                return cached[1]
+        index = VersionIndex(self._entries_from(core_type, data))
+        with self.lock:
+            self._indexes[core_type] = (data, index)
+        return index
 
-    def _safe_callback(self, callback, success, error_msg, download_id):
-        """安全执行回调（确保在主线程）"""
-        if callback:
-            self.root.after(0, lambda: callback(success, error_msg))
+    def _list_url(self, core_type):
+        return {
+            'vanilla': self.VANILLA_MANIFEST_URL,
+            'paper': self.PAPER_PROJECT_URL,
+            'spigot': self.VANILLA_MANIFEST_URL,
+        }.get(core_type)
 
-    def cancel_download(self, url):
-        """取消指定下载任务"""
+    def cached_index(self, core_type):
+        """从缓存立即获取完整版本索引（不访问网络），没有缓存时返回None"""
+        data = self.cached_json(self._list_url(core_type))
+        return self._index_for(core_type, data) if data is not None else None
+
+    def index(self, core_type, revalidate=False):
+        """获取完整版本索引（必要时访问网络；revalidate为True时忽略TTL向上游重新验证）"""
+        url = self._list_url(core_type)
+        if url is None:
+            raise ValueError(f"未知的服务器类型: {core_type}")
+        return self._index_for(core_type, self.get_json(url, ttl=0 if revalidate else None))
+
+    def cached_versions(self, core_type):
+        """从缓存立即获取正式版列表（最新的在前），没有缓存时返回None"""
+        index = self.cached_index(core_type)
+        return index.versions(('release',)) if index is not None else None
+
+    def versions(self, core_type, revalidate=False):
+        """获取正式版列表（最新的在前）"""
+        return self.index(core_type, revalidate).versions(('release',))
+
+    def needs_refresh(self, core_type):
+        url = self._list_url(core_type)
+        return url is not None and not self.is_fresh(url)
+
+    # ---------- 下载地址 ----------
+
+    def resolve(self, core_type, version):
+        """
+        获取核心下载信息
+        :return: (下载URL, 校验算法, 校验和)，上游不提供校验和时后两项为空字符串
+        """
+        if core_type == 'vanilla':
+            return self._resolve_vanilla(version)
+        if core_type == 'paper':
+            return self._resolve_paper(version)
+        if core_type == 'spigot':
+            return self._resolve_spigot(version)
+        raise ValueError(f"未知的服务器类型: {core_type}")
+
+    def _resolve_spigot(self, version):
+        """Spigot版本列表来自原版，先用HEAD请求确认该版本有构建（网络失败时不阻止下载）"""
+        url = self.SPIGOT_URL.format(version=version)
         with self.lock:
-            for download_id, data in list(self.active_downloads.items()):
-                if data['url'] == url:
-                    data['active'] = False
-                    return True
-        return False
+            available = self._spigot_available.get(version)
+        if available is None:
+            try:
+                response = requests.head(url, timeout=10, allow_redirects=True)
+            except requests.RequestException as e:
+                print(f"⚠️ 无法确认Spigot {version} 是否可下载: {e}")
+                return url, '', ''
+            if response.status_code == 404:
+                available = False
+            elif response.ok:
+                available = True
+            if available is not None:
+                with self.lock:
+                    self._spigot_available[version] = available
+        if available is False:
+            raise ValueError(f"Spigot {version} 没有可下载的构建，请选择其他版本")
+        return url, '', ''
 
-    def cancel_all(self):
-        """取消所有下载任务"""
+    def _resolve_vanilla(self, version):
+        manifest = self.get_json(self.VANILLA_MANIFEST_URL)
+        for version_info in manifest['versions']:
+            if version_info['id'] == version:
+                # 版本详情地址包含内容哈希，内容不会变化，缓存永不过期
+                detail = self.get_json(version_info['url'], ttl=-1)
+                server_download = detail['downloads']['server']
+                return server_download['url'], 'sha1' if server_download.get('sha1') else '', server_download.get('sha1', '')
+        raise ValueError(f"找不到版本: {version}")
+
+    def _resolve_paper(self, version):
+        build = self.latest_paper_build(version)
+        return build['url'], 'sha256' if build['sha256'] else '', build['sha256']
+
+    def paper_builds(self, version, revalidate=False):
+        """
+        Paper某个版本的构建索引（最新的在前），每项包含 build、channel、sha256、name、url
+        一次builds请求得到全部构建，按版本缓存（与版本列表相同的TTL和条件请求），数据未变化时复用解析结果
+        """
+        data = self.get_json(self.PAPER_BUILDS_URL.format(version=version), ttl=0 if revalidate else None)
+        key = ('paper-builds', version)
         with self.lock:
-            for download_id in list(self.active_downloads.keys()):
-                self.active_downloads[download_id]['active'] = False
+            cached = self._indexes.get(key)
+            if cached is not None and cached[0] is data:
+                return cached[1]
+        builds = []
+        for build in reversed(data.get('builds') or []):
+            number = build['build']
+            application = (build.get('downloads') or {}).get('application') or {}
+            name = application.get('name') or f"paper-{version}-{number}.jar"
+            builds.append({
+                'build': number,
+                'channel': build.get('channel', 'default'),
+                'sha256': application.get('sha256', ''),
+                'name': name,
+                'url': self.PAPER_DOWNLOAD_URL.format(version=version, build=number, name=name),
+            })
+        with self.lock:
+            self._indexes[key] = (data, builds)
+        return builds
+
+    def latest_paper_build(self, version, channel='default'):
+        """最新的稳定构建（该版本没有稳定构建时使用最新的实验构建）"""
+        builds = self.paper_builds(version)
+        if not builds:
+            raise ValueError(f"Paper {version} 没有可用构建")
+        for build in builds:
+            if build['channel'] == channel:
+                return build
+        return builds[0]
+
+    def prefetch_in_background(self):
+        """启动时在后台预取版本列表，打开向导时可直接从缓存读取"""
+        def worker():
+            for url in (self.VANILLA_MANIFEST_URL, self.PAPER_PROJECT_URL):
+                try:
+                    self.get_json(url)
+                except Exception as e:
+                    print(f"⚠️ 预取版本列表失败: {e}")
+        threading.Thread(target=worker, name="MSM-VersionPrefetch", daemon=True).start()
+
+# 新建服务器使用的默认server.properties
+DEFAULT_SERVER_PROPERTIES = """#Minecraft server properties
+#Minecraft server properties
+#Fri Nov 21 00:00:00 CST 2025
+accepts-transfers=false
+allow-flight=false
+broadcast-console-to-ops=true
+broadcast-rcon-to-ops=true
+bug-report-link=
+debug=false
+difficulty=easy
+enable-code-of-conduct=false
+enable-jmx-monitoring=false
+enable-query=false
+enable-rcon=false
+enable-status=true
+enforce-secure-profile=true
+enforce-whitelist=false
+entity-broadcast-range-percentage=100
+force-gamemode=false
+function-permission-level=2
+gamemode=survival
+generate-structures=true
+generator-settings={}
+hardcore=false
+hide-online-players=false
+initial-disabled-packs=
+initial-enabled-packs=vanilla
+level-name=world
+level-seed=
+level-type=minecraft\:normal
+log-ips=true
+management-server-enabled=false
+management-server-host=localhost
+management-server-port=0
+management-server-secret=wMLnGXQnR422PoaI37sM9WnjkZOJikBf34jaUv7t
+management-server-tls-enabled=true
+management-server-tls-keystore=
+management-server-tls-keystore-password=
+max-chained-neighbor-updates=1000000
+max-players=20
+max-tick-time=60000
+max-world-size=29999984
+motd=A Minecraft Server
+network-compression-threshold=256
+online-mode=false
+op-permission-level=4
+pause-when-empty-seconds=-1
+player-idle-timeout=0
+prevent-proxy-connections=false
+query.port=25565
+rate-limit=0
+rcon.password=
+rcon.port=25575
+region-file-compression=deflate
+require-resource-pack=false
+resource-pack=
+resource-pack-id=
+resource-pack-prompt=
+resource-pack-sha1=
+server-ip=
+server-port=25565
+simulation-distance=10
+spawn-protection=16
+status-heartbeat-interval=0
+sync-chunk-writes=true
+text-filtering-config=
+text-filtering-version=0
+use-native-transport=true
+view-distance=10
+white-list=false
+"""
+
+class ServerProvisioner:
+    """
+    批量创建服务器：一个模板（核心类型、版本、启动脚本、server.properties、EULA）生成多个实例
+    核心只解析和下载一次（经过下载管理器，有校验和时进入本地核心缓存），各实例从同一文件硬链接；
+    实例目录在有上限的线程池中并行准备，端口从起始端口开始自动分配并跳过已占用的端口。
+    模板字段：
+    - core_type, core_version   核心类型和版本
+    - parent                    实例所在的上级目录
+    - name_pattern, count, start 名称模板（{n}为序号，支持{n:02d}）、数量、起始序号
+    - base_port, reserved_ports 起始端口、额外保留的端口
+    - rcon_base_port            RCON起始端口（每个实例单独分配，默认25575）
+    - script                    启动脚本（{core_name}、{name}、{port}、{rcon_port}会被替换）
+    - properties                覆盖server.properties的键值（值中的{name}、{port}、{rcon_port}会被替换）
+    - eula                      是否同意Minecraft EULA
+    """
+    MAX_WORKERS = 4
+    MAX_INSTANCES = 200
+    DEFAULT_SCRIPT = {
+        'start.bat': """@echo off
+title Minecraft Server - %CD%
+java -Xms1G -Xmx2G -jar {core_name} nogui
+pause >nul""",
+        'start.sh': """#!/bin/sh
+cd "$(dirname "$0")"
+exec java -Xms1G -Xmx2G -jar {core_name} nogui
+""",
+    }[START_SCRIPT_NAME]
+
+    def __init__(self, catalog, download_manager, max_workers=MAX_WORKERS):
+        self.catalog = catalog
+        self.download_manager = download_manager
+        self.max_workers = max(1, max_workers)
+        # 已分配给本进程创建的实例的端口和正在创建的目录，同时进行的批量创建不会重复分配
+        self._claim_lock = threading.Lock()
+        self._claimed_ports = set()
+        self._claimed_paths = set()
+
+    # ---------- 规划 ----------
+
+    @staticmethod
+    def expand_names(pattern, count, start=1):
+        """按名称模板生成实例名称，模板不含{n}时在末尾追加 -序号"""
+        pattern = pattern.strip()
+        if not pattern:
+            raise ValueError("请输入名称模板")
+        if '{n' not in pattern:
+            pattern += '-{n}'
+        try:
+            names = [pattern.format(n=start + i) for i in range(count)]
+        except (KeyError, IndexError, ValueError) as e:
+            raise ValueError(f"名称模板无效: {e}")
+        if len(set(names)) != len(names):
+            raise ValueError("名称模板生成了重复的名称")
+        for name in names:
+            if re.search(r'[\\/:*?"<>|]', name):
+                raise ValueError(f"名称包含非法字符: {name}")
+        return names
+
+    @staticmethod
+    def used_ports(server_paths):
+        """读取已有服务器server.properties中的端口"""
+        ports = set()
+        for path in server_paths:
+            try:
+                content = (Path(path) / "server.properties").read_text(encoding='utf-8', errors='ignore')
+            except OSError:
+                continue
+            for key in ('server-port', 'query.port', 'rcon.port'):
+                match = re.search(rf'^{re.escape(key)}=(\d+)\s*$', content, re.MULTILINE)
+                if match:
+                    ports.add(int(match.group(1)))
+        return ports
+
+    @staticmethod
+    def port_available(port):
+        """本机端口当前是否可以监听"""
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            try:
+                s.bind(('', port))
+                return True
+            except OSError:
+                return False
+
+    def assign_ports(self, count, base_port=25565, reserved=()):
+        """从base_port开始分配count个未被占用且未保留的端口"""
+        reserved = set(reserved)
+        ports = []
+        port = base_port
+        while len(ports) < count:
+            if port > 65535:
+                raise ValueError("可用端口不足")
+            if port not in reserved and self.port_available(port):
+                ports.append(port)
+            port += 1
+        return ports
+
+    def plan(self, template):
+        """
+        计算每个实例的名称、目录和端口（不修改磁盘）
+        :return: [{'name', 'path', 'port', 'rcon_port'}, ...]
+        """
+        with self._claim_lock:
+            return self._plan(template)
+
+    def _plan(self, template):
+        count = int(template.get('count', 1))
+        if not 1 <= count <= self.MAX_INSTANCES:
+            raise ValueError(f"数量必须在1到{self.MAX_INSTANCES}之间")
+        parent = Path(template.get('parent') or Path.cwd() / "servers")
+        names = self.expand_names(template.get('name_pattern', 'server-{n}'), count, int(template.get('start', 1)))
+        for name in names:
+            target = parent / name
+            if str(target) in self._claimed_paths:
+                raise ValueError(f"目录正在创建中: {target}")
+            if target.exists() and any(target.iterdir()):
+                raise ValueError(f"目录已存在且不为空: {target}")
+        reserved = set(template.get('reserved_ports', ())) | self._claimed_ports
+        ports = self.assign_ports(count, int(template.get('base_port', 25565)), reserved)
+        rcon_ports = self.assign_ports(count, int(template.get('rcon_base_port', 25575)), reserved | set(ports))
+        return [
+            {'name': name, 'path': str(parent / name), 'port': port, 'rcon_port': rcon_port}
+            for name, port, rcon_port in zip(names, ports, rcon_ports)
+        ]
+
+    # ---------- 创建 ----------
+
+    def provision(self, template, progress=None, cancel_event=None):
+        """
+        按模板批量创建服务器（阻塞，在后台线程中调用）
+        :param progress: progress(阶段, 数据)，在工作线程中调用；
+                         阶段为 'resolve' / 'download'(百分比) / 'instance'(单个结果) / 'done'(全部结果)
+        :return: [{'name', 'path', 'port', 'rcon_port', 'ok', 'error'}, ...]
+        """
+        report = progress or (lambda stage, data: None)
+        with self._claim_lock:
+            entries = self._plan(template)
+            for entry in entries:
+                self._claimed_ports.update((entry['port'], entry['rcon_port']))
+                self._claimed_paths.add(entry['path'])
+        results = []
+        try:
+            return self._provision(template, entries, results, report, cancel_event)
+        finally:
+            # 创建成功的实例继续占用端口，失败或未创建的释放
+            created = {result['path'] for result in results if result['ok']}
+            with self._claim_lock:
+                for entry in entries:
+                    self._claimed_paths.discard(entry['path'])
+                    if entry['path'] not in created:
+                        self._claimed_ports.difference_update((entry['port'], entry['rcon_port']))
+
+    def _provision(self, template, entries, results, report, cancel_event):
+        core_type = template['core_type']
+        core_version = template['core_version']
+
+        report('resolve', None)
+        url, hash_type, digest = self.catalog.resolve(core_type, core_version)
+        core_name = url.rsplit('/', 1)[-1]
+
+        # 共享核心放在上级目录的临时目录中，失败后再次创建可续传
+        staging_dir = Path(template.get('parent') or Path.cwd() / "servers") / ".msm-provision"
+        shared_core = staging_dir / core_name
+        self._download(url, shared_core, (hash_type, digest) if digest else None, report, cancel_event)
+
+        context = {
+            'core_type': core_type,
+            'core_version': core_version,
+            'core_name': core_name,
+            'shared_core': shared_core,
+            'script': template.get('script') or self.DEFAULT_SCRIPT,
+            'properties': dict(template.get('properties') or {}),
+            'eula': bool(template.get('eula')),
+        }
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(entries)), thread_name_prefix="MSM-Provision") as pool:
+            futures = [pool.submit(self._create_instance, entry, context, cancel_event) for entry in entries]
+            for entry, future in zip(entries, futures):
+                result = dict(entry, ok=True, error=None)
+                try:
+                    future.result()
+                except Exception as e:
+                    result.update(ok=False, error=str(e))
+                results.append(result)
+                report('instance', result)
+
+        # 有校验和时核心已在本地缓存中，无论如何各实例都已有自己的硬链接
+        try:
+            shared_core.unlink()
+            staging_dir.rmdir()
+        except OSError:
+            pass
+        report('done', results)
+        return results
+
+    def _download(self, url, save_path, checksum, report, cancel_event):
+        """通过下载管理器下载共享核心并等待完成"""
+        if not checksum and validate_jar_file(save_path):
+            return  # 上次批量创建留下的完整文件（有校验和时由下载管理器从缓存取出或重新下载）
+        finished = threading.Event()
+        outcome = {}
+
+        def on_complete(success, error_msg):
+            outcome['success'] = success
+            outcome['error'] = error_msg
+            finished.set()
+
+        download_id = self.download_manager.start_download(
+            url, save_path,
+            lambda percent, downloaded, total: report('download', percent),
+            on_complete,
+            checksum=checksum
+        )
+        if download_id is None:
+            raise RuntimeError("该核心文件正在下载中，请稍后再试")
+        while not finished.wait(0.5):
+            if cancel_event is not None and cancel_event.is_set():
+                self.download_manager.cancel_download(download_id)
+        if not outcome.get('success'):
+            raise Exception(outcome.get('error') or "下载失败")
+
+    def _create_instance(self, entry, context, cancel_event):
+        """准备单个实例目录：核心硬链接、启动脚本、server.properties、eula.txt和msm_config.json"""
+        if cancel_event is not None and cancel_event.is_set():
+            raise Exception("批量创建已取消")
+        server_dir = Path(entry['path'])
+        existed = server_dir.exists()
+        server_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            self._populate_instance(server_dir, entry, context)
+        except Exception:
+            # 删除创建了一半的目录，重新创建时不会因目录不为空而失败
+            shutil.rmtree(server_dir, ignore_errors=True)
+            if existed:
+                server_dir.mkdir(exist_ok=True)
+            raise
+
+    def _populate_instance(self, server_dir, entry, context):
+        substitutions = {'{name}': entry['name'], '{port}': str(entry['port']), '{rcon_port}': str(entry['rcon_port'])}
+
+        def substitute(text):
+            for key, value in substitutions.items():
+                text = text.replace(key, value)
+            return text
+
+        JarCache.place(context['shared_core'], server_dir / context['core_name'])
+
+        script_path = server_dir / START_SCRIPT_NAME
+        script_path.write_text(
+            substitute(context['script'].replace("{core_name}", context['core_name'])), encoding='utf-8'
+        )
+        if os.name != 'nt':
+            script_path.chmod(0o755)
+
+        overrides = {key: substitute(str(value)) for key, value in context['properties'].items()}
+        overrides['server-port'] = str(entry['port'])
+        overrides['query.port'] = str(entry['port'])
+        overrides['rcon.port'] = str(entry['rcon_port'])
+        (server_dir / "server.properties").write_text(
+            self.render_properties(DEFAULT_SERVER_PROPERTIES, overrides), encoding='utf-8'
+        )
+
+        if context['eula']:
+            (server_dir / "eula.txt").write_text(
+                "#By changing the setting below to TRUE you are indicating your agreement to our EULA "
+                "(https://aka.ms/MinecraftEULA).\n"
+                f"#{time.strftime('%a %b %d %H:%M:%S %Y')}\n"
+                "eula=true\n",
+                encoding='utf-8'
+            )
+
+        config = {
+            'server_name': entry['name'],
+            'server_type': context['core_type'],
+            'server_version': context['core_version'],
+            'core_file': context['core_name'],
+            'server_port': entry['port'],
+            'created_time': time.strftime("%Y-%m-%d %H:%M:%S"),
+            'path': str(server_dir)
+        }
+        with open(server_dir / "msm_config.json", 'w', encoding='utf-8') as f:
+            json.dump(config, f, indent=2, ensure_ascii=False)
+
+    @staticmethod
+    def render_properties(base, overrides):
+        """在base的基础上替换已有键、追加新键（保持原有顺序和注释）"""
+        remaining = dict(overrides)
+        lines = []
+        for line in base.splitlines():
+            key = line.split('=', 1)[0].strip() if '=' in line and not line.lstrip().startswith('#') else None
+            if key in remaining:
+                line = f"{key}={remaining.pop(key)}"
+            lines.append(line)
+        lines.extend(f"{key}={value}" for key, value in remaining.items())
+        return "\n".join(lines) + "\n"
 
 class ServerCreationWizard:
-    def __init__(self, root, callback):
+    VERSION_PAGE_SIZE = 50  # 版本下拉列表每次显示的数量
+    MORE_VERSIONS_LABEL = "▼ 显示更多（还有 {count} 个）"
+    VERSION_KIND_LABELS = {'release': "正式版", 'snapshot': "快照/预览版"}
+
+    def __init__(self, root, callback, download_manager=None, catalog=None):
         self.root = root
         self.callback = callback
+        self.download_manager = download_manager or DownloadManager(root, jar_cache=JarCache())
+        self.catalog = catalog or VersionCatalog()
+        self.download_id = None
         
         # 创建向导窗口
         self.window = tk.Toplevel(root)
@@ -1518,15 +5206,22 @@ class ServerCreationWizard:
             'path': '',
             'custom_script': '',
             'core_url': '',
+            'core_hash_type': '',  # 上游提供的校验和（vanilla为sha1，paper为sha256）
+            'core_hash': '',
             'actual_core_file': ''  # 新增：实际下载的文件名
         }
         
-        # 可用版本缓存
-        self.available_versions = {
-            'vanilla': [],
-            'paper': [],
-            'spigot': []
-        }
+        # 完整版本索引（按类型），版本列表按需分页显示
+        self.version_indexes = {}
+        self.displayed_core_type = None
+        self.version_filter = ''
+        self.version_matches = []
+        self.version_page_size = self.VERSION_PAGE_SIZE
+        
+        # 已解析的下载信息 (类型, 版本) -> (URL, 校验算法, 校验和, 说明)
+        self.resolved_cores = {}
+        self.resolving_core = None
+        self.proceed_after_resolve = False
         
         # 初始化UI
         self._setup_ui()
@@ -1616,22 +5311,35 @@ class ServerCreationWizard:
         version_frame = ttk.Frame(self.step1_frame)
         version_frame.pack(fill=tk.X, pady=5)
         
+        # 可输入的版本框：输入时逐步过滤完整版本列表
         self.version_var = tk.StringVar()
-        self.version_combobox = ttk.Combobox(version_frame, textvariable=self.version_var, state="readonly")
+        self.version_combobox = ttk.Combobox(version_frame, textvariable=self.version_var)
         self.version_combobox.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 5))
-        self.version_combobox.bind('<<ComboboxSelected>>', lambda e: self._validate_step1())
+        self.version_combobox.bind('<<ComboboxSelected>>', lambda e: self._on_version_picked())
+        self.version_combobox.bind('<KeyRelease>', self._on_version_typed)
         
         # 刷新按钮
         ttk.Button(
             version_frame, 
             text="刷新版本", 
-            command=self._load_available_versions
+            command=lambda: self._load_available_versions(force=True)
         ).pack(side=tk.RIGHT)
         
+        self.show_snapshots_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            self.step1_frame,
+            text="显示快照和预览版",
+            variable=self.show_snapshots_var,
+            command=lambda: self._filter_versions(reset=True)
+        ).pack(anchor=tk.W)
+        
         # 版本加载状态
         self.version_status = ttk.Label(self.step1_frame, text="正在加载版本列表...", foreground="blue")
         self.version_status.pack(anchor=tk.W, pady=5)
         
+        # 获取下载信息时显示（不阻塞界面）
+        self.resolve_progress = ttk.Progressbar(self.step1_frame, mode='indeterminate')
+        
         # 版本说明
         desc_frame = ttk.LabelFrame(self.step1_frame, text="版本说明")
         desc_frame.pack(fill=tk.X, pady=10)
@@ -1688,7 +5396,7 @@ class ServerCreationWizard:
         self.confirmation_text.pack(fill=tk.BOTH, padx=5, pady=5)
         
         # 自定义启动脚本
-        script_frame = ttk.LabelFrame(self.step3_frame, text="自定义启动脚本")
+        script_frame = ttk.LabelFrame(self.step3_frame, text=f"自定义启动脚本（{START_SCRIPT_NAME}）")
         script_frame.pack(fill=tk.BOTH, expand=True, pady=10)
         
         script_scrollbar = ttk.Scrollbar(script_frame)
@@ -1704,12 +5412,8 @@ class ServerCreationWizard:
         self.script_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         script_scrollbar.config(command=self.script_text.yview)
         
-        # 设置默认启动脚本
-        default_script = """@echo off
-title Minecraft Server - %CD%
-java -Xms1G -Xmx2G -jar {core_name} nogui
-pause >nul"""
-        self.script_text.insert(tk.END, default_script)
+        # 设置默认启动脚本（与当前系统使用的启动脚本一致）
+        self.script_text.insert(tk.END, ServerProvisioner.DEFAULT_SCRIPT)
         
         # 脚本说明
         ttk.Label(self.step3_frame, text="提示: {core_name} 会被自动替换为实际的服务器核心文件名", 
@@ -1746,7 +5450,8 @@ pause >nul"""
     
     def _validate_step1(self):
         """验证步骤1"""
-        if self.version_var.get():
+        index = self._current_index()
+        if index is not None and self.version_var.get() in index:
             self.next_btn.config(state=tk.NORMAL)
         else:
             self.next_btn.config(state=tk.DISABLED)
@@ -1774,53 +5479,206 @@ pause >nul"""
             self.path_var.set(path)
             self._validate_step2()
     
-    def _load_available_versions(self):
-        """加载可用的服务器版本"""
+    def _load_available_versions(self, force=False):
+        """加载可用的服务器版本（优先使用版本目录缓存，过期时在后台重新验证）"""
         core_type = self.core_type_var.get()
         
+        # 缓存中有版本索引时立即显示
+        index = None if force else self.catalog.cached_index(core_type)
+        if index is not None:
+            self._show_versions(core_type, index)
+            if not self.catalog.needs_refresh(core_type):
+                return
+        else:
+            self.version_status.config(text="正在加载版本列表...", foreground="blue")
+        
         def worker():
             try:
-                self.root.after(0, lambda: self.version_status.config(text="正在加载版本列表...", foreground="blue"))
-                
-                if core_type == 'vanilla':
-                    response = requests.get("https://launchermeta.mojang.com/mc/game/version_manifest.json", timeout=10)
-                    response.raise_for_status()
-                    data = response.json()
-                    versions = [v['id'] for v in data['versions'] if v['type'] == 'release'][:20]  # 只显示最近20个版本
-                    
-                elif core_type == 'paper':
-                    response = requests.get("https://api.papermc.io/v2/projects/paper", timeout=10)
-                    response.raise_for_status()
-                    data = response.json()
-                    versions = data['versions'][-10:]  # 显示最近10个版本
-                    
-                elif core_type == 'spigot':
-                    versions = self._get_spigot_versions()
-                
-                self.available_versions[core_type] = versions
-                
-                # 更新UI
-                self.root.after(0, lambda: self._update_version_combobox(versions))
-                self.root.after(0, lambda: self.version_status.config(text=f"找到 {len(versions)} 个可用版本", foreground="green"))
-                
-                # 更新版本说明
-                desc = f"{core_type.capitalize()} 服务器 - 推荐选择最新稳定版本"
-                self.root.after(0, lambda: self._update_version_desc(desc))
-                
+                index = self.catalog.index(core_type, revalidate=force)
+                self.root.after(0, lambda: self._show_versions(core_type, index))
             except Exception as e:
                 error_msg = f"加载版本失败: {str(e)}"
-                self.root.after(0, lambda: self.version_status.config(text=error_msg, foreground="red"))
-                self.root.after(0, lambda: self._update_version_combobox([]))
+                def show_error():
+                    # 已显示缓存的版本列表时不清空
+                    if self.core_type_var.get() == core_type and core_type not in self.version_indexes:
+                        self.version_status.config(text=error_msg, foreground="red")
+                        self._update_version_combobox(None)
+                self.root.after(0, show_error)
+        
+        threading.Thread(target=worker, daemon=True).start()
+    
+    def _show_versions(self, core_type, index):
+        """显示版本索引（类型已切换时忽略；索引未变化时不重新生成列表）"""
+        if self.core_type_var.get() != core_type:
+            return
+        if self.version_indexes.get(core_type) is not index or self.displayed_core_type != core_type:
+            refreshed = self.displayed_core_type == core_type and core_type in self.version_indexes
+            self.version_indexes[core_type] = index
+            self.displayed_core_type = core_type
+            if refreshed:
+                # 后台重新验证得到了新的索引：保留用户的过滤条件和选择
+                self._filter_versions()
+            else:
+                self._update_version_combobox(index)
+        
+        # 更新版本说明
+        self._update_version_desc(f"{core_type.capitalize()} 服务器 - 推荐选择最新稳定版本")
+        self._on_version_selected()
+    
+    def _current_index(self):
+        return self.version_indexes.get(self.core_type_var.get())
+    
+    def _filter_versions(self, reset=False):
+        """按输入内容过滤版本列表，只把第一页放入下拉框"""
+        index = self._current_index()
+        if index is None:
+            return
+        if reset:
+            self.version_page_size = self.VERSION_PAGE_SIZE
+        kinds = None if self.show_snapshots_var.get() else ('release',)
+        self.version_matches = index.search(self.version_filter, kinds)
+        self._render_version_page()
+        if self.version_filter:
+            self.version_status.config(text=f"匹配 {len(self.version_matches)} 个版本（共 {len(index)} 个）", foreground="green")
+        else:
+            self.version_status.config(text=f"找到 {len(self.version_matches)} 个可用版本", foreground="green")
+    
+    def _render_version_page(self):
+        index = self._current_index()
+        values = index.page(self.version_matches, 0, self.version_page_size)
+        remaining = len(self.version_matches) - len(values)
+        if remaining > 0:
+            values.append(self.MORE_VERSIONS_LABEL.format(count=remaining))
+        self.version_combobox['values'] = values
+    
+    def _on_version_typed(self, event):
+        """输入时逐步过滤（方向键、回车等不改变内容的按键忽略）"""
+        if event.keysym in ('Up', 'Down', 'Left', 'Right', 'Return', 'Escape', 'Tab'):
+            return
+        text = self.version_var.get().strip()
+        if text == self.version_filter:
+            return
+        self.version_filter = text
+        self._filter_versions(reset=True)
+        self._on_version_selected()
+    
+    def _on_version_picked(self):
+        """从下拉框选择：选中“显示更多”时加载下一页并重新展开"""
+        if self.version_var.get().startswith(self.MORE_VERSIONS_LABEL.split('{')[0]):
+            self.version_var.set(self.version_filter)
+            self.version_page_size += self.VERSION_PAGE_SIZE
+            self._render_version_page()
+            self.version_combobox.icursor(tk.END)
+            self.version_combobox.after_idle(lambda: self.version_combobox.event_generate('<Down>'))
+            return
+        self._on_version_selected()
+    
+    def _on_version_selected(self):
+        """选择版本后在后台预取下载信息，点击下一步时可直接从缓存获取"""
+        self._validate_step1()
+        core_type = self.core_type_var.get()
+        version = self.version_var.get()
+        index = self._current_index()
+        if index is None or version not in index:
+            return
+        self._describe_version(core_type, version)
+        self._resolve_core((core_type, version), proceed=False)
+    
+    def _describe_version(self, core_type, version):
+        """版本说明：类型，已解析时附带构建和校验信息"""
+        index = self.version_indexes.get(core_type)
+        kind = index.kind(version) if index is not None else None
+        desc = f"{core_type.capitalize()} {version}（{self.VERSION_KIND_LABELS.get(kind, kind)}）"
+        info = self.resolved_cores.get((core_type, version))
+        if info is not None and info[3]:
+            desc += f"\n{info[3]}"
+        self._update_version_desc(desc)
+    
+    def _resolve_core(self, key, proceed):
+        """
+        在后台获取下载地址和上游校验和
+        :param proceed: 完成后自动进入下一步（点击“下一步”时）
+        """
+        if proceed:
+            self.proceed_after_resolve = True
+            self._set_resolving(key)
+        if self.resolving_core == key:
+            return  # 已在获取中（如选择版本时的预取）
+        self.resolving_core = key
+        core_type, version = key
         
+        def worker():
+            try:
+                url, hash_type, digest = self.catalog.resolve(core_type, version)
+                detail = ""
+                if core_type == 'paper':
+                    build = self.catalog.latest_paper_build(version)
+                    channel = "稳定" if build['channel'] == 'default' else build['channel']
+                    detail = f"构建 #{build['build']}（{channel}）"
+                if hash_type:
+                    detail += f"{'，' if detail else ''}{hash_type}: {digest[:12]}…"
+                info = (url, hash_type, digest, detail)
+                self.root.after(0, lambda: self._on_core_resolved(key, info, None))
+            except Exception as e:
+                error_msg = str(e)
+                self.root.after(0, lambda: self._on_core_resolved(key, None, error_msg))
         threading.Thread(target=worker, daemon=True).start()
     
-    def _update_version_combobox(self, versions):
-        """更新版本选择框"""
-        self.version_combobox['values'] = versions
-        if versions:
-            self.version_combobox.set(versions[-1])  # 默认选择最新版本
-            self.version_combobox.config(state="readonly")
+    def _set_resolving(self, key):
+        """获取下载信息期间显示进度并禁用导航"""
+        if key is None:
+            self.resolve_progress.stop()
+            self.resolve_progress.pack_forget()
+            self.prev_btn.config(state=tk.NORMAL)
+            self.version_combobox.config(state="normal")
+            self._validate_step1()
+            return
+        self.version_status.config(text=f"正在获取 {key[0].capitalize()} {key[1]} 的下载信息...", foreground="blue")
+        self.resolve_progress.pack(fill=tk.X, pady=5)
+        self.resolve_progress.start(10)
+        self.prev_btn.config(state=tk.DISABLED)
+        self.next_btn.config(state=tk.DISABLED)
+        self.version_combobox.config(state="disabled")
+    
+    def _on_core_resolved(self, key, info, error_msg):
+        """下载信息获取完成（主线程）"""
+        if info is not None:
+            self.resolved_cores[key] = info
+        if key != self.resolving_core:
+            return  # 已切换到其他版本
+        self.resolving_core = None
+        proceed = self.proceed_after_resolve
+        self.proceed_after_resolve = False
+        try:
+            if not self.window.winfo_exists():
+                return
+        except tk.TclError:
+            return
+        current = (self.core_type_var.get(), self.version_var.get().strip())
+        if info is not None and current == key:
+            self._describe_version(*key)
+        if not proceed:
+            if info is None:
+                print(f"预取下载信息失败: {error_msg}")
+            return
+        self._set_resolving(None)
+        if info is None:
+            self.version_status.config(text="获取下载信息失败", foreground="red")
+            messagebox.showerror("错误", f"无法获取下载信息:\n{error_msg}\n\n请检查网络连接或选择其他版本")
+        elif self.current_step == 1 and current == key:
+            self.version_status.config(text="下载信息已就绪", foreground="green")
+            self._next_step()
+    
+    def _update_version_combobox(self, index):
+        """更新版本选择框（清空过滤条件，默认选择最新正式版）"""
+        self.version_filter = ''
+        if index is not None and len(index):
+            self.version_combobox.config(state="normal")
+            self._filter_versions(reset=True)
+            releases = index.versions(('release',))
+            self.version_combobox.set(releases[0] if releases else index.entries[0][0])
         else:
+            self.version_combobox['values'] = []
             self.version_combobox.set("")
             self.version_combobox.config(state="disabled")
     
@@ -1857,18 +5715,23 @@ pause >nul"""
             self.server_data['core_type'] = self.core_type_var.get()
         
         elif self.current_step == 1:
-            version = self.version_var.get()
+            version = self.version_var.get().strip()
             if not version:
                 messagebox.showerror("错误", "请选择服务器版本")
                 return False
+            index = self._current_index()
+            if index is None or version not in index:
+                messagebox.showerror("错误", f"找不到版本: {version}\n请从列表中选择")
+                return False
             self.server_data['core_version'] = version
             
-            # 生成下载URL
-            core_url = self._get_core_url()
-            if not core_url:
-                messagebox.showerror("错误", "无法生成下载链接，请检查版本号是否正确")
+            # 下载地址和上游校验和在后台获取，完成后自动进入下一步
+            key = (self.server_data['core_type'], version)
+            info = self.resolved_cores.get(key)
+            if info is None:
+                self._resolve_core(key, proceed=True)
                 return False
-            self.server_data['core_url'] = core_url
+            self.server_data['core_url'], self.server_data['core_hash_type'], self.server_data['core_hash'] = info[:3]
         
         elif self.current_step == 2:
             path = self.path_var.get().strip()
@@ -1887,79 +5750,6 @@ pause >nul"""
         
         return True
     
-    def _get_core_url(self):
-        """获取服务器核心下载URL"""
-        core_type = self.server_data['core_type']
-        version = self.server_data['core_version']
-        
-        try:
-            if core_type == 'vanilla':
-                return self._get_vanilla_url(version)
-            elif core_type == 'paper':
-                return self._get_paper_url(version)
-            elif core_type == 'spigot':
-                return self._get_spigot_url(version)
-        except Exception as e:
-            print(f"生成下载URL失败: {e}")
-            return ""
-        
-        return ""
-    
-    def _get_paper_url(self, version):
-        """修复Paper下载URL生成"""
-        try:
-            # 方法1：尝试获取最新构建信息
-            builds_url = f"https://api.papermc.io/v2/projects/paper/versions/{version}/builds"
-            try:
-                response = requests.get(builds_url, timeout=10)
-                if response.status_code == 200:
-                    data = response.json()
-                    if data['builds']:
-                        latest_build = data['builds'][-1]
-                        build_number = latest_build['build']
-                        return f"https://api.papermc.io/v2/projects/paper/versions/{version}/builds/{build_number}/downloads/paper-{version}-{build_number}.jar"
-            except:
-                pass
-            
-            # 方法2：使用latest标签（备用方案）
-            return f"https://api.papermc.io/v2/projects/paper/versions/{version}/builds/latest/downloads/paper-{version}-latest.jar"
-            
-        except Exception as e:
-            print(f"获取Paper URL失败，使用备用方案: {e}")
-            # 方法3：硬编码已知可用的URL
-            return f"https://api.papermc.io/v2/projects/paper/versions/{version}/builds/latest/downloads/paper-{version}-latest.jar"
-    
-    def _get_vanilla_url(self, version):
-        """获取Vanilla核心下载URL"""
-        try:
-            response = requests.get("https://launchermeta.mojang.com/mc/game/version_manifest.json", timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            for version_info in data['versions']:
-                if version_info['id'] == version:
-                    detail_response = requests.get(version_info['url'], timeout=10)
-                    detail_data = detail_response.json()
-                    return detail_data['downloads']['server']['url']
-            
-            return f"https://piston-data.mojang.com/v1/objects/8f3112a1049751cc472ec13e397eade5336ca7ae/server.jar"  # 默认URL
-            
-        except Exception:
-            return f"https://piston-data.mojang.com/v1/objects/8f3112a1049751cc472ec13e397eade5336ca7ae/server.jar"
-    
-    def _get_spigot_url(self, version):
-        """获取Spigot核心下载URL"""
-        # 使用可靠的下载源
-        base_urls = [
-            f"https://download.cdn.getbukkit.org/spigot/spigot-{version}.jar",
-            f"https://cdn.getbukkit.org/spigot/spigot-{version}.jar"
-        ]
-        return base_urls[0]
-    
-    def _get_spigot_versions(self):
-        """获取Spigot版本列表"""
-        return ['1.20.1', '1.19.4', '1.18.2', '1.17.1', '1.16.5', '1.15.2', '1.14.4']
-    
     def _finish_creation(self):
         """完成创建"""
         # 获取自定义脚本
@@ -2016,88 +5806,68 @@ pause >nul"""
         self.cancel_btn = ttk.Button(btn_frame, text="取消", command=self._cancel_download)
         self.cancel_btn.pack(side=tk.RIGHT)
         
-        # 在后台线程中下载
+        # 交给下载管理器在后台下载
         self.download_cancelled = False
-        threading.Thread(target=self._download_core, daemon=True).start()
+        self._download_core()
     
     def _cancel_download(self):
-        """取消下载"""
+        """取消下载（已下载部分保留，重新创建时续传）"""
         self.download_cancelled = True
+        if self.download_id:
+            self.download_manager.cancel_download(self.download_id)
         if hasattr(self, 'download_window') and self.download_window.winfo_exists():
             self.download_window.destroy()
         messagebox.showinfo("提示", "下载已取消")
     
     def _download_core(self):
-        """下载服务器核心"""
+        """通过下载管理器下载服务器核心（有上游校验和时校验并使用本地缓存）"""
         try:
             # 准备服务器目录
             server_dir = Path(self.server_data['path']) / self.server_data['name']
             server_dir.mkdir(parents=True, exist_ok=True)
-            
-            # 从URL中提取实际文件名
-            core_url = self.server_data['core_url']
-            expected_filename = core_url.split('/')[-1]
-            save_path = server_dir / expected_filename
-            
-            self.root.after(0, lambda: self.progress_label.config(text=f"下载文件: {expected_filename}"))
-            
-            # 开始下载
-            response = requests.get(core_url, stream=True, timeout=30)
-            response.raise_for_status()
-            
-            total_size = int(response.headers.get('content-length', 0))
-            downloaded = 0
-            
-            with open(save_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if self.download_cancelled:
-                        raise Exception("下载被用户取消")
-                    
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        
-                        # 更新进度
-                        if total_size > 0:
-                            progress = (downloaded / total_size) * 100
-                            self.root.after(0, lambda: self.progress_var.set(progress))
-                            self.root.after(0, lambda: self.progress_label.config(
-                                text=f"下载中: {downloaded/1024/1024:.1f}MB / {total_size/1024/1024:.1f}MB ({progress:.1f}%)"
-                            ))
-            
-            # 验证下载的文件
-            if not self._validate_jar_file(save_path):
-                raise Exception("下载的文件不是有效的JAR文件")
-            
-            # 记录实际文件名
-            self.server_data['actual_core_file'] = expected_filename
-            
-            # 下载成功
-            self.root.after(0, lambda: self._handle_download_completion(True, None))
-            
         except Exception as e:
-            if not self.download_cancelled:
-                self.root.after(0, lambda: self._handle_download_completion(False, str(e)))
+            self._handle_download_completion(False, f"无法创建服务器目录: {e}")
+            return
+        
+        # 从URL中提取实际文件名
+        core_url = self.server_data['core_url']
+        expected_filename = core_url.split('/')[-1]
+        save_path = server_dir / expected_filename
+        self.server_data['actual_core_file'] = expected_filename
+        self.progress_label.config(text=f"下载文件: {expected_filename}")
+        
+        digest = self.server_data.get('core_hash')
+        checksum = (self.server_data.get('core_hash_type'), digest) if digest else None
+        self.download_id = self.download_manager.start_download(
+            core_url,
+            str(save_path),
+            self._on_download_progress,
+            self._on_download_finished,
+            checksum
+        )
+        if self.download_id is None:
+            self._handle_download_completion(False, "该文件已在下载中")
     
-    def _validate_jar_file(self, file_path):
-        """验证JAR文件是否有效"""
+    def _on_download_progress(self, progress, downloaded, total_size):
+        """下载进度（已由下载管理器节流）"""
         try:
-            if not os.path.exists(file_path):
-                return False
-            
-            file_size = os.path.getsize(file_path)
-            if file_size < 1024:  # 小于1KB的文件无效
-                return False
-            
-            # 检查JAR文件头
-            with open(file_path, 'rb') as f:
-                header = f.read(4)
-                if header[:2] != b'PK':  # JAR文件以PK开头
-                    return False
-            
-            return True
-        except Exception:
-            return False
+            if not self.download_window.winfo_exists():
+                return
+            self.progress_var.set(progress)
+            if total_size > 0:
+                text = f"下载中: {downloaded/1024/1024:.1f}MB / {total_size/1024/1024:.1f}MB ({progress:.1f}%)"
+            elif downloaded:
+                text = f"下载中: {downloaded/1024/1024:.1f}MB"
+            else:
+                text = "已从本地缓存获取"
+            self.progress_label.config(text=text)
+        except tk.TclError:
+            pass
+    
+    def _on_download_finished(self, success, error_msg):
+        if self.download_cancelled:
+            return
+        self._handle_download_completion(success, error_msg)
     
     def _handle_download_completion(self, success, error_msg=None):
         """处理下载完成事件（修复版）"""
@@ -2127,8 +5897,10 @@ pause >nul"""
             # 保存启动脚本（使用实际找到的核心文件名）
             script_content = self.server_data['custom_script'].replace("{core_name}", actual_core_file)
             
-            bat_path = server_dir / "start.bat"
-            bat_path.write_text(script_content, encoding='utf-8')
+            script_path = server_dir / START_SCRIPT_NAME
+            script_path.write_text(script_content + "\n", encoding='utf-8')
+            if os.name != 'nt':
+                script_path.chmod(0o755)
             
             # 创建服务器配置文件
             self._create_server_config(server_dir)
@@ -2183,40 +5955,279 @@ pause >nul"""
 3. 磁盘空间是否充足
 4. 防火墙或安全软件设置
 
-服务器信息:
-- 类型: {self.server_data['core_type']}
-- 版本: {self.server_data['core_version']}
-- 下载URL: {self.server_data.get('core_url', 'N/A')}"""
-        
-        messagebox.showerror("下载失败", detailed_error)
-        
-        # 清理失败的文件
-        if 'server_dir' in locals():
-            server_dir = Path(self.server_data['path']) / self.server_data['name']
-            self._cleanup_failed_creation(server_dir)
-    
-    def _cleanup_failed_creation(self, server_dir):
-        """清理创建失败的服务器目录"""
+服务器信息:
+- 类型: {self.server_data['core_type']}
+- 版本: {self.server_data['core_version']}
+- 下载URL: {self.server_data.get('core_url', 'N/A')}"""
+        
+        messagebox.showerror("下载失败", detailed_error)
+        
+        # 清理失败的文件
+        if 'server_dir' in locals():
+            server_dir = Path(self.server_data['path']) / self.server_data['name']
+            self._cleanup_failed_creation(server_dir)
+    
+    def _cleanup_failed_creation(self, server_dir):
+        """清理创建失败的服务器目录"""
+        try:
+            if server_dir.exists():
+                # 只删除下载的核心文件，保留其他可能的手动文件
+                for jar_file in server_dir.glob("*.jar"):
+                    try:
+                        jar_file.unlink()
+                    except:
+                        pass
+                # 删除配置文件
+                for config_file in server_dir.glob("*.json"):
+                    try:
+                        config_file.unlink()
+                    except:
+                        pass
+        except Exception as e:
+            print(f"清理失败: {e}")
+
+class BatchProvisionDialog:
+    """批量创建服务器对话框（活动时一次创建多个相同配置的服务器）"""
+    def __init__(self, root, provisioner, callback, reserved_ports=()):
+        self.root = root
+        self.provisioner = provisioner
+        self.callback = callback
+        self.reserved_ports = set(reserved_ports)
+        self.cancel_event = threading.Event()
+        self.running = False
+
+        self.window = tk.Toplevel(root)
+        self.window.title("批量创建服务器")
+        self.window.geometry("620x620")
+        self.window.transient(root)
+        self.window.grab_set()
+        self.window.protocol("WM_DELETE_WINDOW", self._close)
+
+        self._setup_ui()
+        self._load_versions()
+
+    def _setup_ui(self):
+        form = ttk.Frame(self.window)
+        form.pack(fill=tk.X, padx=20, pady=10)
+        form.columnconfigure(1, weight=1)
+
+        ttk.Label(form, text="服务器类型:").grid(row=0, column=0, sticky=tk.W, pady=3)
+        self.core_type_var = tk.StringVar(value='paper')
+        type_combo = ttk.Combobox(form, textvariable=self.core_type_var, values=['vanilla', 'paper', 'spigot'], state='readonly')
+        type_combo.grid(row=0, column=1, sticky=tk.EW, pady=3)
+        type_combo.bind('<<ComboboxSelected>>', lambda e: self._load_versions())
+
+        ttk.Label(form, text="版本:").grid(row=1, column=0, sticky=tk.W, pady=3)
+        self.version_var = tk.StringVar()
+        self.version_combo = ttk.Combobox(form, textvariable=self.version_var, state='readonly')
+        self.version_combo.grid(row=1, column=1, sticky=tk.EW, pady=3)
+
+        ttk.Label(form, text="上级目录:").grid(row=2, column=0, sticky=tk.W, pady=3)
+        path_frame = ttk.Frame(form)
+        path_frame.grid(row=2, column=1, sticky=tk.EW, pady=3)
+        self.parent_var = tk.StringVar(value=str(Path.cwd() / "servers"))
+        ttk.Entry(path_frame, textvariable=self.parent_var).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 5))
+        ttk.Button(path_frame, text="浏览...", command=self._browse_parent).pack(side=tk.RIGHT)
+
+        ttk.Label(form, text="名称模板:").grid(row=3, column=0, sticky=tk.W, pady=3)
+        self.pattern_var = tk.StringVar(value="event-{n:02d}")
+        ttk.Entry(form, textvariable=self.pattern_var).grid(row=3, column=1, sticky=tk.EW, pady=3)
+
+        numbers = ttk.Frame(form)
+        numbers.grid(row=4, column=0, columnspan=2, sticky=tk.W, pady=3)
+        ttk.Label(numbers, text="数量:").pack(side=tk.LEFT)
+        self.count_var = tk.IntVar(value=10)
+        ttk.Spinbox(numbers, from_=1, to=ServerProvisioner.MAX_INSTANCES, textvariable=self.count_var, width=6).pack(side=tk.LEFT, padx=(5, 15))
+        ttk.Label(numbers, text="起始序号:").pack(side=tk.LEFT)
+        self.start_var = tk.IntVar(value=1)
+        ttk.Spinbox(numbers, from_=0, to=9999, textvariable=self.start_var, width=6).pack(side=tk.LEFT, padx=(5, 15))
+        ttk.Label(numbers, text="起始端口:").pack(side=tk.LEFT)
+        self.port_var = tk.IntVar(value=25565)
+        ttk.Spinbox(numbers, from_=1024, to=65535, textvariable=self.port_var, width=7).pack(side=tk.LEFT, padx=5)
+
+        ttk.Label(form, text="提示: {n} 为序号；端口从起始端口开始自动分配，跳过已占用的端口",
+                  font=('Arial', 8), foreground="gray").grid(row=5, column=0, columnspan=2, sticky=tk.W)
+
+        script_frame = ttk.LabelFrame(self.window, text=f"启动脚本（{START_SCRIPT_NAME}）")
+        script_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=5)
+        self.script_text = tk.Text(script_frame, height=5, wrap=tk.WORD, font=('Courier New', 9))
+        self.script_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.script_text.insert(tk.END, ServerProvisioner.DEFAULT_SCRIPT)
+
+        props_frame = ttk.LabelFrame(self.window, text="server.properties（每行一个 键=值，{name}、{port} 会被替换）")
+        props_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=5)
+        self.props_text = tk.Text(props_frame, height=4, wrap=tk.NONE, font=('Courier New', 9))
+        self.props_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.props_text.insert(tk.END, "motd={name}\nmax-players=20")
+
+        self.eula_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            self.window,
+            text="我已阅读并同意 Minecraft EULA (https://aka.ms/MinecraftEULA)",
+            variable=self.eula_var
+        ).pack(anchor=tk.W, padx=20, pady=5)
+
+        self.progress = ttk.Progressbar(self.window, mode='determinate')
+        self.progress.pack(fill=tk.X, padx=20, pady=5)
+        self.status_label = ttk.Label(self.window, text="")
+        self.status_label.pack(anchor=tk.W, padx=20)
+
+        btn_frame = ttk.Frame(self.window)
+        btn_frame.pack(fill=tk.X, padx=20, pady=10)
+        self.create_btn = ttk.Button(btn_frame, text="开始创建", command=self._start)
+        self.create_btn.pack(side=tk.RIGHT)
+        self.cancel_btn = ttk.Button(btn_frame, text="取消", command=self._close)
+        self.cancel_btn.pack(side=tk.RIGHT, padx=5)
+
+    def _browse_parent(self):
+        path = filedialog.askdirectory(title="选择服务器存放目录")
+        if path:
+            self.parent_var.set(path)
+
+    def _load_versions(self):
+        """优先显示缓存中的版本列表，没有缓存时在后台获取"""
+        core_type = self.core_type_var.get()
+        versions = self.provisioner.catalog.cached_versions(core_type)
+        if versions:
+            self._show_versions(core_type, versions)
+            return
+        self.status_label.config(text="正在获取版本列表...")
+
+        def worker():
+            try:
+                result = self.provisioner.catalog.versions(core_type)
+                self.root.after(0, lambda: self._show_versions(core_type, result))
+            except Exception as e:
+                error_msg = f"获取版本列表失败: {e}"
+                self.root.after(0, lambda: self._set_status(error_msg))
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _show_versions(self, core_type, versions):
+        if not self.window.winfo_exists() or core_type != self.core_type_var.get():
+            return
+        self.version_combo['values'] = versions
+        if versions and self.version_var.get() not in versions:
+            self.version_var.set(versions[0])
+        self._set_status("")
+
+    def _set_status(self, text):
+        if self.window.winfo_exists():
+            self.status_label.config(text=text)
+
+    def _parse_properties(self):
+        properties = {}
+        for line in self.props_text.get(1.0, tk.END).splitlines():
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if '=' not in line:
+                raise ValueError(f"无效的配置行: {line}")
+            key, value = line.split('=', 1)
+            properties[key.strip()] = value.strip()
+        return properties
+
+    def _build_template(self):
+        if not self.version_var.get():
+            raise ValueError("请选择服务器版本")
+        try:
+            count, start, base_port = self.count_var.get(), self.start_var.get(), self.port_var.get()
+        except tk.TclError:
+            raise ValueError("数量、序号和端口必须是整数")
+        return {
+            'core_type': self.core_type_var.get(),
+            'core_version': self.version_var.get(),
+            'parent': self.parent_var.get().strip(),
+            'name_pattern': self.pattern_var.get(),
+            'count': count,
+            'start': start,
+            'base_port': base_port,
+            'reserved_ports': self.reserved_ports,
+            'script': self.script_text.get(1.0, tk.END).rstrip() + "\n",
+            'properties': self._parse_properties(),
+            'eula': self.eula_var.get(),
+        }
+
+    def _start(self):
         try:
-            if server_dir.exists():
-                # 只删除下载的核心文件，保留其他可能的手动文件
-                for jar_file in server_dir.glob("*.jar"):
-                    try:
-                        jar_file.unlink()
-                    except:
-                        pass
-                # 删除配置文件
-                for config_file in server_dir.glob("*.json"):
-                    try:
-                        config_file.unlink()
-                    except:
-                        pass
+            template = self._build_template()
+            entries = self.provisioner.plan(template)
         except Exception as e:
-            print(f"清理失败: {e}")
+            messagebox.showerror("错误", str(e), parent=self.window)
+            return
+        if not template['eula'] and not messagebox.askyesno(
+                "EULA", "未同意Minecraft EULA，服务器首次启动时需要逐个确认。\n是否继续？", parent=self.window):
+            return
+
+        self.running = True
+        self.cancel_event.clear()
+        self.create_btn.config(state=tk.DISABLED)
+        self.progress.config(maximum=100, value=0)
+        self.total = len(entries)
+        self.finished = 0
+        self._set_status(f"准备创建 {self.total} 个服务器: {entries[0]['name']} ... {entries[-1]['name']}")
+
+        def report(stage, data):
+            self.root.after(0, lambda: self._on_progress(stage, data))
+
+        def worker():
+            try:
+                self.provisioner.provision(template, report, self.cancel_event)
+            except Exception as e:
+                error_msg = str(e)
+                self.root.after(0, lambda: self._on_failed(error_msg))
+        threading.Thread(target=worker, name="MSM-BatchProvision", daemon=True).start()
+
+    def _on_progress(self, stage, data):
+        if stage == 'done':
+            # 对话框关闭后仍把已创建的服务器交给主程序
+            self._on_done(data)
+            return
+        if not self.window.winfo_exists():
+            return  # 对话框已关闭，后台任务剩余的进度报告直接丢弃
+        if stage == 'resolve':
+            self._set_status("正在获取核心下载地址...")
+        elif stage == 'download':
+            # 下载占进度条的前一半
+            self.progress.config(value=data / 2)
+            self._set_status(f"正在下载共享核心: {data:.1f}%")
+        elif stage == 'instance':
+            self.finished += 1
+            self.progress.config(value=50 + 50 * self.finished / self.total)
+            self._set_status(f"已创建 {self.finished}/{self.total}: {data['name']}（端口 {data['port']}）")
+
+    def _on_done(self, results):
+        self.running = False
+        created = [r for r in results if r['ok']]
+        failed = [r for r in results if not r['ok']]
+        # 先把创建成功的服务器交给主程序
+        if created:
+            self.callback(results)
+        message = f"✅ 已创建 {len(created)} 个服务器"
+        if failed:
+            message += f"，{len(failed)} 个失败:\n" + "\n".join(f"{r['name']}: {r['error']}" for r in failed[:10])
+        if self.window.winfo_exists():
+            (messagebox.showwarning if failed else messagebox.showinfo)("批量创建", message, parent=self.window)
+            self.window.destroy()
+
+    def _on_failed(self, error_msg):
+        self.running = False
+        if self.window.winfo_exists():
+            self.create_btn.config(state=tk.NORMAL)
+            self._set_status("")
+            messagebox.showerror("批量创建失败", f"无法批量创建服务器:\n{error_msg}", parent=self.window)
+
+    def _close(self):
+        """创建过程中关闭时取消剩余任务（已下载部分保留，下次续传）"""
+        if self.running:
+            if not messagebox.askyesno("确认", "批量创建正在进行，确定要取消吗？", parent=self.window):
+                return
+            self.cancel_event.set()
+        self.window.destroy()
 
 class MinecraftServerManager:
-    def __init__(self, root):
+    def __init__(self, root, profiler=None):
         self.root = root
+        self.profiler = profiler or StartupProfiler()
         self.root.title("Minecraft Server Manager v1.2")
         self.root.geometry("900x600")
         
@@ -2227,22 +6238,46 @@ class MinecraftServerManager:
         except Exception as e:
             messagebox.showerror("错误", f"Error:{e}。可能为图标加载失败。")
         
-        # 配置目录和文件
-        self.msm_dir = Path.home() / ".msm"
-        self.msm_dir.mkdir(exist_ok=True)
-        self.config_file = self.msm_dir / "MSM.ini"
-        
-        # 配置解析器
-        self.config = configparser.ConfigParser()
+        # 服务器管理核心（配置、进程生命周期），界面只是它的一个客户端
+        self.engine = ServerEngine()
+        self.msm_dir = self.engine.msm_dir
+        self.config_file = self.engine.config_file
+        self.supervisor = self.engine.supervisor
+        self.supervisor_events = self.engine.events
+        self.profiler.mark("服务器引擎")
+        
+        # 控制台刷新参数（可在MSM.ini的[Console]节中配置）
+        config = self.engine.config
+        self.console_flush_interval = config.getint('Console', 'flush_interval_ms', fallback=50)
+        self.console_max_lines_per_flush = config.getint('Console', 'max_lines_per_flush', fallback=500)
+        self.console_scrollback_lines = config.getint('Console', 'scrollback_lines', fallback=10000)
+        
+        # 服务器核心缓存（可在MSM.ini的[Cache]节中配置大小上限）
+        self.jar_cache = JarCache(
+            self.msm_dir / "cache",
+            max_bytes=config.getint('Cache', 'max_size_mb', fallback=2048) * 1024 * 1024
+        )
+        # 所有核心下载共用一个下载管理器（可在MSM.ini的[Download]节中配置并发数）
+        self.download_manager = DownloadManager(
+            self.root,
+            max_connections=config.getint('Download', 'connections_per_file', fallback=4),
+            max_concurrent=config.getint('Download', 'max_concurrent', fallback=2),
+            jar_cache=self.jar_cache
+        )
+        # 版本目录：启动时在后台预取，向导直接从缓存读取版本列表
+        self.version_catalog = VersionCatalog(
+            self.msm_dir / "cache" / "catalog",
+            ttl=config.getint('Cache', 'catalog_ttl_hours', fallback=6) * 3600
+        )
+        self.version_catalog.prefetch_in_background()
+        # 批量创建服务器（可在MSM.ini的[Provision]节中配置并行数）
+        self.provisioner = ServerProvisioner(
+            self.version_catalog,
+            self.download_manager,
+            max_workers=config.getint('Provision', 'max_workers', fallback=ServerProvisioner.MAX_WORKERS)
+        )
         
-        # 安全地读取配置文件
-        if self.config_file.exists():
-            try:
-                self.config.read(self.config_file, encoding='utf-8')
-            except Exception as e:
-                print(f"读取配置文件失败: {e}")
-                # 创建新的配置文件
-                self.config = configparser.ConfigParser()
+        self.profiler.mark("缓存和下载")
         
         # UI初始化
         self.main_frame = ttk.Frame(root)
@@ -2250,6 +6285,8 @@ class MinecraftServerManager:
         
         self.notebook = ttk.Notebook(self.main_frame)
         self.notebook.pack(fill=tk.BOTH, expand=True)
+        # 标签页内容在首次选中时才创建
+        self.notebook.bind('<<NotebookTabChanged>>', lambda e: self._ensure_selected_tab_body())
         
         # 控制按钮区域
         control_frame = ttk.Frame(self.main_frame)
@@ -2261,6 +6298,12 @@ class MinecraftServerManager:
             command=self.show_server_wizard
         ).pack(side=tk.LEFT, padx=10)
         
+        ttk.Button(
+            control_frame,
+            text="批量创建",
+            command=self.show_batch_provision
+        ).pack(side=tk.LEFT, padx=10)
+        
         ttk.Button(
             control_frame,
             text="添加已有服务器",
@@ -2274,9 +6317,14 @@ class MinecraftServerManager:
             command=self.delete_current_server
         ).pack(side=tk.RIGHT, padx=10)
         
+        # 状态栏：所有运行中服务器的资源占用
+        self.resource_status_var = tk.StringVar(value="")
+        ttk.Label(control_frame, textvariable=self.resource_status_var).pack(side=tk.LEFT, padx=10)
+        
         # 初始化数据结构
         self.tabs = {}
-        self.server_processes = {}
+        self.server_processes = self.engine.processes
+        self.profiler.mark("主界面")
         
         # 安全地加载服务器
         try:
@@ -2284,9 +6332,27 @@ class MinecraftServerManager:
         except Exception as e:
             print(f"加载服务器时发生错误: {e}")
             # 继续运行程序，只是无法加载已有服务器
+        self.profiler.mark(f"加载服务器({len(self.tabs)}个)")
+        # 界面第一次空闲时（窗口已绘制）输出启动耗时
+        self.root.after_idle(self._report_startup)
         
         # 窗口关闭事件
         root.protocol("WM_DELETE_WINDOW", self.on_main_window_close)
+        
+        # 开始处理监管器事件
+        self.root.after(self.console_flush_interval, self._pump_supervisor_events)
+        
+        # 共享资源采样器：状态栏和所有监控窗口都订阅同一个采样线程
+        self.resource_sampler = self.engine.sampler
+        self.resource_sampler.subscribe(
+            lambda samples: self.supervisor.post(lambda: self._update_resource_status(samples))
+        )
+
+    def _report_startup(self):
+        self._ensure_selected_tab_body()
+        self.root.update_idletasks()
+        self.profiler.mark("首次绘制")
+        self.profiler.report()
 
     def send_command(self, tab_id):
         """
@@ -2322,8 +6388,7 @@ class MinecraftServerManager:
         
         try:
             # 发送命令到服务器进程
-            process.stdin.write(command + "\n")
-            process.stdin.flush()
+            self.engine.send_command(tab_id, command)
             
             # 记录发送的命令到控制台（可选）
             timestamp = time.strftime("[%H:%M:%S]")
@@ -2338,7 +6403,7 @@ class MinecraftServerManager:
             messagebox.showerror("错误", error_msg)
 
     def stop_server(self, tab_id):
-        """停止服务器（非阻塞版）"""
+        """停止服务器（非阻塞版，状态变化由服务器管理核心的事件驱动）"""
         tab_data = self.tabs.get(tab_id)
         if not tab_data:
             return
@@ -2350,90 +6415,51 @@ class MinecraftServerManager:
             
         if process.poll() is not None:
             messagebox.showinfo("提示", "服务器已停止")
-            self._update_server_status(tab_id, "已停止")
             return
             
         try:
-            # 立即更新按钮状态
-            self._update_buttons_state(tab_id, False, False, False)
             self.log_to_console(tab_id, "⚠️ 正在停止服务器...")
             
-            # 发送停止命令
-            process.stdin.write("stop\n")
-            process.stdin.flush()
-            
-            # 使用异步等待，不阻塞主线程
-            self._async_wait_for_stop(tab_id, process)
+            # 发送停止命令，由监管器的事件循环等待退出
+            self.engine.stop(tab_id)
             
         except Exception as e:
             self.log_to_console(tab_id, f"❌ 停止失败: {str(e)}")
-            self._update_buttons_state(tab_id, True, False, False)
 
-    def _async_wait_for_stop(self, tab_id, process, timeout=30):
-        """异步等待服务器停止（不阻塞主线程）"""
-        def check_stop():
-            try:
-                # 检查进程是否已退出
-                if process.poll() is not None:
-                    self.log_to_console(tab_id, "✅ 服务器已正常停止")
-                    self._update_server_status(tab_id, "已停止")
-                    return True
-                return False
-            except Exception as e:
-                print(f"检查进程状态失败: {e}")
-                return False
-        
-        def wait_worker():
-            """在后台线程中执行等待操作"""
+    def _after_server_stopped(self, tab_id, callback, action="移除"):
+        """
+        服务器确实停止后在主线程中执行callback（未运行时立即执行）
+        正在启动/停止、停止失败或超时时不执行callback，只提示并取消操作
+        """
+        def abort(reason):
+            self.log_to_console(tab_id, f"❌ {reason}，已取消{action}")
+            messagebox.showerror("错误", f"{reason}，已取消{action}")
+
+        state = self.engine.state(tab_id)
+        if state != ServerEngine.RUNNING and (state != ServerEngine.STOPPED or self.engine.is_running(tab_id)):
+            abort(f"服务器当前状态为「{ServerEngine.STATE_LABELS[state]}」")
+            return
+        try:
+            future = self.engine.stop(tab_id)
+        except Exception as e:
+            abort(f"停止失败: {str(e)}")
+            return
+        if future is None:
+            callback()
+            return
+
+        def on_stopped(f):
             try:
-                start_time = time.time()
-                
-                # 第一阶段：等待正常停止（最多15秒）
-                while time.time() - start_time < min(15, timeout):
-                    if check_stop():
-                        return
-                    time.sleep(0.5)  # 短暂等待
-                
-                # 第二阶段：如果超时，尝试温和终止
-                if process.poll() is None:
-                    self.root.after(0, lambda: self.log_to_console(tab_id, "⚠️ 服务器停止较慢，请稍加等待..."))
-                    try:
-                        process.terminate()  # 温和终止
-                        time.sleep(5)  # 等待5秒
-                    except:
-                        pass
-                    
-                    # 检查是否终止成功
-                    if check_stop():
-                        return
-                
-                # 第三阶段：强制终止（如果仍然在运行）
-                if process.poll() is None and (time.time() - start_time) < timeout:
-                    self.root.after(0, lambda: self.log_to_console(tab_id, "⚠️ 尝试强制终止服务器..."))
-                    try:
-                        process.kill()  # 强制终止
-                        time.sleep(2)
-                    except:
-                        pass
-                    
-                    if check_stop():
-                        self.root.after(0, lambda: self.log_to_console(tab_id, "✅ 服务器已被强制终止"))
-                        return
-                
-                # 最终检查
-                if process.poll() is None:
-                    self.root.after(0, lambda: self.log_to_console(tab_id, "❌ 无法停止服务器进程"))
-                    self.root.after(0, lambda: self._update_buttons_state(tab_id, True, False, False))
-                else:
-                    self.root.after(0, lambda: self.log_to_console(tab_id, "✅ 服务器已停止"))
-                    self.root.after(0, lambda: self._update_server_status(tab_id, "已停止"))
-                    
+                stopped = f.result()
             except Exception as e:
-                self.root.after(0, lambda: self.log_to_console(tab_id, f"❌ 停止过程中发生错误: {str(e)}"))
-                self.root.after(0, lambda: self._update_buttons_state(tab_id, True, False, False))
-        
-        # 在后台线程中执行等待
-        threading.Thread(target=wait_worker, daemon=True).start()
+                error_msg = f"停止失败: {str(e)}"
+                self.supervisor.post(lambda: abort(error_msg))
+                return
+            if stopped:
+                self.supervisor.post(callback)
+            else:
+                self.supervisor.post(lambda: abort("服务器未能在超时时间内停止"))
+        future.add_done_callback(on_stopped)
 
     def delete_current_server(self):
         """删除当前选中的服务器"""
@@ -2482,21 +6508,25 @@ class MinecraftServerManager:
         if not messagebox.askyesno("确认删除", confirm_msg, icon='warning' if is_running else 'question'):
             return
         
-        # 如果服务器在运行，先停止
+        # 如果服务器在运行，先停止，退出后再移除标签页
         if is_running:
-            self.stop_server(tab_id, process)
-            # 等待服务器停止
-            for i in range(10):  # 最多等待5秒
-                if tab_id not in self.server_processes or self.server_processes[tab_id].poll() is not None:
-                    break
-                time.sleep(0.5)
-        
+            self.log_to_console(tab_id, "⚠️ 正在停止服务器，停止后将移除...")
+            self._after_server_stopped(tab_id, lambda: self._remove_server_tab(tab_id, server_name))
+        else:
+            self._remove_server_tab(tab_id, server_name)
+
+    def _remove_server_tab(self, tab_id, server_name, show_message=True):
+        """从管理器中移除服务器标签页"""
+        tab_data = self.tabs.get(tab_id)
+        if not tab_data:
+            return
         try:
             # 从数据结构中移除
             if tab_id in self.server_processes:
                 del self.server_processes[tab_id]
             
             # 关闭并移除标签页
+            tab_data['console'].stop()
             self.notebook.forget(tab_data['frame'])
             tab_data['frame'].destroy()
             del self.tabs[tab_id]
@@ -2504,7 +6534,8 @@ class MinecraftServerManager:
             # 更新配置文件
             self.save_servers()
             
-            messagebox.showinfo("成功", f"服务器 '{server_name}' 已从管理器中移除")
+            if show_message:
+                messagebox.showinfo("成功", f"服务器 '{server_name}' 已从管理器中移除")
             
         except Exception as e:
             messagebox.showerror("错误", f"删除服务器时发生错误：{str(e)}")
@@ -2531,23 +6562,29 @@ class MinecraftServerManager:
         if not messagebox.askyesno("最后确认", "您真的确定要删除吗？这是最后的机会！"):
             return
         
-        try:
-            # 先停止服务器
-            if tab_id in self.server_processes:
-                self.stop_server(tab_id, self.server_processes[tab_id])
-                time.sleep(2)
+        def on_files_deleted(future):
+            try:
+                future.result()
+            except Exception as e:
+                error_msg = f"删除文件时发生错误：{str(e)}"
+                self.supervisor.post(lambda: messagebox.showerror("错误", error_msg))
+                return
             
-            # 删除文件
+            def finish():
+                # 从管理器中移除
+                self._remove_server_tab(tab_id, server_name, show_message=False)
+                messagebox.showinfo("完成", "服务器文件已彻底删除")
+            self.supervisor.post(finish)
+        
+        def delete_files():
+            # 在后台线程中删除文件
             if server_path.exists():
-                shutil.rmtree(server_path)
-            
-            # 从管理器中移除
-            self._delete_server(tab_id)
-            
-            messagebox.showinfo("完成", "服务器文件已彻底删除")
-            
-        except Exception as e:
-            messagebox.showerror("错误", f"删除文件时发生错误：{str(e)}")
+                self.supervisor.run_blocking(shutil.rmtree, server_path).add_done_callback(on_files_deleted)
+            else:
+                self._remove_server_tab(tab_id, server_name, show_message=False)
+        
+        # 先停止服务器
+        self._after_server_stopped(tab_id, delete_files, action="删除文件")
 
     def on_main_window_close(self):
         """主窗口关闭事件处理（非阻塞版）"""
@@ -2575,28 +6612,40 @@ class MinecraftServerManager:
             ):
                 return  # 用户取消退出
             
-            # 在后台线程中执行强制停止
-            def stop_all_servers():
-                for tab_id in running_servers:
-                    try:
-                        process = self.server_processes[tab_id]
-                        if process.poll() is None:
-                            process.kill()  # 强制终止
-                            self.log_to_console(tab_id, "⚠️ 服务器已被强制终止")
-                    except Exception as e:
-                        print(f"终止服务器 {tab_id} 失败: {e}")
-                
-                # 所有服务器停止后退出
-                self.root.after(0, self._safe_exit)
+            # 强制停止（kill由监管器的事件循环执行，不阻塞界面）
+            for tab_id in running_servers:
+                try:
+                    process = self.server_processes[tab_id]
+                    if process.poll() is None:
+                        process.kill()  # 强制终止
+                        self.log_to_console(tab_id, "⚠️ 服务器已被强制终止")
+                except Exception as e:
+                    print(f"终止服务器 {tab_id} 失败: {e}")
             
-            threading.Thread(target=stop_all_servers, daemon=True).start()
+            # 所有服务器停止后退出
+            self._exit_when_stopped(running_servers, time.time() + 5)
+        else:
+            self._safe_exit()
+
+    def _exit_when_stopped(self, tab_ids, deadline):
+        """定时检查服务器进程是否已退出，全部退出或超时后退出程序"""
+        still_running = [
+            tab_id for tab_id in tab_ids
+            if tab_id in self.server_processes and self.server_processes[tab_id].poll() is None
+        ]
+        if still_running and time.time() < deadline:
+            self.root.after(100, lambda: self._exit_when_stopped(still_running, deadline))
         else:
             self._safe_exit()
 
     def _safe_exit(self):
         """安全退出程序"""
-        # 保存配置
+        # 保存配置（立即写入，不等待延迟）
         self.save_servers()
+        self.engine.flush_config()
+        # 写入未满的资源历史降采样
+        self.resource_sampler.stop()
+        self.engine.close_metrics()
         # 销毁主窗口
         self.root.destroy()
 
@@ -2625,7 +6674,7 @@ class MinecraftServerManager:
                     "无效的服务器目录\n"
                     "目录必须包含以下文件之一:\n"
                     "- server.jar\n" 
-                    "- start.bat\n"
+                    "- start.bat / start.sh\n"
                     "- 任何.jar文件（服务器核心）"
                 )
                 return
@@ -2668,7 +6717,8 @@ class MinecraftServerManager:
         # 检查是否存在任一必需文件
         required_files = [
             server_path / "server.jar",
-            server_path / "start.bat"
+            server_path / "start.bat",
+            server_path / "start.sh"
         ]
         
         # 检查是否有任何JAR文件（可能是服务器核心）
@@ -2701,40 +6751,18 @@ class MinecraftServerManager:
     def load_servers(self):
         """修复配置加载逻辑 - 容忍缺失的配置项"""
         try:
-            if not self.config_file.exists():
-                print("⚠️ 配置文件不存在，跳过加载")
-                return
-                
-            # 重新读取配置文件
-            config = configparser.ConfigParser()
-            config.read(self.config_file, encoding='utf-8')
-            
-            if 'Servers' not in config:
-                print("⚠️ 配置文件中没有Servers节")
+            servers = self.engine.load_server_paths()
+            if not servers:
+                print("⚠️ 没有找到有效的服务器配置")
                 return
                 
             servers_loaded = 0
             servers_skipped = 0
             
-            # 修复：收集所有server_开头的键
-            server_keys = [key for key in config['Servers'] if key.startswith('server_')]
-            
-            if not server_keys:
-                print("⚠️ 没有找到有效的服务器配置")
-                return
-            
-            # 按数字排序处理
-            server_keys.sort(key=lambda x: int(x.split('_')[1]) if '_' in x and x.split('_')[1].isdigit() else 0)
-            
-            for key in server_keys:
-                path = config['Servers'][key]
-                if not path or not Path(path).exists():
-                    print(f"⚠️ 路径不存在，跳过 {key}: {path}")
-                    servers_skipped += 1
-                    continue
-                    
+            for key, path in servers:
                 try:
-                    tab_id = self.add_server_tab(path)
+                    # 路径已由load_server_paths检查，加载时也不需要逐个保存配置
+                    tab_id = self.add_server_tab(path, save=False)
                     if tab_id:
                         servers_loaded += 1
                         print(f"✅ 加载服务器: {key} -> {Path(path).name}")
@@ -2754,187 +6782,59 @@ class MinecraftServerManager:
     def save_servers(self):
         """修复配置保存逻辑 - 避免竞态条件删除"""
         try:
-            # 确保配置目录存在
-            self.msm_dir.mkdir(parents=True, exist_ok=True)
-            
-            # 创建新的配置对象
-            new_config = configparser.ConfigParser()
-            new_config['Servers'] = {}
-            
-            # 安全地保存所有有效的服务器
-            valid_servers = 0
-            for i, (tab_id, tab_data) in enumerate(self.tabs.items()):
-                path = tab_data['path_var'].get()
-                if path and Path(path).exists():
-                    new_config['Servers'][f'server_{i}'] = path
-                    valid_servers += 1
-            
-            # 使用临时文件确保原子性写入
-            temp_file = self.config_file.with_suffix('.tmp')
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                new_config.write(f)
-            
-            # 原子性替换
-            if self.config_file.exists():
-                self.config_file.unlink()
-            temp_file.rename(self.config_file)
-            
-            print(f"✅ 已保存 {valid_servers} 个服务器配置")
+            paths = [tab_data['path_var'].get() for tab_data in self.tabs.values()]
+            self.engine.save_server_paths(paths)
             
         except Exception as e:
             print(f"❌ 保存配置失败: {str(e)}")
 
     def show_server_wizard(self):
         """显示服务器创建向导"""
-        ServerCreationWizard(self.root, self.handle_server_creation)
+        ServerCreationWizard(self.root, self.handle_server_creation, self.download_manager, self.version_catalog)
 
-    def handle_server_creation(self, server_data):
-        """处理新服务器创建请求（修复版）"""
-        def worker():
-            tab_id = None
+    def show_batch_provision(self):
+        """显示批量创建服务器对话框（已有服务器使用的端口不会被分配）"""
+        paths = [tab_data['path_var'].get() for tab_data in self.tabs.values()]
+        BatchProvisionDialog(
+            self.root, self.provisioner, self.handle_batch_creation,
+            reserved_ports=ServerProvisioner.used_ports(p for p in paths if p)
+        )
+
+    def handle_batch_creation(self, results):
+        """批量创建完成后为每个成功的服务器添加标签页，最后统一保存一次配置"""
+        last_tab = None
+        for result in results:
+            if not result['ok']:
+                continue
             try:
-                # 准备路径
-                server_dir = Path(server_data['path']) / server_data['name']
-                
-                # 修复：确保目录存在
-                server_dir.mkdir(parents=True, exist_ok=True)
-                
-                # 在主线程创建标签页
-                def create_tab():
-                    nonlocal tab_id
-                    try:
-                        tab_id = self.add_server_tab(str(server_dir))
-                        # 修复：检查标签页是否成功创建
-                        if tab_id and tab_id in self.tabs:
-                            self.notebook.select(tab_id)
-                            self.log_to_console(tab_id, f"✅ 服务器标签页创建成功: {tab_id}")
-                        else:
-                            raise Exception("标签页创建失败")
-                    except Exception as e:
-                        raise Exception(f"创建标签页失败: {str(e)}")
-                
-                self.root.after(0, create_tab)
-                
-                # 等待标签页创建完成
-                import time
-                timeout = 5  # 5秒超时
-                start_time = time.time()
-                while tab_id is None and time.time() - start_time < timeout:
-                    time.sleep(0.1)
-                
-                if tab_id is None:
-                    raise Exception("标签页创建超时")
-                
-                # 下载核心文件
-                core_name = f"{server_data['core_type']}-{server_data['core_version']}.jar"
-                self.root.after(0, lambda: self.log_to_console(tab_id, "开始下载服务器核心..."))
-                
-                if not self.download_core(server_data['core_url'], str(server_dir / core_name)):
-                    raise Exception("核心下载失败")
-                
-                # 保存启动脚本
-                bat_path = server_dir / "start.bat"
-                script_content = server_data['custom_script'].replace(
-                    "{core_name}", core_name
-                )
-                
-                with open(bat_path, 'w', encoding='utf-8') as f:
-                    f.write(script_content)
-                
-                self.log_to_console(tab_id, "启动脚本已生成")
-                
-                # 更新配置
-                self.root.after(0, lambda: (
-                    self.save_servers(),
-                    self.log_to_console(tab_id, "✅ 服务器创建完成"),
-                    messagebox.showinfo("成功", f"服务器 '{server_data['name']}' 已创建！\n路径: {server_dir}")
-                ))
-                
+                tab_id = self.add_server_tab(result['path'], save=False)
+                if not tab_id or tab_id not in self.tabs:
+                    raise Exception("标签页创建失败")
+                self.log_to_console(tab_id, f"✅ 批量创建完成，端口: {result['port']}")
+                last_tab = tab_id
             except Exception as e:
-                error_msg = f"❌ 创建失败: {str(e)}"
-                print(error_msg)
-                
-                # 清理残留文件
-                if 'server_dir' in locals() and server_dir.exists():
-                    try:
-                        shutil.rmtree(server_dir, ignore_errors=True)
-                    except:
-                        pass
-                
-                # 在主线程显示错误
-                def show_error():
-                    if tab_id and tab_id in self.tabs:
-                        self.log_to_console(tab_id, error_msg)
-                    messagebox.showerror("错误", f"服务器创建失败:\n{str(e)}")
-                
-                self.root.after(0, show_error)
-        
-        # 启动工作线程
-        threading.Thread(target=worker, daemon=True).start()
+                print(f"❌ 添加服务器 {result['name']} 失败: {e}")
+        if last_tab:
+            self.notebook.select(last_tab)
+        self.save_servers()
 
-    def download_core(self, url, save_path):
-        """下载服务器核心文件（修复版，增加完整性检查）"""
+    def handle_server_creation(self, server_data):
+        """处理新服务器创建（核心文件和启动脚本已由向导通过下载管理器准备好，这里只添加标签页）"""
+        server_dir = Path(server_data['path']) / server_data['name']
         try:
-            # 创建临时文件
-            temp_path = f"{save_path}.tmp"
-            
-            response = requests.get(url, stream=True, timeout=30)
-            response.raise_for_status()
-            
-            total_size = int(response.headers.get('content-length', 0))
-            downloaded = 0
-            
-            # 确保目录存在
-            os.makedirs(os.path.dirname(save_path), exist_ok=True)
-            
-            with open(temp_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-            
-            # 修复：验证文件完整性
-            if not self.validate_jar_file(temp_path):
-                raise Exception("下载的文件损坏或不是有效的JAR文件")
-            
-            # 重命名临时文件
-            os.replace(temp_path, save_path)
-            
-            # 修复：再次验证最终文件
-            if not self.validate_jar_file(save_path):
-                raise Exception("最终文件验证失败")
-            
-            return True
-            
+            tab_id = self.add_server_tab(str(server_dir))
+            # 修复：检查标签页是否成功创建
+            if not tab_id or tab_id not in self.tabs:
+                raise Exception("标签页创建失败")
+            self.notebook.select(tab_id)
+            self.log_to_console(tab_id, f"✅ 服务器标签页创建成功: {tab_id}")
+            self.log_to_console(tab_id, f"核心文件: {server_data.get('actual_core_file', '')}")
+            self.save_servers()
+            self.log_to_console(tab_id, "✅ 服务器创建完成")
         except Exception as e:
-            # 清理临时文件
-            if 'temp_path' in locals() and os.path.exists(temp_path):
-                try:
-                    os.remove(temp_path)
-                except:
-                    pass
-            print(f"下载失败: {str(e)}")
-            return False
-
-    def validate_jar_file(self, file_path):
-        """验证JAR文件是否有效"""
-        try:
-            if not os.path.exists(file_path):
-                return False
-            
-            file_size = os.path.getsize(file_path)
-            if file_size < 1024:  # 小于1KB的文件肯定无效
-                return False
-            
-            # 检查文件头（JAR文件以PK开头）
-            with open(file_path, 'rb') as f:
-                header = f.read(4)
-                if header[:2] != b'PK':
-                    return False
-            
-            return True
-        except Exception:
-            return False
+            error_msg = f"❌ 创建失败: {str(e)}"
+            print(error_msg)
+            messagebox.showerror("错误", f"服务器创建失败:\n{str(e)}")
 
     def edit_start_script(self, tab_id):
         """编辑服务器的启动脚本"""
@@ -2948,7 +6848,7 @@ class MinecraftServerManager:
             return
             
         # 启动脚本路径
-        script_path = os.path.join(server_path, "start.bat")
+        script_path = os.path.join(server_path, START_SCRIPT_NAME)
         
         # 读取现有脚本内容
         script_content = ""
@@ -3011,11 +6911,20 @@ class MinecraftServerManager:
             messagebox.showinfo("提示", "服务器未在运行")
             return
             
-        # 创建并显示监控窗口
+        # 从资源历史预填最近一分钟
+        try:
+            history = self.engine.query_metrics(process.cwd, time.time() - 60, resolution='1s')
+        except Exception as e:
+            print(f"读取资源历史失败: {e}")
+            history = None
+        
+        # 创建并显示监控窗口（订阅共享采样器）
         self.resource_monitor = ResourceMonitorWindow(
             self.root,
             tab_id,
-            process.pid
+            self.resource_sampler,
+            self.supervisor.post,
+            history
         )
 
     def check_and_accept_eula(self, tab_id):
@@ -3209,14 +7118,14 @@ class MinecraftServerManager:
         """延迟启动服务器（确保EULA文件已保存）"""
         self.start_server(tab_id)
 
-    def add_server_tab(self, initial_path=None):
-        """添加新的服务器标签页（修复版）"""
+    def add_server_tab(self, initial_path=None, save=True):
+        """添加新的服务器标签页（内容在首次选中时才创建，见_build_tab_body）"""
         try:
             # 生成唯一ID
             tab_id = f"server_{len(self.tabs)}"
                 
             # 修复：检查路径有效性
-            if initial_path and not Path(initial_path).exists():
+            if save and initial_path and not Path(initial_path).exists():
                 # 创建目录
                 Path(initial_path).mkdir(parents=True, exist_ok=True)
                 
@@ -3227,141 +7136,34 @@ class MinecraftServerManager:
             if not display_name or display_name == ".":
                 display_name = "新服务器"
                     
-            self.notebook.add(tab_frame, text=display_name)
-                
             # 路径变量
             path_var = tk.StringVar(value=initial_path or "")
             path_var.trace_add('write', lambda *args: self.save_servers())
-                
-            # 控制按钮区域
-            control_frame = ttk.Frame(tab_frame)
-            control_frame.pack(fill=tk.X, pady=5, padx=5)
-            
-            # 启动按钮
-            start_btn = ttk.Button(
-                control_frame,
-                text="启动",
-                command=lambda: self.start_server(tab_id)
-            )
-            start_btn.pack(side=tk.LEFT, padx=2)
-            
-            # 停止按钮
-            stop_btn = ttk.Button(
-                control_frame,
-                text="停止",
-                command=lambda: self._safe_stop_server(tab_id),
-                state=tk.DISABLED
-            )
-            stop_btn.pack(side=tk.LEFT, padx=2)
-            
-            # 重启按钮
-            restart_btn = ttk.Button(
-                control_frame,
-                text="重启",
-                command=lambda: self.restart_server(tab_id),
-                state=tk.DISABLED
-            )
-            restart_btn.pack(side=tk.LEFT, padx=2)
             
-            # 编辑server.properties按钮
-            edit_prop_btn = ttk.Button(
-                control_frame,
-                text="编辑 server.properties",
-                command=lambda: self.edit_server_properties(tab_id)
-            )
-            edit_prop_btn.pack(side=tk.LEFT, padx=2)
-            # 编辑启动脚本按钮
-            edit_script_btn = ttk.Button(
-                control_frame,
-                text="编辑启动脚本",
-                command=lambda: self.edit_start_script(tab_id)
-            )
-            edit_script_btn.pack(side=tk.LEFT, padx=5)
-            # 监控资源按钮
-            ttk.Button(
-                control_frame,
-                text="监控资源",
-                command=lambda: self.start_resource_monitor(tab_id)
-            ).pack(side=tk.LEFT, padx=5)
-            # EULA
-            ttk.Button(
-                control_frame,
-                text="EULA",
-                command=lambda: self.check_and_accept_eula(tab_id)
-            ).pack(side=tk.LEFT, padx=5)
-            # 帮助按钮
-            ttk.Button(
-                control_frame,
-                text="帮助...",
-                command=lambda: webbrowser.open("https://github.com/YuanChi-123/MinecraftServerManager?tab=readme-ov-file#-%E4%BD%BF%E7%94%A8%E6%8C%87%E5%8D%97")
-            ).pack(side=tk.RIGHT, padx=5)
-            
-            # 路径显示与浏览
-            path_frame = ttk.Frame(tab_frame)
-            path_frame.pack(fill=tk.X, padx=5)
-            
-            ttk.Label(path_frame, text="服务器路径:").pack(side=tk.LEFT)
-            path_entry = ttk.Entry(path_frame, textvariable=path_var)
-            path_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
-            ttk.Button(
-                path_frame,
-                text="浏览",
-                command=lambda: self.browse_server_path(tab_id)
-            ).pack(side=tk.RIGHT, padx=5)
-            
-            # 日志区域
-            log_frame = ttk.LabelFrame(tab_frame, text="控制台输出")
-            log_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
-            
-            log_scrollbar = ttk.Scrollbar(log_frame)
-            log_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-            
-            log_text = tk.Text(
-                log_frame,
-                wrap=tk.WORD,
-                yscrollcommand=log_scrollbar.set,
-                state=tk.DISABLED,
-                bg="#1a1a1a",
-                fg="#ffffff",
-                insertbackground="#ffffff"
-            )
-            log_text.pack(fill=tk.BOTH, expand=True, side=tk.LEFT)
-            log_scrollbar.config(command=log_text.yview)
-            
-            # 指令输入区域
-            command_frame = ttk.Frame(tab_frame)
-            command_frame.pack(fill=tk.X, padx=5, pady=5)
-            
-            ttk.Label(command_frame, text="指令:").pack(side=tk.LEFT, padx=5)
-            command_var = tk.StringVar()
-            command_entry = ttk.Entry(command_frame, textvariable=command_var)
-            command_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
-            
-            # 发送指令按钮
-            send_btn = ttk.Button(
-                command_frame,
-                text="发送",
-                command=lambda: self.send_command(tab_id)
+            # 控制台缓冲（批量刷新，避免每行一次UI回调）；输出组件随标签页内容一起创建
+            server_settings = self._load_server_settings(initial_path)
+            console = ConsoleBuffer(
+                self.root,
+                None,
+                flush_interval=self.console_flush_interval,
+                max_lines_per_flush=self.console_max_lines_per_flush,
+                scrollback_lines=server_settings.get('console_scrollback', self.console_scrollback_lines),
+                archive_path=lambda: self._console_archive_path(tab_id)
             )
-            send_btn.pack(side=tk.RIGHT, padx=5)
             
-            # 绑定回车键发送指令
-            command_entry.bind('<Return>', lambda event: self.send_command(tab_id))
-            
-            # 保存标签数据
+            # 保存标签数据（按钮、输出和指令输入在_build_tab_body中加入）
             self.tabs[tab_id] = {
                 'frame': tab_frame,
                 'path_var': path_var,
-                'start_btn': start_btn,
-                'stop_btn': stop_btn,
-                'restart_btn': restart_btn,
-                'log_text': log_text,
-                'command_var': command_var,
-                'status_var': tk.StringVar(value="已停止")
+                'console': console,
+                'status_var': tk.StringVar(value="已停止"),
+                'built': False
             }
+            self.notebook.add(tab_frame, text=display_name)
             
             # 立即保存配置
-            self.save_servers()
+            if save:
+                self.save_servers()
             
             return tab_id
             
@@ -3369,6 +7171,166 @@ class MinecraftServerManager:
             messagebox.showerror("错误", f"创建标签页失败: {str(e)}")
             return None     
 
+    def _ensure_selected_tab_body(self):
+        """为当前选中的标签页创建内容"""
+        try:
+            selected = self.notebook.select()
+        except tk.TclError:
+            return
+        for tab_id, tab_data in self.tabs.items():
+            if str(tab_data['frame']) == selected:
+                self._build_tab_body(tab_id)
+                break
+
+    def _build_tab_body(self, tab_id):
+        """创建标签页内容（按钮、路径、控制台和指令输入），已创建时直接返回"""
+        tab_data = self.tabs.get(tab_id)
+        if not tab_data or tab_data['built']:
+            return
+        tab_frame = tab_data['frame']
+        path_var = tab_data['path_var']
+        
+        # 控制按钮区域
+        control_frame = ttk.Frame(tab_frame)
+        control_frame.pack(fill=tk.X, pady=5, padx=5)
+        
+        # 启动按钮
+        start_btn = ttk.Button(
+            control_frame,
+            text="启动",
+            command=lambda: self.start_server(tab_id)
+        )
+        start_btn.pack(side=tk.LEFT, padx=2)
+        
+        # 停止按钮
+        stop_btn = ttk.Button(
+            control_frame,
+            text="停止",
+            command=lambda: self._safe_stop_server(tab_id),
+            state=tk.DISABLED
+        )
+        stop_btn.pack(side=tk.LEFT, padx=2)
+        
+        # 重启按钮
+        restart_btn = ttk.Button(
+            control_frame,
+            text="重启",
+            command=lambda: self.restart_server(tab_id),
+            state=tk.DISABLED
+        )
+        restart_btn.pack(side=tk.LEFT, padx=2)
+        
+        # 编辑server.properties按钮
+        edit_prop_btn = ttk.Button(
+            control_frame,
+            text="编辑 server.properties",
+            command=lambda: self.edit_server_properties(tab_id)
+        )
+        edit_prop_btn.pack(side=tk.LEFT, padx=2)
+        # 编辑启动脚本按钮
+        edit_script_btn = ttk.Button(
+            control_frame,
+            text="编辑启动脚本",
+            command=lambda: self.edit_start_script(tab_id)
+        )
+        edit_script_btn.pack(side=tk.LEFT, padx=5)
+        # 监控资源按钮
+        ttk.Button(
+            control_frame,
+            text="监控资源",
+            command=lambda: self.start_resource_monitor(tab_id)
+        ).pack(side=tk.LEFT, padx=5)
+        # EULA
+        ttk.Button(
+            control_frame,
+            text="EULA",
+            command=lambda: self.check_and_accept_eula(tab_id)
+        ).pack(side=tk.LEFT, padx=5)
+        # 帮助按钮
+        ttk.Button(
+            control_frame,
+            text="帮助...",
+            command=lambda: webbrowser.open("https://github.com/YuanChi-123/MinecraftServerManager?tab=readme-ov-file#-%E4%BD%BF%E7%94%A8%E6%8C%87%E5%8D%97")
+        ).pack(side=tk.RIGHT, padx=5)
+        
+        # 路径显示与浏览
+        path_frame = ttk.Frame(tab_frame)
+        path_frame.pack(fill=tk.X, padx=5)
+        
+        ttk.Label(path_frame, text="服务器路径:").pack(side=tk.LEFT)
+        path_entry = ttk.Entry(path_frame, textvariable=path_var)
+        path_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        ttk.Button(
+            path_frame,
+            text="浏览",
+            command=lambda: self.browse_server_path(tab_id)
+        ).pack(side=tk.RIGHT, padx=5)
+        
+        # 日志区域
+        log_frame = ttk.LabelFrame(tab_frame, text="控制台输出")
+        log_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        
+        log_scrollbar = ttk.Scrollbar(log_frame)
+        log_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        log_text = tk.Text(
+            log_frame,
+            wrap=tk.WORD,
+            yscrollcommand=log_scrollbar.set,
+            state=tk.DISABLED,
+            bg="#1a1a1a",
+            fg="#ffffff",
+            insertbackground="#ffffff"
+        )
+        log_text.pack(fill=tk.BOTH, expand=True, side=tk.LEFT)
+        log_scrollbar.config(command=log_text.yview)
+        
+        # 指令输入区域
+        command_frame = ttk.Frame(tab_frame)
+        command_frame.pack(fill=tk.X, padx=5, pady=5)
+        
+        ttk.Label(command_frame, text="指令:").pack(side=tk.LEFT, padx=5)
+        command_var = tk.StringVar()
+        command_entry = ttk.Entry(command_frame, textvariable=command_var)
+        command_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        
+        # 发送指令按钮
+        send_btn = ttk.Button(
+            command_frame,
+            text="发送",
+            command=lambda: self.send_command(tab_id)
+        )
+        send_btn.pack(side=tk.RIGHT, padx=5)
+        
+        # 绑定回车键发送指令
+        command_entry.bind('<Return>', lambda event: self.send_command(tab_id))
+        
+        # 保存标签数据
+        tab_data.update({
+            'start_btn': start_btn,
+            'stop_btn': stop_btn,
+            'restart_btn': restart_btn,
+            'log_text': log_text,
+            'command_var': command_var,
+            'built': True
+        })
+        tab_data['console'].attach(log_text)
+        self._apply_server_state(tab_id, self.engine.state(tab_id))
+
+    def _load_server_settings(self, server_path):
+        """读取服务器目录中的msm_config.json（不存在时返回空字典）"""
+        return self.engine.load_server_settings(server_path)
+
+    def _console_archive_path(self, tab_id):
+        """获取控制台归档文件路径（位于服务器logs目录）"""
+        tab_data = self.tabs.get(tab_id)
+        if not tab_data:
+            return None
+        server_path = tab_data['path_var'].get()
+        if not server_path:
+            return None
+        return Path(server_path) / "logs" / "msm-console.log"
+
     def browse_server_path(self, tab_id):
         """浏览服务器路径"""
         current_path = self.tabs[tab_id]['path_var'].get() or str(Path.home())
@@ -3381,135 +7343,13 @@ class MinecraftServerManager:
                 text=Path(path).name
             )
 
-    def _force_kill_all_java_processes(self):
-        """强制终止所有Java进程"""
-        try:
-            # 方法1：使用taskkill终止所有Java进程
-            subprocess.run(
-                ["taskkill", "/F", "/IM", "java.exe"], 
-                capture_output=True, 
-                timeout=10
-            )
-            
-            # 方法2：使用PowerShell终止进程
-            subprocess.run(
-                ["powershell", "-Command", "Get-Process java -ErrorAction SilentlyContinue | Stop-Process -Force"],
-                capture_output=True,
-                timeout=10
-            )
-            
-            # 等待进程终止
-            time.sleep(2)
-            
-        except Exception as e:
-            print(f"⚠️ 终止Java进程失败: {e}")
-
-    def _kill_processes_by_file(self, file_path):
-        """终止占用特定文件的进程"""
-        try:
-            # 使用handle.exe（Sysinternals工具）查找占用文件的进程
-            try:
-                result = subprocess.run(
-                    ["handle.exe", file_path],
-                    capture_output=True,
-                    text=True,
-                    timeout=10
-                )
-                if result.returncode == 0:
-                    # 解析输出，找到进程ID
-                    for line in result.stdout.split('\n'):
-                        if "pid:" in line.lower():
-                            parts = line.split()
-                            for part in parts:
-                                if part.startswith("pid:"):
-                                    pid = part.split(":")[1]
-                                    subprocess.run(["taskkill", "/F", "/PID", pid], capture_output=True)
-                                    break
-            except:
-                pass
-            
-            # 作为备用方案，终止所有Java进程
-            self._force_kill_all_java_processes()
-            
-        except Exception as e:
-            print(f"⚠️ 终止文件占用进程失败: {e}")
-
-    def _force_kill_java_processes(self, server_dir):
-        """使用taskkill强制终止所有Java进程"""
-        try:
-            server_path = str(server_dir).lower()
-            
-            # 方法1：使用taskkill终止所有Java进程
-            print("🔫 使用taskkill终止Java进程...")
-            subprocess.run(
-                ["taskkill", "/F", "/IM", "java.exe"], 
-                capture_output=True, 
-                timeout=10
-            )
-            
-            # 方法2：终止特定目录的Java进程
-            print("🔫 终止特定服务器目录的进程...")
-            result = subprocess.run(
-                ["tasklist", "/FI", "IMAGENAME eq java.exe", "/FO", "CSV"], 
-                capture_output=True, 
-                text=True,
-                timeout=10
-            )
-            
-            # 解析进程列表，终止与服务器目录相关的进程
-            if result.returncode == 0:
-                for line in result.stdout.split('\n')[1:]:  # 跳过标题行
-                    if line.strip():
-                        try:
-                            parts = line.split(',')
-                            if len(parts) >= 2:
-                                pid = parts[1].strip('"')
-                                # 获取进程详细信息
-                                info_result = subprocess.run(
-                                    ["tasklist", "/FI", f"PID eq {pid}", "/FO", "CSV", "/V"], 
-                                    capture_output=True, 
-                                    text=True,
-                                    timeout=5
-                                )
-                                if server_path in info_result.stdout.lower():
-                                    print(f"🔫 终止进程 PID: {pid}")
-                                    subprocess.run(
-                                        ["taskkill", "/F", "/PID", pid], 
-                                        capture_output=True, 
-                                        timeout=5
-                                    )
-                        except Exception as e:
-                            print(f"⚠️ 处理进程时出错: {e}")
-            
-            # 等待进程终止
-            time.sleep(1)
-            
-        except subprocess.TimeoutExpired:
-            print("⚠️ taskkill命令超时")
-        except Exception as e:
-            print(f"❌ 终止进程失败: {e}")
-
-    def _kill_processes_by_file(self, file_path):
-        """使用taskkill终止占用特定文件的进程"""
-        try:
-            # 使用Windows资源监视器相关命令（需要管理员权限）
-            commands = [
-                # 尝试使用handle.exe（Sysinternals工具）
-                ["handle.exe", file_path],
-                # 或者使用开源的替代方案
-            ]
-            
-            # 简单的taskkill所有Java进程（最有效的方法）
-            subprocess.run(["taskkill", "/F", "/IM", "java.exe"], capture_output=True)
-            
-        except Exception as e:
-            print(f"⚠️ 终止文件占用进程失败: {e}")
-
     def _update_buttons_state(self, tab_id, start_enabled, stop_enabled, restart_enabled):
         """统一更新按钮状态"""
         tab_data = self.tabs.get(tab_id)
         if tab_data:
             def update_ui():
+                if not tab_data['built']:
+                    return  # 标签页内容创建时会按当前状态设置按钮
                 tab_data['start_btn'].config(state=tk.NORMAL if start_enabled else tk.DISABLED)
                 tab_data['stop_btn'].config(state=tk.NORMAL if stop_enabled else tk.DISABLED)
                 tab_data['restart_btn'].config(state=tk.NORMAL if restart_enabled else tk.DISABLED)
@@ -3541,34 +7381,18 @@ class MinecraftServerManager:
         """)
 
     def _kill_zombie_processes(self, server_dir):
-        """杀死可能残留的Java进程"""
+        """杀死该服务器可能残留的进程（按PID文件、工作目录和命令行定位）"""
         try:
-            import psutil
-            
-            server_path = str(server_dir).lower()
-            
-            for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
-                try:
-                    # 检查是否是Java进程且与服务器目录相关
-                    if (proc.info['name'] and 'java' in proc.info['name'].lower() and
-                        proc.info['cmdline'] and any(server_path in arg.lower() for arg in proc.info['cmdline'] if arg)):
-                        
-                        print(f"⚠️ 发现残留Java进程 PID {proc.info['pid']}，尝试终止...")
-                        proc.kill()
-                        time.sleep(0.5)  # 等待进程终止
-                        
-                except (psutil.NoSuchProcess, psutil.AccessDenied):
-                    pass
-                except Exception as e:
-                    print(f"⚠️ 处理进程时出错: {e}")
-                    
-        except ImportError:
-            print("⚠️ 未安装psutil，无法检查残留进程")
+            killed = self.engine.kill_leftover_processes(server_dir)
+            if killed:
+                print(f"✅ 已终止 {killed} 个残留进程")
+            return killed
         except Exception as e:
             print(f"❌ 检查残留进程失败: {e}")
+            return 0
 
     def start_server(self, tab_id):
-        """启动服务器（增强版文件锁定处理）"""
+        """启动服务器（清理和进程创建在后台执行，状态变化由服务器管理核心的事件驱动）"""
         tab_data = self.tabs.get(tab_id)
         if not tab_data:
             return
@@ -3578,66 +7402,31 @@ class MinecraftServerManager:
             messagebox.showerror("错误", "服务器路径不存在")
             return
             
-        # 增强版文件清理
-        self.log_to_console(tab_id, "🔍 检查并清理残留文件...")
-        messagebox.showinfo("提示", "请按下“确定”清理残留文件并等待清理完成...")
-        files_cleaned = self.cleanup_server_files(server_path)
-        if files_cleaned:
-            self.log_to_console(tab_id, "✅ 残留文件已清理")
-            messagebox.showinfo("提示", "已清理残留文件，按下“确定”以继续")
-        
-        # 等待确保清理完成
-        time.sleep(1)
-        
-        # 检查是否已有进程在运行
+        # 检查是否已有进程在运行（必须在清理之前，避免终止正在运行的服务器）
         if tab_id in self.server_processes and self.server_processes[tab_id].poll() is None:
             messagebox.showwarning("警告", "服务器已经在运行中")
             return
             
         # 查找启动脚本或核心文件
-        start_script = server_path / "start.bat"
-        core_files = list(server_path.glob("*.jar"))
-        
-        if start_script.exists():
-            # 使用启动脚本
-            cmd = str(start_script)
-            cwd = str(server_path)
-        elif core_files:
-            # 使用找到的第一个JAR文件
-            cmd = f'java -jar "{core_files[0].name}"'
-            cwd = str(server_path)
-        else:
+        if not self.engine.build_launch_command(server_path):
             messagebox.showerror("错误", "未找到启动脚本或核心文件")
             return
             
-        # 更新按钮状态
-        self._update_buttons_state(tab_id, False, True, True)
-        
-        # 启动服务器进程
         try:
-            process = subprocess.Popen(
-                cmd,
-                cwd=cwd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                stdin=subprocess.PIPE,
-                shell=True,
-                text=True
-            )
-            
-            self.server_processes[tab_id] = process
-            self.log_to_console(tab_id, f"✅ 服务器已启动: {cmd}")
-            
-            # 启动输出监控线程
-            threading.Thread(
-                target=self.monitor_server_output,
-                args=(tab_id, process),
-                daemon=True
-            ).start()
-            
+            self.engine.start_async(tab_id, server_path, prepare=self._prepare_server_start)
         except Exception as e:
             self.log_to_console(tab_id, f"❌ 启动失败: {str(e)}")
-            self._update_buttons_state(tab_id, True, False, False)
+
+    def _prepare_server_start(self, tab_id, server_path):
+        """启动前准备（在后台线程中执行）：预检发现残留进程或文件锁时才清理"""
+        issues = self.engine.preflight(server_path)
+        if not issues:
+            return
+        for issue in issues:
+            self.supervisor.emit('log', tab_id, f"⚠️ {issue}")
+        self.supervisor.emit('log', tab_id, "🔍 检查并清理残留文件...")
+        if self.cleanup_server_files(server_path):
+            self.supervisor.emit('log', tab_id, "✅ 残留文件已清理")
 
     def cleanup_server_files(self, server_path):
         """增强版服务器文件清理（解决文件锁定问题）"""
@@ -3650,11 +7439,8 @@ class MinecraftServerManager:
             
             print(f"🔍 开始清理服务器文件: {server_path}")
             
-            # 首先强制终止所有Java进程
-            self._force_kill_all_java_processes()
-            
-            # 等待进程完全终止
-            time.sleep(2)
+            # 首先终止该服务器的残留进程（等待其退出，不影响其他服务器）
+            self._kill_zombie_processes(server_dir)
             
             # 清理所有可能的锁文件
             lock_files = [
@@ -3691,11 +7477,10 @@ class MinecraftServerManager:
                         print(f"✅ 已删除锁文件: {lock_file.name}")
                         
                     except PermissionError:
-                        print(f"⚠️ 文件被占用，尝试使用taskkill强制终止进程...")
+                        print(f"⚠️ 文件被占用，尝试终止占用该文件的进程...")
                         self._kill_processes_by_file(str(lock_file))
                         
-                        # 等待后重试删除
-                        time.sleep(1)
+                        # 重试删除
                         try:
                             if lock_file.exists():
                                 lock_file.unlink()
@@ -3731,78 +7516,12 @@ class MinecraftServerManager:
             print(f"❌ 清理文件失败: {e}")
             return False
 
-    def _force_kill_all_java_processes(self):
-        """强制终止所有Java进程"""
-        try:
-            print("🔫 开始强制终止Java进程...")
-            
-            # 方法1：使用taskkill终止所有Java进程
-            result1 = subprocess.run(
-                ["taskkill", "/F", "/IM", "java.exe"], 
-                capture_output=True, 
-                text=True,
-                timeout=10
-            )
-            print(f"taskkill结果: {result1.returncode}")
-            
-            # 方法2：使用PowerShell终止进程
-            try:
-                result2 = subprocess.run(
-                    ["powershell", "-Command", "Get-Process java -ErrorAction SilentlyContinue | Stop-Process -Force"],
-                    capture_output=True,
-                    text=True,
-                    timeout=10
-                )
-                print(f"PowerShell结果: {result2.returncode}")
-            except:
-                print("⚠️ PowerShell命令执行失败")
-            
-            # 方法3：终止javaw.exe进程
-            subprocess.run(["taskkill", "/F", "/IM", "javaw.exe"], capture_output=True, timeout=5)
-            
-            # 等待进程终止
-            time.sleep(2)
-            print("✅ Java进程终止完成")
-            
-        except subprocess.TimeoutExpired:
-            print("⚠️ 终止进程命令超时")
-        except Exception as e:
-            print(f"⚠️ 终止Java进程失败: {e}")
-
     def _kill_processes_by_file(self, file_path):
-        """终止占用特定文件的进程"""
+        """终止占用特定文件的进程（只针对占用者，不影响其他服务器）"""
         try:
             print(f"🔫 查找占用文件的进程: {file_path}")
-            
-            # 方法1：使用handle.exe（Sysinternals工具）
-            try:
-                result = subprocess.run(
-                    ["handle.exe", file_path],
-                    capture_output=True,
-                    text=True,
-                    timeout=10
-                )
-                if result.returncode == 0:
-                    # 解析输出，找到进程ID
-                    for line in result.stdout.split('\n'):
-                        if "pid:" in line.lower():
-                            parts = line.split()
-                            for part in parts:
-                                if part.startswith("pid:"):
-                                    pid = part.split(":")[1]
-                                    print(f"🔫 终止进程 PID: {pid}")
-                                    subprocess.run(["taskkill", "/F", "/PID", pid], capture_output=True)
-                                    break
-            except FileNotFoundError:
-                print("ℹ️ handle.exe 未找到，跳过进程查找")
-            except:
-                print("⚠️ handle.exe 执行失败")
-            
-            # 方法2：作为备用方案，终止所有Java进程
-            self._force_kill_all_java_processes()
-            
-            print("✅ 进程终止完成")
-            
+            killed = self.engine.kill_processes_holding(file_path)
+            print(f"✅ 进程终止完成（{killed} 个）")
         except Exception as e:
             print(f"⚠️ 终止文件占用进程失败: {e}")
 
@@ -3901,7 +7620,7 @@ class MinecraftServerManager:
         if not messagebox.askyesno("强制清理", 
                                 "确定要强制清理服务器文件吗？\n\n"
                                 "这将：\n"
-                                "• 终止所有Java进程\n"
+                                "• 终止该服务器残留的Java进程\n"
                                 "• 删除所有锁文件和临时文件\n"
                                 "• 解决文件占用问题\n\n"
                                 "继续吗？"):
@@ -3909,79 +7628,32 @@ class MinecraftServerManager:
         
         self.log_to_console(tab_id, "🛠️ 开始强制清理服务器文件...")
         
-        # 在后台线程中执行清理
-        def cleanup_worker():
+        # 在监管器的线程池中执行清理
+        def on_cleanup_done(future):
             try:
-                success = self.cleanup_server_files(server_path)
-                if success:
-                    self.root.after(0, lambda: self.log_to_console(tab_id, "✅ 强制清理完成"))
+                if future.result():
+                    self.supervisor.emit('log', tab_id, "✅ 强制清理完成")
                 else:
-                    self.root.after(0, lambda: self.log_to_console(tab_id, "⚠️ 清理完成，但可能仍有文件被占用"))
+                    self.supervisor.emit('log', tab_id, "⚠️ 清理完成，但可能仍有文件被占用")
             except Exception as e:
-                self.root.after(0, lambda: self.log_to_console(tab_id, f"❌ 清理失败: {str(e)}"))
-        
-        threading.Thread(target=cleanup_worker, daemon=True).start()
-
-    def _wait_for_server_stop(self, tab_id, process, timeout=30):
-        """非阻塞等待服务器停止"""
-
-        process = self.server_processes.get(tab_id)
-
-        def check_stop():
-            nonlocal attempts
-            attempts += 1
-            
-            if process.poll() is not None:
-                # 服务器已正常停止
-                self.log_to_console(tab_id, "✅ 服务器已停止")
-                self._update_server_status(tab_id, "已停止")
-                return
-                
-            if attempts >= timeout * 2:  # 每0.5秒检查一次，共30秒
-                # 超时，强制停止
-                self.log_to_console(tab_id, "⚠️ 服务器无响应，强制停止中...")
-                self._force_stop_server(tab_id, process)
-                return
-                
-            # 继续等待
-            self.root.after(500, check_stop)  # 每0.5秒检查一次，不阻塞UI
+                self.supervisor.emit('log', tab_id, f"❌ 清理失败: {str(e)}")
         
-        attempts = 0
-        self.root.after(500, check_stop)  # 延迟开始检查
-
-    def _force_stop_server(self, tab_id, process):
-        """强制停止服务器"""
-        try:
-            if process.poll() is None:
-                process.kill()  # 强制终止
-                # 等待进程完全结束
-                for i in range(10):  # 最多等待5秒
-                    if process.poll() is not None:
-                        break
-                    time.sleep(0.5)
-                
-                self.log_to_console(tab_id, "✅ 服务器已被强制终止")
-            else:
-                self.log_to_console(tab_id, "✅ 服务器已停止")
-                
-        except Exception as e:
-            self.log_to_console(tab_id, f"❌ 强制停止失败: {str(e)}")
-        finally:
-            self._update_server_status(tab_id, "已停止")
+        self.supervisor.run_blocking(self.cleanup_server_files, server_path).add_done_callback(on_cleanup_done)
 
     def _update_server_status(self, tab_id, status):
         """更新服务器状态（线程安全）"""
         tab_data = self.tabs.get(tab_id)
         if tab_data:
-            self.root.after(0, lambda: (
-                tab_data['start_btn'].config(state=tk.NORMAL),
-                tab_data['stop_btn'].config(state=tk.DISABLED),
-                tab_data['restart_btn'].config(state=tk.DISABLED),
+            def update_ui():
+                if tab_data['built']:
+                    tab_data['start_btn'].config(state=tk.NORMAL)
+                    tab_data['stop_btn'].config(state=tk.DISABLED)
+                    tab_data['restart_btn'].config(state=tk.DISABLED)
                 tab_data['status_var'].set(status)
-            ))
+            self.root.after(0, update_ui)
 
     def restart_server(self, tab_id):
-        """重启服务器（非阻塞版）"""
+        """重启服务器（非阻塞版，停止、等待和重新启动都不占用主线程）"""
         tab_data = self.tabs.get(tab_id)
         if not tab_data:
             return
@@ -3991,81 +7663,77 @@ class MinecraftServerManager:
             messagebox.showinfo("提示", "服务器未在运行")
             return
         
-        # 立即更新按钮状态
-        self._update_buttons_state(tab_id, False, False, False)
         self.log_to_console(tab_id, "🔄 正在重启服务器...")
-        
-        def restart_worker():
-            """在后台线程中执行重启操作"""
-            try:
-                # 发送停止命令
-                process.stdin.write("stop\n")
-                process.stdin.flush()
-                
-                # 异步等待停止
-                stop_success = self._async_wait_for_restart_stop(tab_id, process)
-                
-                if stop_success:
-                    # 延迟后在主线程中重新启动
-                    self.root.after(100, lambda: self._delayed_restart(tab_id))
-                else:
-                    self.root.after(0, lambda: self._handle_restart_error(tab_id, "停止服务器失败"))
-                    
-            except Exception as e:
-                self.root.after(0, lambda: self._handle_restart_error(tab_id, str(e)))
-        
-        threading.Thread(target=restart_worker, daemon=True).start()
-
-    def _async_wait_for_restart_stop(self, tab_id, process, timeout=20):
-        """异步等待重启时的服务器停止"""
-        def check_stop():
-            return process.poll() is not None
-        
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            if check_stop():
-                return True
-            time.sleep(0.5)
-        
-        # 超时后尝试强制停止
+        server_path = Path(tab_data['path_var'].get())
         try:
-            if process.poll() is None:
-                process.kill()
-                time.sleep(2)
-                return check_stop()
-        except:
-            pass
-        
-        return check_stop()
+            self.engine.restart(tab_id, server_path, prepare=self._prepare_server_start)
+        except Exception as e:
+            self.log_to_console(tab_id, f"❌ 重启失败: {str(e)}")
 
-    def _delayed_restart(self, tab_id):
-        """延迟重启"""
-        self.log_to_console(tab_id, "⏳ 准备重新启动服务器...")
-        time.sleep(2)  # 等待2秒确保资源释放
-        self.start_server(tab_id)
+    def _apply_server_state(self, tab_id, state):
+        """根据服务器状态更新状态文字和按钮"""
+        tab_data = self.tabs.get(tab_id)
+        if not tab_data:
+            return
+        tab_data['status_var'].set(ServerEngine.STATE_LABELS[state])
+        if not tab_data['built']:
+            return
+        start_enabled = state == ServerEngine.STOPPED
+        running = state == ServerEngine.RUNNING
+        tab_data['start_btn'].config(state=tk.NORMAL if start_enabled else tk.DISABLED)
+        tab_data['stop_btn'].config(state=tk.NORMAL if running else tk.DISABLED)
+        tab_data['restart_btn'].config(state=tk.NORMAL if running else tk.DISABLED)
+
+    def _pump_supervisor_events(self):
+        """在主线程中处理监管器事件（每次最多处理一批，避免阻塞界面）"""
+        try:
+            for _ in range(self.console_max_lines_per_flush):
+                try:
+                    kind, tab_id, payload = self.supervisor_events.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    # 核心记录输出历史并执行回调，界面再写入对应的控制台
+                    self.engine.dispatch(kind, tab_id, payload)
+                    self._handle_supervisor_event(kind, tab_id, payload)
+                except Exception as e:
+                    print(f"处理进程事件失败: {e}")
+        finally:
+            try:
+                self.root.after(self.console_flush_interval, self._pump_supervisor_events)
+            except tk.TclError:
+                pass
 
-    def _handle_restart_error(self, tab_id, error_msg):
-        """处理重启错误"""
-        self.log_to_console(tab_id, f"❌ 重启失败: {error_msg}")
-        self._update_buttons_state(tab_id, True, False, False)
+    def _handle_supervisor_event(self, kind, tab_id, payload):
+        """处理单个监管器事件"""
+        if kind == 'output':
+            # 添加时间戳（ANSI颜色由控制台缓冲解析为文本标签）
+            timestamp, lines = payload
+            for line in lines:
+                self.log_to_console(tab_id, f"{timestamp} {line.strip()}")
+        elif kind == 'log':
+            self.log_to_console(tab_id, payload)
+        elif kind == 'exit':
+            decoder = payload.decoder
+            self.log_to_console(
+                tab_id,
+                f"📈 输出统计: {decoder.total_lines} 行, {decoder.total_bytes / 1024:.0f} KB, "
+                f"平均 {decoder.lines_per_second():.1f} 行/秒"
+            )
+            self.log_to_console(tab_id, f"💡 服务器已退出，退出代码: {payload.returncode}")
+        elif kind == 'state':
+            self._apply_server_state(tab_id, payload)
 
-    def monitor_server_output(self, tab_id, process):
-        """监控服务器输出并显示到日志区域"""
-        while True:
-            output = process.stdout.readline()
-            if not output and process.poll() is not None:
-                break
-                
-            if output:
-                # 清理ANSI代码并添加时间戳
-                clean_output = clean_ansi_codes(output.strip())
-                timestamp = time.strftime("[%H:%M:%S]")
-                self.log_to_console(tab_id, f"{timestamp} {clean_output}")
-                    
-        # 进程结束后更新状态
-        exit_code = process.poll()
-        self.log_to_console(tab_id, f"💡 服务器已退出，退出代码: {exit_code}")
-        self._update_buttons_state(tab_id, True, False, False)
+    def _update_resource_status(self, samples):
+        """在状态栏显示所有运行中服务器的资源占用合计"""
+        if not samples:
+            self.resource_status_var.set("")
+            return
+        cpu = sum(sample['cpu_percent'] for sample in samples.values())
+        memory = sum(sample['memory_rss'] for sample in samples.values())
+        self.resource_status_var.set(
+            f"运行中: {len(samples)} | CPU {cpu:.1f}% | 内存 {ResourceSampler.format_bytes(memory)}"
+        )
 
     def log_to_console(self, tab_id, message):
         """将消息添加到控制台日志"""
@@ -4073,13 +7741,8 @@ class MinecraftServerManager:
         if not tab_data:
             return
             
-        log_text = tab_data['log_text']
-        self.root.after(0, lambda: (
-            log_text.config(state=tk.NORMAL),
-            log_text.insert(tk.END, message + "\n"),
-            log_text.see(tk.END),
-            log_text.config(state=tk.DISABLED)
-        ))
+        # 只入队，由控制台缓冲在UI定时任务中批量写入
+        tab_data['console'].write(message)
 
     def edit_server_properties(self, tab_id):
         """编辑服务器的server.properties文件"""
@@ -4143,77 +7806,7 @@ class MinecraftServerManager:
     def create_default_properties(self, file_path):
         """创建默认的server.properties文件"""
         try:
-            default_content = """#Minecraft server properties
-#Minecraft server properties
-#Fri Nov 21 00:00:00 CST 2025
-accepts-transfers=false
-allow-flight=false
-broadcast-console-to-ops=true
-broadcast-rcon-to-ops=true
-bug-report-link=
-debug=false
-difficulty=easy
-enable-code-of-conduct=false
-enable-jmx-monitoring=false
-enable-query=false
-enable-rcon=false
-enable-status=true
-enforce-secure-profile=true
-enforce-whitelist=false
-entity-broadcast-range-percentage=100
-force-gamemode=false
-function-permission-level=2
-gamemode=survival
-generate-structures=true
-generator-settings={}
-hardcore=false
-hide-online-players=false
-initial-disabled-packs=
-initial-enabled-packs=vanilla
-level-name=world
-level-seed=
-level-type=minecraft\:normal
-log-ips=true
-management-server-enabled=false
-management-server-host=localhost
-management-server-port=0
-management-server-secret=wMLnGXQnR422PoaI37sM9WnjkZOJikBf34jaUv7t
-management-server-tls-enabled=true
-management-server-tls-keystore=
-management-server-tls-keystore-password=
-max-chained-neighbor-updates=1000000
-max-players=20
-max-tick-time=60000
-max-world-size=29999984
-motd=A Minecraft Server
-network-compression-threshold=256
-online-mode=false
-op-permission-level=4
-pause-when-empty-seconds=-1
-player-idle-timeout=0
-prevent-proxy-connections=false
-query.port=25565
-rate-limit=0
-rcon.password=
-rcon.port=25575
-region-file-compression=deflate
-require-resource-pack=false
-resource-pack=
-resource-pack-id=
-resource-pack-prompt=
-resource-pack-sha1=
-server-ip=
-server-port=25565
-simulation-distance=10
-spawn-protection=16
-status-heartbeat-interval=0
-sync-chunk-writes=true
-text-filtering-config=
-text-filtering-version=0
-use-native-transport=true
-view-distance=10
-white-list=false
-"""
+            default_content = DEFAULT_SERVER_PROPERTIES
             with open(file_path, 'w', encoding='utf-8') as f:
                 f.write(default_content)
             return True
@@ -4222,7 +7815,29 @@ white-list=false
             return False
 
 if __name__ == "__main__":
-    root = tk.Tk()
-    app = MinecraftServerManager(root)
-    root.mainloop()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Minecraft Server Manager")
+    parser.add_argument("--bench-ansi", action="store_true", help="运行ANSI解析微基准并退出")
+    parser.add_argument("--daemon", action="store_true", help="无界面模式，通过本地JSON接口管理服务器")
+    parser.add_argument("--host", help="控制接口监听地址（默认127.0.0.1）")
+    parser.add_argument("--port", type=int, help="控制接口端口（默认25580）")
+    parser.add_argument("--autostart", action="store_true", help="守护进程启动后自动启动所有服务器")
+    parser.add_argument("--echo", action="store_true", help="守护进程将服务器输出打印到标准输出")
+    parser.add_argument("--profile-startup", action="store_true", help="启动完成后打印各阶段耗时")
+    args = parser.parse_args()
+    profiler = StartupProfiler(args.profile_startup)
+    profiler.mark("导入模块")
+
+    if args.bench_ansi:
+        benchmark_ansi()
+    elif args.daemon:
+        run_daemon(args.host, args.port, args.autostart, args.echo, profiler)
+    elif tk is None:
+        print("❌ 当前环境没有可用的Tk，请使用 --daemon 模式运行")
+    else:
+        root = tk.Tk()
+        profiler.mark("创建Tk窗口")
+        app = MinecraftServerManager(root, profiler)
+        root.mainloop()
 